@@ -0,0 +1,28 @@
+"""add product keyset pagination index
+
+Revision ID: a1c4e7f20b31
+Revises: 7d8e9f0a1b2c
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1c4e7f20b31'
+down_revision: Union[str, None] = '7d8e9f0a1b2c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Cursor pages filter by category and walk the primary key backwards;
+    # the unfiltered listing is served by the primary key index itself.
+    op.create_index('ix_products_category_id_id', 'products', ['category_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_products_category_id_id', table_name='products')
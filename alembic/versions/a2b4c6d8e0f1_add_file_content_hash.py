@@ -0,0 +1,31 @@
+"""add content hash and ref count to file
+
+Revision ID: a2b4c6d8e0f1
+Revises: f5a7c9e1b3d6
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a2b4c6d8e0f1'
+down_revision: Union[str, None] = 'f5a7c9e1b3d6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing rows keep content_hash NULL (not deduplicated) and a single reference
+    op.add_column('files', sa.Column('content_hash', sa.String(length=80), nullable=True))
+    op.add_column('files', sa.Column('ref_count', sa.Integer(), server_default='1', nullable=False))
+    op.create_index(op.f('ix_files_content_hash'), 'files', ['content_hash'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_files_content_hash'), table_name='files')
+    op.drop_column('files', 'ref_count')
+    op.drop_column('files', 'content_hash')
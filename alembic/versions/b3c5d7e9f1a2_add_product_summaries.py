@@ -0,0 +1,53 @@
+"""add product summaries
+
+Revision ID: b3c5d7e9f1a2
+Revises: a2b4c6d8e0f1
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3c5d7e9f1a2'
+down_revision: Union[str, None] = 'a2b4c6d8e0f1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'product_summaries',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=True),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('thumbnail_id', sa.String(length=50), nullable=True),
+        sa.Column('min_price', sa.Numeric(precision=12, scale=2), nullable=True),
+        sa.Column('max_price', sa.Numeric(precision=12, scale=2), nullable=True),
+        sa.Column('total_stock', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('variant_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['id'], ['products.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['thumbnail_id'], ['files.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_product_summaries_category_id_id', 'product_summaries', ['category_id', 'id'], unique=False)
+
+    # Backfill from the existing catalog
+    op.execute("""
+        INSERT INTO product_summaries
+            (id, category_id, name, thumbnail_id, min_price, max_price, total_stock, variant_count, updated_at)
+        SELECT p.id, p.category_id, p.name, p.thumbnail_id,
+               min(v.price), max(v.price), coalesce(sum(v.stock), 0), count(v.id), now()
+        FROM products p
+        LEFT JOIN product_variants v ON v.product_id = p.id
+        GROUP BY p.id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_product_summaries_category_id_id', table_name='product_summaries')
+    op.drop_table('product_summaries')
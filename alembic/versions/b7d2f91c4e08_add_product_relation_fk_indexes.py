@@ -0,0 +1,31 @@
+"""add product relation fk indexes
+
+Revision ID: b7d2f91c4e08
+Revises: a1c4e7f20b31
+Create Date: 2026-10-18 09:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d2f91c4e08'
+down_revision: Union[str, None] = 'a1c4e7f20b31'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Batched "fk IN (...)" relationship loads need an index on each foreign key.
+    op.create_index(op.f('ix_product_media_product_id'), 'product_media', ['product_id'], unique=False)
+    op.create_index(op.f('ix_product_variants_product_id'), 'product_variants', ['product_id'], unique=False)
+    op.create_index(op.f('ix_variant_attributes_variant_id'), 'variant_attributes', ['variant_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_variant_attributes_variant_id'), table_name='variant_attributes')
+    op.drop_index(op.f('ix_product_variants_product_id'), table_name='product_variants')
+    op.drop_index(op.f('ix_product_media_product_id'), table_name='product_media')
@@ -0,0 +1,59 @@
+"""add product search index
+
+Revision ID: c3e8a5d17f42
+Revises: b7d2f91c4e08
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e8a5d17f42'
+down_revision: Union[str, None] = 'b7d2f91c4e08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+    # unaccent() is only STABLE; an IMMUTABLE wrapper with an explicit dictionary
+    # is required before it can be used in index expressions and generated columns.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT AS
+        $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$
+    """)
+
+    op.add_column('products', sa.Column(
+        'search_vector',
+        postgresql.TSVECTOR(),
+        sa.Computed(
+            "setweight(to_tsvector('simple', lower(f_unaccent(coalesce(name, '')))), 'A') || "
+            "setweight(to_tsvector('simple', lower(f_unaccent(coalesce(description, '')))), 'B')",
+            persisted=True,
+        ),
+        nullable=True,
+    ))
+    op.create_index('ix_products_search_vector', 'products', ['search_vector'], unique=False, postgresql_using='gin')
+    op.execute(
+        "CREATE INDEX ix_products_name_trgm ON products "
+        "USING gin (lower(f_unaccent(name)) gin_trgm_ops)"
+    )
+    op.execute(
+        "CREATE INDEX ix_products_name_prefix ON products "
+        "(lower(f_unaccent(name)) text_pattern_ops)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_products_name_prefix', table_name='products')
+    op.drop_index('ix_products_name_trgm', table_name='products')
+    op.drop_index('ix_products_search_vector', table_name='products')
+    op.drop_column('products', 'search_vector')
+    op.execute("DROP FUNCTION IF EXISTS f_unaccent(text)")
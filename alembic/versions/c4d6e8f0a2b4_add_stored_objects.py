@@ -0,0 +1,96 @@
+"""move file content into shared stored objects
+
+Revision ID: c4d6e8f0a2b4
+Revises: b3c5d7e9f1a2
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4d6e8f0a2b4'
+down_revision: Union[str, None] = 'b3c5d7e9f1a2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_CONTENT_COLUMNS = "content_hash, file_path, etag, preview_path, derivative_status, width, height, derivatives"
+
+
+def upgrade() -> None:
+    op.create_table('stored_objects',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('content_hash', sa.String(length=80), nullable=True),
+    sa.Column('file_path', sa.String(length=500), nullable=False),
+    sa.Column('etag', sa.String(length=100), nullable=True),
+    sa.Column('preview_path', sa.String(length=500), nullable=True),
+    sa.Column('derivative_status', sa.String(length=20), nullable=True),
+    sa.Column('width', sa.Integer(), nullable=True),
+    sa.Column('height', sa.Integer(), nullable=True),
+    sa.Column('derivatives', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column('ref_count', sa.Integer(), server_default='1', nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    # Chỉ dùng khi chuyển dữ liệu: nối mỗi dòng files với object vừa tạo
+    sa.Column('source_file_id', sa.String(length=50), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_stored_objects_id'), 'stored_objects', ['id'], unique=False)
+
+    # Mỗi dòng files hiện có thành một object với một tham chiếu. Các upload trùng
+    # trước đây nhận chung một dòng files nên không tách lại được: vẫn là một dòng.
+    op.execute(
+        f"INSERT INTO stored_objects ({_CONTENT_COLUMNS}, ref_count, created_at, source_file_id) "
+        f"SELECT {_CONTENT_COLUMNS}, 1, COALESCE(uploaded_at, now()), id FROM files"
+    )
+    op.add_column('files', sa.Column('object_id', sa.Integer(), nullable=True))
+    op.execute("UPDATE files SET object_id = s.id FROM stored_objects s WHERE s.source_file_id = files.id")
+    op.alter_column('files', 'object_id', nullable=False)
+    op.create_foreign_key('files_object_id_fkey', 'files', 'stored_objects', ['object_id'], ['id'])
+    op.create_index(op.f('ix_files_object_id'), 'files', ['object_id'], unique=False)
+    op.drop_column('stored_objects', 'source_file_id')
+
+    op.drop_index(op.f('ix_files_content_hash'), table_name='files')
+    op.drop_index(op.f('ix_files_derivative_status'), table_name='files')
+    for column in ('content_hash', 'ref_count', 'file_path', 'etag', 'preview_path',
+                   'derivative_status', 'width', 'height', 'derivatives'):
+        op.drop_column('files', column)
+    op.create_index(op.f('ix_stored_objects_content_hash'), 'stored_objects', ['content_hash'], unique=True)
+    op.create_index(op.f('ix_stored_objects_derivative_status'), 'stored_objects', ['derivative_status'], unique=False)
+
+
+def downgrade() -> None:
+    op.add_column('files', sa.Column('derivatives', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+    op.add_column('files', sa.Column('height', sa.Integer(), nullable=True))
+    op.add_column('files', sa.Column('width', sa.Integer(), nullable=True))
+    op.add_column('files', sa.Column('derivative_status', sa.String(length=20), nullable=True))
+    op.add_column('files', sa.Column('preview_path', sa.String(length=500), nullable=True))
+    op.add_column('files', sa.Column('etag', sa.String(length=100), nullable=True))
+    op.add_column('files', sa.Column('file_path', sa.String(length=500), nullable=True))
+    op.add_column('files', sa.Column('ref_count', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('files', sa.Column('content_hash', sa.String(length=80), nullable=True))
+    op.execute(
+        "UPDATE files SET file_path = s.file_path, etag = s.etag, preview_path = s.preview_path, "
+        "derivative_status = s.derivative_status, width = s.width, height = s.height, derivatives = s.derivatives "
+        "FROM stored_objects s WHERE s.id = files.object_id"
+    )
+    # content_hash là unique ở bảng files: chỉ giữ ở một dòng cho mỗi object
+    op.execute(
+        "UPDATE files SET content_hash = s.content_hash FROM stored_objects s "
+        "WHERE s.id = files.object_id AND files.id = "
+        "(SELECT MIN(f.id) FROM files f WHERE f.object_id = s.id)"
+    )
+    op.alter_column('files', 'file_path', nullable=False)
+    op.create_index(op.f('ix_files_derivative_status'), 'files', ['derivative_status'], unique=False)
+    op.create_index(op.f('ix_files_content_hash'), 'files', ['content_hash'], unique=True)
+
+    op.drop_index(op.f('ix_files_object_id'), table_name='files')
+    op.drop_constraint('files_object_id_fkey', 'files', type_='foreignkey')
+    op.drop_column('files', 'object_id')
+    op.drop_index(op.f('ix_stored_objects_derivative_status'), table_name='stored_objects')
+    op.drop_index(op.f('ix_stored_objects_content_hash'), table_name='stored_objects')
+    op.drop_index(op.f('ix_stored_objects_id'), table_name='stored_objects')
+    op.drop_table('stored_objects')
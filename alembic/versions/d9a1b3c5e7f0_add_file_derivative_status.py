@@ -0,0 +1,30 @@
+"""add derivative status to file
+
+Revision ID: d9a1b3c5e7f0
+Revises: c3e8a5d17f42
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9a1b3c5e7f0'
+down_revision: Union[str, None] = 'c3e8a5d17f42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('files', sa.Column('derivative_status', sa.String(length=20), nullable=True))
+    op.create_index(op.f('ix_files_derivative_status'), 'files', ['derivative_status'], unique=False)
+    # Existing images already have their preview generated inline
+    op.execute("UPDATE files SET derivative_status = 'ready' WHERE preview_path IS NOT NULL")
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_files_derivative_status'), table_name='files')
+    op.drop_column('files', 'derivative_status')
@@ -0,0 +1,31 @@
+"""add image derivatives to file
+
+Revision ID: e4f6a8b0c2d4
+Revises: d9a1b3c5e7f0
+Create Date: 2026-10-18 11:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4f6a8b0c2d4'
+down_revision: Union[str, None] = 'd9a1b3c5e7f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('files', sa.Column('width', sa.Integer(), nullable=True))
+    op.add_column('files', sa.Column('height', sa.Integer(), nullable=True))
+    op.add_column('files', sa.Column('derivatives', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('files', 'derivatives')
+    op.drop_column('files', 'height')
+    op.drop_column('files', 'width')
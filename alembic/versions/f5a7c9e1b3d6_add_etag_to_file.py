@@ -0,0 +1,27 @@
+"""add etag to file
+
+Revision ID: f5a7c9e1b3d6
+Revises: e4f6a8b0c2d4
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f5a7c9e1b3d6'
+down_revision: Union[str, None] = 'e4f6a8b0c2d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Rows uploaded before this column fall back to stat_object when served
+    op.add_column('files', sa.Column('etag', sa.String(length=100), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('files', 'etag')
@@ -1,50 +1,125 @@
 import os
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse
+import shutil
+import uuid
+from fastapi import APIRouter, HTTPException, BackgroundTasks, UploadFile, File, Form, Depends
+from fastapi.responses import FileResponse, StreamingResponse
+from datetime import datetime
 from app.services.backup_service import BackupService
+from app.services.restore_service import RestoreService
+from app.services.backup_jobs import BackupJobs, STATUS_COMPLETED, STATUS_FAILED
+from app.core.config import settings
+from app.core.dependencies import require_admin, is_admin
 
 router = APIRouter(prefix="/backup", tags=["Backup"])
 
-def cleanup_file(path: str):
-    if os.path.exists(path):
-        os.remove(path)
+# Các route dưới đây gọi Redis (redis-py, chặn) nên là route sync: FastAPI chạy
+# chúng trong threadpool thay vì trên event loop. Tất cả cần quyền admin, trừ
+# /download?token=... (link tải không mang được header, token chỉ cấp qua /status)
 
 @router.post("/start")
-async def start_backup(background_tasks: BackgroundTasks):
-    progress = BackupService.get_progress()
-    if progress["status"] == "running":
+def start_backup(background_tasks: BackgroundTasks, incremental: bool = False, auth = Depends(require_admin)):
+    # Lock nằm trong Redis: chỉ một backup trên toàn bộ các worker
+    job_id = BackupService.start(incremental)
+    if job_id is None:
         return {"message": "Backup is already in progress"}
-    
-    # Reset progress and start
-    background_tasks.add_task(BackupService.create_full_backup_zip)
-    return {"message": "Backup started"}
+
+    background_tasks.add_task(BackupService.run_job, job_id, incremental)
+    return {"message": "Backup started", "job_id": job_id}
 
 @router.get("/status")
-async def get_backup_status():
-    return BackupService.get_progress()
+def get_backup_status(auth = Depends(require_admin)):
+    progress = BackupService.get_progress()
+    if progress["status"] == STATUS_COMPLETED and progress.get("location"):
+        # Token ngắn hạn cho /backup/download (link tải không mang được header)
+        progress["download_token"] = BackupJobs.issue_token(progress["job_id"])
+    progress.pop("location", None)
+    return progress
+
+@router.get("/history")
+def get_backup_history(limit: int = 20, auth = Depends(require_admin)):
+    jobs = BackupService.history(limit)
+    for job in jobs:
+        job.pop("location", None)
+    return jobs
 
 @router.get("/download")
-async def download_backup(background_tasks: BackgroundTasks):
-    progress = BackupService.get_progress()
-    if progress["status"] != "completed" or not progress["last_zip"]:
-        raise HTTPException(status_code=400, detail="Backup not ready or not found")
-    
-    zip_path = progress["last_zip"]
-    if not os.path.exists(zip_path):
-        raise HTTPException(status_code=404, detail="Backup file missing")
+def download_backup(token: str = None, stream: bool = False, incremental: bool = False, admin: bool = Depends(is_admin)):
+    if stream:
+        # Tạo cả một bản dump: chỉ admin (token tải chỉ dùng cho archive đã có)
+        if not admin:
+            raise HTTPException(404, "Login please :))")
+        # Zip được tạo dần khi client đọc: không cần chờ /start, không dùng đĩa.
+        # Lock chỉ được lấy khi response bắt đầu phát (trong generator); kiểm tra
+        # ở đây để trả 409 khi còn gửi được status code
+        if BackupJobs.is_running():
+            raise HTTPException(status_code=409, detail="Backup is already in progress")
+        filename = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+        return StreamingResponse(
+            BackupService.stream_archive(incremental),
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
 
-    # Clear last_zip after starting download to prevent double usage and trigger cleanup later
-    # Actually, we should cleanup after some time or another way. 
-    # For simplicity, we'll schedule cleanup on download.
-    background_tasks.add_task(cleanup_file, zip_path)
-    
-    # IMPORTANT: We need to reset the status so next backup can start
-    # but only after download starts.
-    progress["status"] = "idle"
-    progress["last_zip"] = ""
-    
+    if not token:
+        raise HTTPException(status_code=400, detail="Download token required")
+    job = BackupJobs.resolve_token(token)
+    if not job or job["status"] != STATUS_COMPLETED or not job.get("location"):
+        raise HTTPException(status_code=404, detail="Backup not ready or not found")
+
+    path, chunks = BackupService.open_archive(job)
+    if chunks is not None:
+        return StreamingResponse(
+            chunks,
+            media_type="application/zip",
+            headers={
+                "Content-Disposition": f'attachment; filename="{job["file_name"]}"',
+                "Content-Length": str(job["size"]),
+            },
+        )
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Backup file missing")
     return FileResponse(
-        path=zip_path,
-        filename=os.path.basename(zip_path),
+        path=path,
+        filename=os.path.basename(path),
         media_type='application/zip'
     )
+
+def _save_upload(upload: UploadFile) -> str:
+    # Zip cần đọc được central directory ở cuối file nên archive upload phải nằm trên đĩa
+    temp_root = os.path.join(settings.ROOT_DIR, "tmp_backup")
+    os.makedirs(temp_root, exist_ok=True)
+    path = os.path.join(temp_root, f"restore_{uuid.uuid4().hex}.zip")
+    with open(path, "wb") as dst:
+        shutil.copyfileobj(upload.file, dst, 1024 * 1024)
+    return path
+
+@router.post("/restore")
+def restore_backup(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(None),
+    job_id: str = Form(None),
+    auth = Depends(require_admin)
+):
+    """Khôi phục từ archive upload lên hoặc từ một backup đã lưu (job_id trong /backup/history)."""
+    source = None
+    if file is None:
+        source = BackupJobs.get(job_id) if job_id else None
+        if not source or source["status"] != STATUS_COMPLETED or not source.get("location"):
+            raise HTTPException(status_code=404, detail="Backup archive not found")
+
+    # Dùng chung lock với backup: không backup và restore cùng lúc
+    restore_id = BackupService.start(mode="restore")
+    if restore_id is None:
+        raise HTTPException(status_code=409, detail="A backup or restore is already in progress")
+
+    if file is not None:
+        try:
+            archive_path = _save_upload(file)
+        except Exception:
+            BackupJobs.finish(restore_id, STATUS_FAILED, current_step="Không lưu được archive upload")
+            BackupJobs.release(restore_id)
+            raise
+        background_tasks.add_task(RestoreService.run_job, restore_id, archive_path, True)
+    else:
+        background_tasks.add_task(RestoreService.run_from_backup, restore_id, source)
+    return {"message": "Restore started", "job_id": restore_id}
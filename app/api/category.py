@@ -1,46 +1,65 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from app.services.category_service import CategoryService
+from app.services.category_service import AsyncCategoryService, CategoryService
+from app.services.common import Projection
 from app.schemas.category import Category, CategoryCreate, CategoryUpdate
-from app.core.dependencies import get_db
+from app.core.dependencies import get_async_db
+from app.core.responses import ORJSONResponse
 
 router = APIRouter(prefix="/categories", tags=["Categories"])
 
+def category_projection(
+    fields: str = Query(None, description="Field cần trả về, vd. id,name,slug (mặc định: tất cả)"),
+    expand: str = Query(None, description="Quan hệ cần nạp: thumbnail"),
+) -> Projection:
+    return CategoryService.projection(fields, expand)
+
 @router.get("/", response_model=List[Category])
-def list_categories(db: Session = Depends(get_db)):
-    return CategoryService.get_all(db)
+async def list_categories(
+    projection: Projection = Depends(category_projection),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return ORJSONResponse(await AsyncCategoryService.get_all_json(db, projection))
 
 @router.post("/", response_model=Category, status_code=status.HTTP_201_CREATED)
-def create_category(category_in: CategoryCreate, db: Session = Depends(get_db)):
+async def create_category(category_in: CategoryCreate, db: AsyncSession = Depends(get_async_db)):
     # Check if slug exists
-    if CategoryService.get_by_slug(db, category_in.slug):
+    if await AsyncCategoryService.get_by_slug(db, category_in.slug):
         raise HTTPException(status_code=400, detail="Slug already exists")
-    return CategoryService.create(db, category_in)
+    return ORJSONResponse(await AsyncCategoryService.create(db, category_in), status_code=status.HTTP_201_CREATED)
 
 @router.get("/{category_id}", response_model=Category)
-def get_category(category_id: int, db: Session = Depends(get_db)):
-    category = CategoryService.get_by_id(db, category_id)
-    if not category:
+async def get_category(
+    category_id: int,
+    projection: Projection = Depends(category_projection),
+    db: AsyncSession = Depends(get_async_db)
+):
+    payload = await AsyncCategoryService.get_by_id_json(db, category_id, projection)
+    if payload is None:
         raise HTTPException(status_code=404, detail="Category not found")
-    return category
+    return ORJSONResponse(payload)
 
 @router.get("/slug/{slug}", response_model=Category)
-def get_category_by_slug(slug: str, db: Session = Depends(get_db)):
-    category = CategoryService.get_by_slug(db, slug)
-    if not category:
+async def get_category_by_slug(
+    slug: str,
+    projection: Projection = Depends(category_projection),
+    db: AsyncSession = Depends(get_async_db)
+):
+    payload = await AsyncCategoryService.get_by_slug_json(db, slug, projection)
+    if payload is None:
         raise HTTPException(status_code=404, detail="Category not found")
-    return category
+    return ORJSONResponse(payload)
 
 @router.put("/{category_id}", response_model=Category)
-def update_category(category_id: int, category_in: CategoryUpdate, db: Session = Depends(get_db)):
-    category = CategoryService.update(db, category_id, category_in)
+async def update_category(category_id: int, category_in: CategoryUpdate, db: AsyncSession = Depends(get_async_db)):
+    category = await AsyncCategoryService.update(db, category_id, category_in)
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
-    return category
+    return ORJSONResponse(category)
 
 @router.delete("/{category_id}")
-def delete_category(category_id: int, db: Session = Depends(get_db)):
-    if not CategoryService.delete(db, category_id):
+async def delete_category(category_id: int, db: AsyncSession = Depends(get_async_db)):
+    if not await AsyncCategoryService.delete(db, category_id):
         raise HTTPException(status_code=404, detail="Category not found")
     return {"message": "Category deleted successfully"}
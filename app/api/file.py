@@ -1,7 +1,15 @@
-from fastapi import APIRouter, UploadFile, File, Form, BackgroundTasks, Depends, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, BackgroundTasks, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse, RedirectResponse
 from sqlalchemy.orm import Session
-from app.services.file_service import FileService
-from app.core.dependencies import get_db, require_admin
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from app.services.file_service import FileService, AsyncFileService
+from app.services.derivative_service import DerivativeService, MEDIA_TYPES
+from app.services.minio import get_object, stat_object, iter_object, get_presigned_url, get_public_url
+from app.core.config import settings
+from app.core.dependencies import get_db, get_async_db, require_admin
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 import os
 
 router = APIRouter(prefix="/files", tags=["Files"])
@@ -9,29 +17,38 @@ router = APIRouter(prefix="/files", tags=["Files"])
 @router.post("/upload/init", response_model=dict)
 def init_upload(
     filename: str = Form(...),
+    total_chunks: int = Form(None),
+    file_size: int = Form(None),
 ):
-    upload_id = FileService.init_upload(filename)
+    upload_id = FileService.init_upload(filename, total_chunks=total_chunks, file_size=file_size)
     return {
         "upload_id": upload_id,
         "filename": filename
     }
 
+# Các chunk có thể gửi song song và không theo thứ tự; checksum = sha256 hex của chunk
 @router.post("/upload/chunk", response_model=dict)
 async def upload_chunk(
     upload_id: str = Form(...),
     chunk_index: int = Form(...),
     total_chunks: int = Form(...),
     chunk: UploadFile = File(...),
+    checksum: str = Form(None),
 ):
-    # Log for debugging 404
-    print(f"[DEBUG] upload_chunk: upload_id={upload_id}, chunk_index={chunk_index}")
-    
-    success = await FileService.upload_chunk(upload_id, chunk_index, chunk)
+    part = await FileService.upload_chunk(upload_id, chunk_index, chunk, checksum=checksum)
     return {
         "chunk_index": chunk_index,
+        "size": part["size"],
+        "sha256": part["sha256"],
         "status": "ok"
     }
 
+# Dùng để resume: client chỉ gửi lại các chunk trong missing_chunks
+@router.get("/upload/{upload_id}/status", response_model=dict)
+def upload_status(upload_id: str):
+    return FileService.upload_status(upload_id)
+
+# Còn dùng session sync: các lời gọi MinIO là I/O chặn, chạy trong threadpool là phù hợp
 @router.post("/upload/complete", response_model=dict)
 def complete_upload(
     upload_id: str = Form(...),
@@ -45,48 +62,172 @@ def complete_upload(
         "url": file_record.file_url,
         "fileId": file_record.id,
         "fileName": file_record.file_name,
-        "fileSize": file_record.file_size
+        "fileSize": file_record.file_size,
+        "derivativeStatus": file_record.derivative_status
     }
 
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+FALLBACK_CACHE = "public, max-age=60"
+
+
+def _http_date(dt: datetime) -> str:
+    return format_datetime(dt.astimezone(timezone.utc), usegmt=True)
+
+
+def _not_modified(request: Request, etag: str, last_modified: datetime | None) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        # So sánh yếu: bỏ tiền tố W/ (RFC 9110 13.1.2)
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def _parse_range(request: Request, etag: str, size: int):
+    """
+    Trả về (start, end) cho một range hợp lệ, None nếu phục vụ toàn bộ
+    (không có Range, If-Range không khớp, hoặc nhiều range - được bỏ qua theo RFC 9110),
+    hoặc raise 416 nếu range nằm ngoài object.
+    """
+    header = request.headers.get("range")
+    if not header or not header.startswith("bytes="):
+        return None
+    if_range = request.headers.get("if-range")
+    if if_range and if_range != etag:
+        return None
+    spec = header[len("bytes="):].strip()
+    if "," in spec:
+        return None
+
+    start_s, _, end_s = spec.partition("-")
+    try:
+        if start_s:
+            start = int(start_s)
+            end = int(end_s) if end_s else size - 1
+        else:
+            # bytes=-N: N byte cuối
+            start = max(size - int(end_s), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, min(end, size - 1)
+
+
 @router.get("/{file_id}")
-def download_file(
+async def download_file(
     file_id: str,
+    request: Request,
     preview: bool = False,
-    db: Session = Depends(get_db)
+    w: int = Query(None, ge=1, le=4096),
+    fmt: str = Query(None, pattern="^(webp|avif)$"),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    file_record = FileService.get_file(db, file_id)
+    file_record = await AsyncFileService.get_file(db, file_id)
     if not file_record:
         raise HTTPException(status_code=404, detail="File not found")
-    
-    from fastapi.responses import StreamingResponse
-    from app.services.minio import get_object
 
-    try:
-        path_to_get = file_record.file_path
-        media_type = file_record.mime_type
-        
-        # If preview requested and exists, use preview path
-        if preview and file_record.preview_path:
+    path_to_get = file_record.file_path
+    media_type = file_record.mime_type
+    # Nội dung của một object không bao giờ bị ghi đè; chỉ khi phải trả bản
+    # thay thế (preview chưa sẵn sàng) thì không được cache lâu
+    cache_control = IMMUTABLE_CACHE
+
+    # ?w=320&fmt=webp: bậc dẫn xuất gần nhất, tạo và lưu lại ở lần yêu cầu đầu tiên
+    if (w or fmt) and DerivativeService.needs_derivatives(file_record.mime_type):
+        fmt = fmt or "webp"
+        if not DerivativeService.supports(fmt):
+            raise HTTPException(status_code=400, detail=f"Format {fmt} is not supported")
+        path_to_get, rung = DerivativeService.resolve(file_record, w, fmt)
+        if not path_to_get:
+            try:
+                path_to_get = await DerivativeService.create_on_demand(file_record, rung, fmt)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=str(e))
+        media_type = MEDIA_TYPES[fmt]
+
+    # If preview requested and exists, use preview path
+    elif preview:
+        if file_record.preview_path:
             path_to_get = file_record.preview_path
             media_type = "image/webp"
+        else:
+            cache_control = FALLBACK_CACHE
 
-        response = get_object(path_to_get)
-        return StreamingResponse(
-            response,
-            media_type=media_type,
-            headers={"Content-Disposition": f"inline; filename={file_record.file_name}"}
+    # Chế độ redirect: trình duyệt tải thẳng từ MinIO, API không chuyển byte nào
+    if settings.FILE_SERVING_MODE == "presigned":
+        url, ttl = get_presigned_url(path_to_get)
+        # Cho phép cache redirect ngắn hơn thời gian URL còn hiệu lực
+        max_age = max(min(ttl - settings.PRESIGNED_REFRESH_MARGIN, 3600), 0)
+        return RedirectResponse(url, status_code=302, headers={"Cache-Control": f"private, max-age={max_age}"})
+    if settings.FILE_SERVING_MODE == "public":
+        return RedirectResponse(
+            get_public_url(path_to_get), status_code=302,
+            headers={"Cache-Control": "public, max-age=86400" if cache_control == IMMUTABLE_CACHE else FALLBACK_CACHE}
         )
+
+    try:
+        if path_to_get == file_record.file_path and file_record.etag:
+            size, etag, last_modified = file_record.file_size, file_record.etag, file_record.uploaded_at
+        else:
+            stat = await run_in_threadpool(stat_object, path_to_get)
+            size, etag, last_modified = stat.size, stat.etag, stat.last_modified
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    etag = '"' + etag.strip('"') + '"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": cache_control,
+        "Content-Disposition": f"inline; filename={file_record.file_name}",
+    }
+    if last_modified:
+        headers["Last-Modified"] = _http_date(last_modified)
+
+    if _not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = _parse_range(request, etag, size)
+    try:
+        if byte_range:
+            start, end = byte_range
+            response = await run_in_threadpool(get_object, path_to_get, start, end - start + 1)
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            headers["Content-Length"] = str(end - start + 1)
+            status_code = 206
+        else:
+            response = await run_in_threadpool(get_object, path_to_get)
+            headers["Content-Length"] = str(size)
+            status_code = 200
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return StreamingResponse(
+        iter_object(response),
+        status_code=status_code,
+        media_type=media_type,
+        headers=headers
+    )
+
 @router.delete("/{file_id}", response_model=dict)
-def delete_file(
+async def delete_file(
     file_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token: dict = Depends(require_admin) # As per spec
 ):
 
-    success = FileService.delete_file(db, file_id)
+    success = await AsyncFileService.delete_file(db, file_id)
     if not success:
          raise HTTPException(status_code=404, detail="File not found")
          
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends
+from app.core.dependencies import require_admin
+from app.services.cache_service import CacheService
+from app.db import instrumentation
+from app.services.minio import storage_timings
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"])
+
+@router.get("/cache")
+def cache_metrics(auth = Depends(require_admin)):
+    return CacheService.stats()
+
+@router.get("/queries")
+def query_metrics(top: int = 50, auth = Depends(require_admin)):
+    return instrumentation.snapshot(top=top)
+
+@router.post("/queries/reset")
+def reset_query_metrics(auth = Depends(require_admin)):
+    instrumentation.reset()
+    return {"message": "Query metrics reset"}
+
+@router.get("/storage")
+def storage_metrics(auth = Depends(require_admin)):
+    return {"operations": storage_timings.snapshot()}
@@ -1,51 +1,145 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from typing import List
-from app.services.product_service import ProductService
-from app.schemas.product import Product, ProductCreate, ProductUpdate
-from app.core.dependencies import get_db
+import os
+import shutil
+import uuid
+from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File, BackgroundTasks
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Union
+from app.services.product_service import AsyncProductService, ProductService
+from app.services.common import Projection
+from app.services.search_service import AsyncSearchService
+from app.schemas.product import Product, ProductCreate, ProductUpdate, ProductPage, ProductSuggestion, ProductSummaryPage
+from app.services.product_summary_service import AsyncProductSummaryService
+from app.services.import_service import ProductImportService
+from app.core.config import settings
+from app.core.dependencies import get_async_db
+from app.core.responses import ORJSONResponse
 
 router = APIRouter(prefix="/products", tags=["Products"])
 
-@router.get("/", response_model=List[Product])
-def list_products(
+def product_projection(
+    fields: str = Query(None, description="Field cần trả về, vd. id,name (mặc định: tất cả)"),
+    expand: str = Query(None, description="Quan hệ cần nạp: category,thumbnail,media,variants"),
+) -> Projection:
+    return ProductService.projection(fields, expand)
+
+# paging=cursor (hoặc truyền cursor) trả về ProductPage thay vì danh sách offset
+@router.get("/", response_model=Union[List[Product], ProductPage])
+async def list_products(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
     q: str = Query(None),
     category_id: int = Query(None),
-    db: Session = Depends(get_db)
+    paging: str = Query("offset", pattern="^(offset|cursor)$"),
+    cursor: str = Query(None),
+    projection: Projection = Depends(product_projection),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    return ProductService.get_all(db, skip=skip, limit=limit, name=q, category_id=category_id)
+    payload = await AsyncProductService.get_all_json(
+        db, skip=skip, limit=limit, name=q, category_id=category_id,
+        cursor=cursor, cursor_mode=paging == "cursor" or bool(cursor), projection=projection
+    )
+    return ORJSONResponse(payload)
 
-@router.get("/category/{slug}", response_model=List[Product])
-def get_products_by_category_slug(
+@router.get("/category/{slug}", response_model=Union[List[Product], ProductPage])
+async def get_products_by_category_slug(
     slug: str,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
-    db: Session = Depends(get_db)
+    paging: str = Query("offset", pattern="^(offset|cursor)$"),
+    cursor: str = Query(None),
+    projection: Projection = Depends(product_projection),
+    db: AsyncSession = Depends(get_async_db)
+):
+    payload = await AsyncProductService.get_by_category_slug_json(
+        db, slug, skip=skip, limit=limit, cursor=cursor, cursor_mode=paging == "cursor" or bool(cursor),
+        projection=projection
+    )
+    return ORJSONResponse(payload)
+
+@router.get("/search", response_model=List[Product])
+async def search_products(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(20, ge=1, le=100),
+    category_id: int = Query(None),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    return ProductService.get_by_category_slug(db, slug, skip=skip, limit=limit)
+    return ORJSONResponse(await AsyncSearchService.search_json(db, q, limit=limit, category_id=category_id))
+
+@router.get("/autocomplete", response_model=List[ProductSuggestion])
+async def autocomplete_products(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=20),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await AsyncSearchService.autocomplete(db, q, limit=limit)
 
 @router.post("/", response_model=Product, status_code=status.HTTP_201_CREATED)
-def create_product(product_in: ProductCreate, db: Session = Depends(get_db)):
-    return ProductService.create(db, product_in)
+async def create_product(product_in: ProductCreate, db: AsyncSession = Depends(get_async_db)):
+    return ORJSONResponse(await AsyncProductService.create(db, product_in), status_code=status.HTTP_201_CREATED)
+
+# Lưới sản phẩm: đọc từ bảng product_summaries, không nạp media/variant/attribute
+@router.get("/summary", response_model=ProductSummaryPage)
+async def list_product_summaries(
+    limit: int = Query(100, ge=1, le=100),
+    cursor: str = None,
+    category_id: int = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    return ORJSONResponse(
+        await AsyncProductSummaryService.get_page(db, limit=limit, cursor=cursor, category_id=category_id)
+    )
+
+IMPORT_KINDS = {".csv": "csv", ".xlsx": "xlsx"}
+
+def _save_import_file(upload: UploadFile, job_id: str, ext: str) -> str:
+    # UploadFile bị đóng trước khi background task chạy: chép ra file riêng
+    temp_root = os.path.join(settings.ROOT_DIR, "tmp_import")
+    os.makedirs(temp_root, exist_ok=True)
+    path = os.path.join(temp_root, f"{job_id}{ext}")
+    with open(path, "wb") as dst:
+        shutil.copyfileobj(upload.file, dst, 1024 * 1024)
+    return path
+
+# Import CSV/XLSX: mỗi dòng một variant, xem cột trong app/services/import_service.py
+@router.post("/import", status_code=status.HTTP_202_ACCEPTED)
+async def import_products(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+    ext = os.path.splitext(file.filename or "")[1].lower()
+    if ext not in IMPORT_KINDS:
+        raise HTTPException(status_code=400, detail="Only .csv and .xlsx files are supported")
+    job_id = uuid.uuid4().hex
+    path = await run_in_threadpool(_save_import_file, file, job_id, ext)
+    await run_in_threadpool(ProductImportService.create_job, job_id, file.filename)
+    background_tasks.add_task(ProductImportService.run_job, job_id, path, IMPORT_KINDS[ext])
+    return {"job_id": job_id}
+
+@router.get("/import/{job_id}")
+def get_import_status(job_id: str):
+    job = ProductImportService.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
 
 @router.get("/{product_id}", response_model=Product)
-def get_product(product_id: int, db: Session = Depends(get_db)):
-    product = ProductService.get_by_id(db, product_id)
-    if not product:
+async def get_product(
+    product_id: int,
+    projection: Projection = Depends(product_projection),
+    db: AsyncSession = Depends(get_async_db)
+):
+    payload = await AsyncProductService.get_by_id_json(db, product_id, projection)
+    if payload is None:
         raise HTTPException(status_code=404, detail="Product not found")
-    return product
+    return ORJSONResponse(payload)
 
 @router.put("/{product_id}", response_model=Product)
-def update_product(product_id: int, product_in: ProductUpdate, db: Session = Depends(get_db)):
-    product = ProductService.update(db, product_id, product_in)
+async def update_product(product_id: int, product_in: ProductUpdate, db: AsyncSession = Depends(get_async_db)):
+    product = await AsyncProductService.update(db, product_id, product_in)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    return product
+    return ORJSONResponse(product)
 
 @router.delete("/{product_id}")
-def delete_product(product_id: int, db: Session = Depends(get_db)):
-    if not ProductService.delete(db, product_id):
+async def delete_product(product_id: int, db: AsyncSession = Depends(get_async_db)):
+    if not await AsyncProductService.delete(db, product_id):
         raise HTTPException(status_code=404, detail="Product not found")
     return {"message": "Product deleted successfully"}
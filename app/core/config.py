@@ -3,6 +3,17 @@ from pathlib import Path
 import os
 class Settings(BaseSettings):
     DATABASE_URL: str
+    ASYNC_DATABASE_URL: str | None = None
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    SQL_ECHO: bool = False
+    SLOW_QUERY_MS: int = 200
+    SLOW_QUERY_LOG_INTERVAL: int = 60
+    N_PLUS_ONE_THRESHOLD: int = 5
+    SQL_METRICS_MAX_STATEMENTS: int = 500
     ADMIN_USER: str
     ADMIN_PASSWORD: str
     SECRET: str
@@ -14,6 +25,34 @@ class Settings(BaseSettings):
     MINIO_SECRET_KEY: str
     MINIO_SECURE: bool
     MINIO_PRESIGNED_EXPIRE: int
+    MINIO_PUBLIC_ENDPOINT: str | None = None
+    MINIO_PUBLIC_SECURE: bool | None = None
+    MINIO_REGION: str = "us-east-1"
+    MINIO_POOL_SIZE: int = 32
+    MINIO_CONNECT_TIMEOUT: float = 5
+    MINIO_READ_TIMEOUT: float = 60
+    MINIO_MAX_RETRIES: int = 3
+    FILE_SERVING_MODE: str = "proxy"  # proxy | presigned | public
+    PRESIGNED_REFRESH_MARGIN: int = 600
+    UPLOAD_SESSION_TTL: int = 24 * 3600
+    DERIVATIVE_WORKERS: int = 0  # 0 = os.cpu_count()
+    IMAGE_WIDTHS: str = "160,320,640,1280"
+    IMAGE_EAGER_FORMATS: str = "webp"  # avif được tạo theo yêu cầu (?fmt=avif)
+    CACHE_ENABLED: bool = True
+    CACHE_TTL_SECONDS: int = 300
+    CATEGORY_SNAPSHOT_TTL: int = 300  # nạp lại snapshot danh mục định kỳ, phòng khi lỡ sự kiện pub/sub
+    IMPORT_BATCH_SIZE: int = 500  # số sản phẩm mỗi transaction khi import CSV/XLSX
+    BACKUP_WORKERS: int = 8
+    BACKUP_PREFETCH_MAX_BYTES: int = 8 * 1024 * 1024  # object lớn hơn được stream thẳng, không giữ trong RAM
+    BACKUP_DB_FORMAT: str = "directory"  # plain | custom | directory (pg_dump -Fd -j)
+    BACKUP_DB_JOBS: int = 4
+    BACKUP_DB_COMPRESSION: str = "zstd"  # zstd (pg_dump >= 16, nếu không thì gzip) | gzip | none
+    BACKUP_DB_COMPRESSION_LEVEL: int = 3
+    BACKUP_STORAGE: str = "local"  # local | minio (bucket "backups")
+    BACKUP_PART_SIZE: int = 16 * 1024 * 1024
+    BACKUP_RETENTION: int = 3
+    BACKUP_LOCK_TTL: int = 120
+    BACKUP_TOKEN_TTL: int = 3600
     model_config = {
         "env_file": os.getenv("ENV_FILE", ".env"),  
         "env_file_encoding": "utf-8",
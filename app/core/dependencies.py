@@ -1,5 +1,5 @@
 from app.core.config import settings
-from app.db.session import SessionLocal
+from app.db.session import SessionLocal, AsyncSessionLocal
 from fastapi import Cookie, HTTPException, status
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
@@ -11,6 +11,12 @@ def require_admin(token: HTTPAuthorizationCredentials = Depends(oauth2_scheme)):
         raise HTTPException(404, "Login please :))")
 
     return "OK"
+
+optional_bearer = HTTPBearer(auto_error=False)
+
+def is_admin(token: HTTPAuthorizationCredentials = Depends(optional_bearer)) -> bool:
+    """Như require_admin nhưng không bắt buộc header: route tự quyết nhánh nào cần quyền admin."""
+    return token is not None and token.credentials == SECRET
   
 def get_db():
     db = SessionLocal()
@@ -18,3 +24,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,90 @@
+import bisect
+import threading
+
+DEFAULT_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Histogram:
+    """
+    Histogram thời gian (ms) theo bucket cố định, thread-safe, dữ liệu trong process.
+    Percentile được ước lượng bằng cận trên của bucket.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS_MS):
+        self._lock = threading.Lock()
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)  # bucket cuối là +Inf
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, value_ms: float):
+        idx = bisect.bisect_left(self.buckets, value_ms)
+        with self._lock:
+            self.bucket_counts[idx] += 1
+            self.count += 1
+            self.total_ms += value_ms
+            if value_ms > self.max_ms:
+                self.max_ms = value_ms
+
+    def _percentile(self, q: float) -> float:
+        target = q * self.count
+        seen = 0
+        for idx, n in enumerate(self.bucket_counts):
+            seen += n
+            if seen >= target:
+                return self.buckets[idx] if idx < len(self.buckets) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            if not self.count:
+                return {"count": 0}
+            return {
+                "count": self.count,
+                "total_ms": round(self.total_ms, 3),
+                "avg_ms": round(self.total_ms / self.count, 3),
+                "max_ms": round(self.max_ms, 3),
+                "p50_ms": self._percentile(0.50),
+                "p95_ms": self._percentile(0.95),
+                "p99_ms": self._percentile(0.99),
+                "buckets": {
+                    **{f"le_{b}": n for b, n in zip(self.buckets, self.bucket_counts)},
+                    "le_inf": self.bucket_counts[-1],
+                },
+            }
+
+
+class HistogramRegistry:
+    """Tập histogram theo tên, giới hạn số tên để không phình bộ nhớ."""
+
+    def __init__(self, max_series: int = 500, buckets=DEFAULT_BUCKETS_MS):
+        self._lock = threading.Lock()
+        self._series: dict[str, Histogram] = {}
+        self.max_series = max_series
+        self.buckets = buckets
+        self.dropped = 0
+
+    def observe(self, name: str, value_ms: float):
+        hist = self._series.get(name)
+        if hist is None:
+            with self._lock:
+                hist = self._series.get(name)
+                if hist is None:
+                    if len(self._series) >= self.max_series:
+                        self.dropped += 1
+                        return
+                    hist = self._series[name] = Histogram(self.buckets)
+        hist.observe(value_ms)
+
+    def snapshot(self, top: int = None) -> list[dict]:
+        with self._lock:
+            items = list(self._series.items())
+        rows = [{"name": name, **hist.snapshot()} for name, hist in items]
+        rows.sort(key=lambda r: r.get("total_ms", 0), reverse=True)
+        return rows[:top] if top else rows
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+            self.dropped = 0
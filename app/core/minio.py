@@ -1,11 +1,40 @@
+import os
+import certifi
+import urllib3
 from minio import Minio
 from .config import settings
 from datetime import timedelta
 
+# Pool kết nối dùng chung cho mọi request tới MinIO (mặc định của thư viện chỉ 10
+# kết nối, timeout 5 phút)
+http_client = urllib3.PoolManager(
+    maxsize=settings.MINIO_POOL_SIZE,
+    timeout=urllib3.Timeout(connect=settings.MINIO_CONNECT_TIMEOUT, read=settings.MINIO_READ_TIMEOUT),
+    retries=urllib3.Retry(
+        total=settings.MINIO_MAX_RETRIES,
+        backoff_factor=0.2,
+        status_forcelist=[500, 502, 503, 504],
+    ),
+    cert_reqs="CERT_REQUIRED",
+    ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+)
+
+# Có region nên client không cần gọi GetBucketLocation trước request đầu tiên
 client = Minio(
     settings.MINIO_ENDPOINT,
     access_key=settings.MINIO_ACCESS_KEY,
     secret_key=settings.MINIO_SECRET_KEY,
-    secure=settings.MINIO_SECURE
+    secure=settings.MINIO_SECURE,
+    region=settings.MINIO_REGION,
+    http_client=http_client
 )
 
+# Client chỉ dùng để ký presigned URL theo domain mà trình duyệt truy cập được.
+# Có region nên presigned_get_object không cần gọi mạng để dò region.
+public_client = Minio(
+    settings.MINIO_PUBLIC_ENDPOINT or settings.MINIO_ENDPOINT,
+    access_key=settings.MINIO_ACCESS_KEY,
+    secret_key=settings.MINIO_SECRET_KEY,
+    secure=settings.MINIO_SECURE if settings.MINIO_PUBLIC_SECURE is None else settings.MINIO_PUBLIC_SECURE,
+    region=settings.MINIO_REGION
+)
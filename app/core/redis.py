@@ -1,4 +1,7 @@
 import redis
+from sqlalchemy.util import await_only
+from sqlalchemy.util.concurrency import in_greenlet
+from starlette.concurrency import run_in_threadpool
 from app.core.config import settings
 
 HOST = settings.REDIS_NAME
@@ -8,3 +11,15 @@ redis_client = redis.Redis(
     db=0,
     decode_responses=False  
 )
+
+
+def run_blocking(fn, *args, **kwargs):
+    """
+    Gọi một hàm chặn (lệnh redis-py) từ code sync. Code sync chạy qua
+    AsyncSession.run_sync nằm trong greenlet trên chính event loop: khi đó lệnh
+    được đẩy sang threadpool (await_only) để không chặn loop. Ngoài greenlet
+    (route sync, background task) thì gọi thẳng.
+    """
+    if in_greenlet():
+        return await_only(run_in_threadpool(fn, *args, **kwargs))
+    return fn(*args, **kwargs)
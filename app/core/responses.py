@@ -0,0 +1,21 @@
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    Response JSON mặc định của app.
+      - bytes: payload đã encode sẵn (lấy từ cache hoặc dump_json) được gửi nguyên
+      - model pydantic: serialize một lần bằng pydantic-core, không validate lại
+        qua response_model
+      - còn lại (dict/list của các route backup, import, file...): orjson thay
+        cho json.dumps
+    """
+
+    def render(self, content) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        if isinstance(content, BaseModel):
+            return content.__pydantic_serializer__.to_json(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
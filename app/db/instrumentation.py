@@ -0,0 +1,150 @@
+import logging
+import os
+import re
+import threading
+import time
+import traceback
+from collections import Counter
+from contextvars import ContextVar
+from sqlalchemy import event
+from app.core.config import settings
+from app.core.metrics import HistogramRegistry
+
+logger = logging.getLogger("app.sql")
+
+_PARAM_RE = re.compile(r"(?:%\(\w+\)s|\$\d+|%s|\?)(?:::\w+(?:\[\])?)?")
+_NUMBER_RE = re.compile(r"\b\d+(\.\d+)?\b")
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+_APP_DIR = os.path.join(settings.ROOT_DIR, "app")
+_THIS_FILE = os.path.abspath(__file__)
+
+statement_timings = HistogramRegistry(max_series=settings.SQL_METRICS_MAX_STATEMENTS)
+_lock = threading.Lock()
+_slow_last_logged: dict[str, float] = {}
+slow_query_count = 0
+n_plus_one_patterns: Counter = Counter()
+
+# Đếm statement theo request; dict dùng chung (mutable) để threadpool/greenlet
+# con vẫn ghi được vào cùng một bộ đếm
+_request_statements: ContextVar[Counter | None] = ContextVar("request_statements", default=None)
+
+
+def normalize_sql(statement: str) -> str:
+    """
+    Gom các câu SQL cùng dạng: bỏ literal/param, gộp danh sách IN (...) và khoảng trắng.
+    """
+    sql = _STRING_RE.sub("?", statement)
+    sql = _PARAM_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _IN_LIST_RE.sub("(?...)", sql)
+    return _SPACE_RE.sub(" ", sql).strip()
+
+
+def _stack_origin() -> str:
+    """Frame gần nhất trong code của app (không tính module này) đã phát ra câu query."""
+    for frame in reversed(traceback.extract_stack()):
+        filename = os.path.abspath(frame.filename)
+        if filename.startswith(_APP_DIR) and filename != _THIS_FILE:
+            return f"{os.path.relpath(filename, settings.ROOT_DIR)}:{frame.lineno} in {frame.name}"
+    return "unknown"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    global slow_query_count
+    elapsed_ms = (time.perf_counter() - conn.info["query_start_time"].pop()) * 1000
+    normalized = normalize_sql(statement)
+    statement_timings.observe(normalized, elapsed_ms)
+
+    counter = _request_statements.get()
+    if counter is not None:
+        counter[normalized] += 1
+
+    if elapsed_ms >= settings.SLOW_QUERY_MS:
+        now = time.monotonic()
+        with _lock:
+            slow_query_count += 1
+            # Sampling: mỗi dạng câu chậm chỉ log tối đa 1 lần mỗi SLOW_QUERY_LOG_INTERVAL giây
+            last = _slow_last_logged.get(normalized)
+            if last is not None and now - last < settings.SLOW_QUERY_LOG_INTERVAL:
+                return
+            _slow_last_logged[normalized] = now
+        logger.warning(
+            "slow query %.1fms at %s: %s", elapsed_ms, _stack_origin(), normalized[:2000]
+        )
+
+
+def instrument_engine(engine):
+    """Gắn event timing vào một Engine sync (với AsyncEngine dùng .sync_engine)."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def start_request():
+    return _request_statements.set(Counter())
+
+
+def finish_request(token, path: str):
+    """Ghi nhận N+1: cùng một dạng câu chạy >= N_PLUS_ONE_THRESHOLD lần trong một request."""
+    counter = _request_statements.get()
+    _request_statements.reset(token)
+    if not counter:
+        return
+    for normalized, n in counter.items():
+        if n >= settings.N_PLUS_ONE_THRESHOLD:
+            with _lock:
+                n_plus_one_patterns[(path, normalized)] += 1
+            logger.warning("possible N+1 on %s: %d x %s", path, n, normalized[:500])
+
+
+class RequestQueryMiddleware:
+    """
+    Middleware ASGI thuần: mở bộ đếm statement cho mỗi request HTTP và ghi
+    nhận N+1 khi request xong. Không như @app.middleware("http")
+    (BaseHTTPMiddleware), nó không bọc lại request/response nên không thêm
+    chi phí cho các response stream (tải file, backup).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = start_request()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            finish_request(token, scope["path"])
+
+
+def snapshot(top: int = 50) -> dict:
+    with _lock:
+        patterns = [
+            {"path": path, "statement": sql, "requests": n}
+            for (path, sql), n in n_plus_one_patterns.most_common(top)
+        ]
+        slow = slow_query_count
+    return {
+        "slow_query_ms": settings.SLOW_QUERY_MS,
+        "slow_queries": slow,
+        "statements": statement_timings.snapshot(top=top),
+        "dropped_statements": statement_timings.dropped,
+        "n_plus_one": patterns,
+    }
+
+
+def reset():
+    global slow_query_count
+    statement_timings.reset()
+    with _lock:
+        slow_query_count = 0
+        _slow_last_logged.clear()
+        n_plus_one_patterns.clear()
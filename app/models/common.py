@@ -5,6 +5,6 @@ from app.db.base_model import BaseModel
 from enum import Enum
 from app.enums.general import *
 from datetime import datetime
-from sqlalchemy import Column, String, Boolean, DateTime, Text, BigInteger
+from sqlalchemy import Column, String, Boolean, DateTime, Text, BigInteger, Integer
 from sqlalchemy.sql import func
 from app.db.base import Base
\ No newline at end of file
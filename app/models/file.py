@@ -3,16 +3,62 @@ import uuid
 def generate_uuid():
     return str(uuid.uuid4())
 
+class StoredObject(Base):
+    """
+    Một object trên MinIO cùng các ảnh dẫn xuất của nó. Nhiều upload cùng nội dung
+    (cùng content_hash) dùng chung một bản ghi, mỗi upload vẫn có dòng files riêng.
+    """
+    __tablename__ = "stored_objects"
+
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String(80), nullable=True, unique=True, index=True) # digest nội dung, NULL với file upload trước khi có digest
+    file_path = Column(String(500), nullable=False) # object gốc, giữ nguyên key lúc mở multipart upload
+    etag = Column(String(100), nullable=True) # ETag của object gốc trên MinIO
+    preview_path = Column(String(500), nullable=True) # WebP preview path
+    derivative_status = Column(String(20), nullable=True, index=True) # pending / ready / failed, NULL nếu không cần preview
+    width = Column(Integer, nullable=True) # kích thước ảnh gốc (sau khi xoay EXIF)
+    height = Column(Integer, nullable=True)
+    derivatives = Column(JSONB, nullable=True) # {"webp:320": "previews/<id>/w320.webp", ...}
+    ref_count = Column(Integer, nullable=False, default=1, server_default="1") # số dòng files trỏ tới object này
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+def _stored(name: str) -> property:
+    # Thuộc tính của nội dung đọc qua object dùng chung (None nếu quan hệ không được nạp)
+    return property(lambda self: getattr(self.stored, name) if self.stored is not None else None)
+
+
 class File(Base):
     __tablename__ = "files"
 
     id = Column(String(50), primary_key=True, default=generate_uuid)
     file_name = Column(String(255), nullable=False)
-    file_path = Column(String(500), nullable=False)
-    preview_path = Column(String(500), nullable=True) # WebP preview path
+    object_id = Column(Integer, ForeignKey("stored_objects.id"), nullable=False, index=True)
     file_url = Column(String(500), nullable=False)
     file_size = Column(BigInteger, nullable=False)
     mime_type = Column(String(100), nullable=False)
     file_type = Column(String(50), default='article', index=True)
     uploaded_by = Column(String(50), nullable=True)
-    uploaded_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
\ No newline at end of file
+    uploaded_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+    # Nạp cùng câu query của file (JOIN nhiều-một), kể cả qua session async
+    stored = relationship(StoredObject, lazy="joined", innerjoin=True)
+
+    file_path = _stored("file_path")
+    preview_path = _stored("preview_path")
+    derivative_status = _stored("derivative_status")
+    width = _stored("width")
+    height = _stored("height")
+    derivatives = _stored("derivatives")
+    etag = _stored("etag")
+
+    @property
+    def widths(self) -> list[int]:
+        """Các chiều rộng WebP đã có, dùng cho srcset."""
+        return sorted(int(k.split(":")[1]) for k in (self.derivatives or {}) if k.startswith("webp:"))
+
+    @property
+    def direct_url(self) -> str | None:
+        """URL tải thẳng từ MinIO (presigned/public) nếu bật FILE_SERVING_MODE tương ứng."""
+        from app.services.minio import get_direct_url
+        return get_direct_url(self.file_path) if self.file_path else None
@@ -1,10 +1,15 @@
 from sqlalchemy import (
+    DateTime,
     String,
     Text,
+    Index,
     Numeric,
     Integer,
     ForeignKey,
+    Computed,
+    func,
 )
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import (
     Mapped,
     mapped_column,
@@ -43,6 +48,10 @@ class Category(Base):
 # =========================
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        # Keyset pagination: WHERE category_id = ? AND id < ? ORDER BY id DESC
+        Index("ix_products_category_id_id", "category_id", "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
 
@@ -54,6 +63,17 @@ class Product(Base):
     name: Mapped[str] = mapped_column(String(255), nullable=False)
     description: Mapped[str | None] = mapped_column(Text)
 
+    # Full-text vector không dấu (tên trọng số A, mô tả trọng số B), do Postgres tự tính
+    search_vector = mapped_column(
+        TSVECTOR,
+        Computed(
+            "setweight(to_tsvector('simple', lower(f_unaccent(coalesce(name, '')))), 'A') || "
+            "setweight(to_tsvector('simple', lower(f_unaccent(coalesce(description, '')))), 'B')",
+            persisted=True,
+        ),
+        deferred=True,
+    )
+
     category: Mapped["Category"] = relationship(
         back_populates="products"
     )
@@ -86,7 +106,8 @@ class ProductMedia(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     product_id: Mapped[int] = mapped_column(
         ForeignKey("products.id", ondelete="CASCADE"),
-        nullable=False
+        nullable=False,
+        index=True
     )
     file_id: Mapped[str] = mapped_column(
         ForeignKey("files.id", ondelete="CASCADE"),
@@ -110,7 +131,8 @@ class ProductVariant(Base):
 
     product_id: Mapped[int] = mapped_column(
         ForeignKey("products.id", ondelete="CASCADE"),
-        nullable=False
+        nullable=False,
+        index=True
     )
 
     price: Mapped[float] = mapped_column(
@@ -150,7 +172,8 @@ class VariantAttribute(Base):
 
     variant_id: Mapped[int] = mapped_column(
         ForeignKey("product_variants.id", ondelete="CASCADE"),
-        nullable=False
+        nullable=False,
+        index=True
     )
 
     name: Mapped[str] = mapped_column(
@@ -171,3 +194,37 @@ class VariantAttribute(Base):
     variant: Mapped["ProductVariant"] = relationship(
         back_populates="attributes"
     )
+
+
+# =========================
+# Product Summary
+# (read model cho lưới sản phẩm, cập nhật khi ghi sản phẩm)
+# =========================
+class ProductSummary(Base):
+    __tablename__ = "product_summaries"
+    __table_args__ = (
+        Index("ix_product_summaries_category_id_id", "category_id", "id"),
+    )
+
+    id: Mapped[int] = mapped_column(
+        ForeignKey("products.id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    category_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    name: Mapped[str] = mapped_column(String(255), nullable=False)
+
+    thumbnail_id: Mapped[str | None] = mapped_column(
+        ForeignKey("files.id", ondelete="SET NULL"),
+        nullable=True
+    )
+    thumbnail: Mapped["File"] = relationship()
+
+    min_price: Mapped[float | None] = mapped_column(Numeric(12, 2))
+    max_price: Mapped[float | None] = mapped_column(Numeric(12, 2))
+    total_stock: Mapped[int] = mapped_column(Integer, default=0)
+    variant_count: Mapped[int] = mapped_column(Integer, default=0)
+    updated_at = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    @property
+    def thumbnail_url(self) -> str | None:
+        return self.thumbnail.file_url if self.thumbnail else None
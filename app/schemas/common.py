@@ -1,9 +1,15 @@
 from pydantic import BaseModel, ConfigDict
+from typing import Optional, List
 
 class FileInfo(BaseModel):
     id: str
     file_name: str
     file_url: str
     mime_type: str
+    derivative_status: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    widths: List[int] = []
+    direct_url: Optional[str] = None
 
     model_config = ConfigDict(from_attributes=True)
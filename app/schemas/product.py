@@ -37,6 +37,7 @@ class ProductVariantBase(BaseModel):
     stock: int
 
 class ProductVariantCreate(ProductVariantBase):
+    id: Optional[int] = None # khi update: id của variant hiện có (giữ nguyên id), bỏ trống = variant mới
     attributes: List[VariantAttributeCreate] = []
     image_id: Optional[str] = None
 
@@ -77,3 +78,35 @@ class Product(ProductBase):
     variants: List[ProductVariant] = []
     
     model_config = ConfigDict(from_attributes=True)
+
+
+class ProductPage(BaseModel):
+    items: List[Product] = []
+    next_cursor: Optional[str] = None
+    has_more: bool = False
+
+
+class ProductSuggestion(BaseModel):
+    id: int
+    name: str
+    model_config = ConfigDict(from_attributes=True)
+
+
+# Dòng gọn cho lưới sản phẩm (không kèm media/variant/attribute)
+class ProductSummary(BaseModel):
+    id: int
+    name: str
+    category_id: Optional[int] = None
+    thumbnail_id: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    total_stock: int = 0
+    variant_count: int = 0
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ProductSummaryPage(BaseModel):
+    items: List[ProductSummary] = []
+    next_cursor: Optional[str] = None
+    has_more: bool = False
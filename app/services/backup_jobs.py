@@ -0,0 +1,181 @@
+import json
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from app.core.config import settings
+from app.core.redis import redis_client
+
+LOCK_KEY = "backup:lock"
+CURRENT_KEY = "backup:current"
+HISTORY_KEY = "backup:jobs"
+JOB_KEY = "backup:job:{job_id}"
+TOKEN_KEY = "backup:token:{token}"
+MANIFEST_KEY = "backup:manifest"
+
+HISTORY_MAX = 50
+JOB_TTL = 30 * 24 * 3600
+
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+
+# Chỉ gia hạn / nhả lock nếu nó vẫn thuộc job này (lock có thể đã hết hạn và bị job khác lấy)
+_REFRESH_SCRIPT = redis_client.register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+""")
+
+_RELEASE_SCRIPT = redis_client.register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+""")
+
+_INT_FIELDS = ("percentage", "size", "objects")
+_FLOAT_FIELDS = ("started_at", "finished_at", "duration")
+
+
+def _decode(raw: dict) -> dict:
+    job = {k.decode(): v.decode() for k, v in raw.items()}
+    for field in _INT_FIELDS:
+        if field in job:
+            job[field] = int(job[field])
+    for field in _FLOAT_FIELDS:
+        if field in job:
+            job[field] = float(job[field])
+    return job
+
+
+class BackupJobs:
+    """
+    Trạng thái job backup dùng chung cho mọi worker uvicorn, lưu trong Redis:
+    lock phân tán (chỉ một backup chạy tại một thời điểm), tiến độ, lịch sử
+    (kích thước, thời gian chạy) và token tải xuống có hạn.
+    Lock có TTL và được gia hạn trong lúc chạy: worker chết thì lock tự nhả.
+    """
+
+    @staticmethod
+    def acquire(job_id: str) -> bool:
+        return bool(redis_client.set(LOCK_KEY, job_id, nx=True, ex=settings.BACKUP_LOCK_TTL))
+
+    @staticmethod
+    def refresh(job_id: str) -> bool:
+        return bool(_REFRESH_SCRIPT(keys=[LOCK_KEY], args=[job_id, settings.BACKUP_LOCK_TTL]))
+
+    @staticmethod
+    def release(job_id: str):
+        _RELEASE_SCRIPT(keys=[LOCK_KEY], args=[job_id])
+
+    @staticmethod
+    @contextmanager
+    def hold(job_id: str):
+        """Gia hạn lock bằng một thread nền trong lúc chạy các bước chặn lâu (pg_restore...)."""
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(max(1, settings.BACKUP_LOCK_TTL // 4)):
+                BackupJobs.refresh(job_id)
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    @staticmethod
+    def create(job_id: str, mode: str):
+        key = JOB_KEY.format(job_id=job_id)
+        pipe = redis_client.pipeline()
+        pipe.hset(key, mapping={
+            "job_id": job_id,
+            "mode": mode,
+            "status": STATUS_RUNNING,
+            "percentage": 0,
+            "current_step": "Khởi tạo...",
+            "started_at": time.time(),
+        })
+        pipe.expire(key, JOB_TTL)
+        pipe.set(CURRENT_KEY, job_id)
+        pipe.lpush(HISTORY_KEY, job_id)
+        pipe.ltrim(HISTORY_KEY, 0, HISTORY_MAX - 1)
+        pipe.execute()
+
+    @staticmethod
+    def update(job_id: str, **fields):
+        redis_client.hset(JOB_KEY.format(job_id=job_id), mapping={k: v for k, v in fields.items() if v is not None})
+
+    @staticmethod
+    def progress_reporter(job_id: str):
+        """Hàm report(pct, step) ghi tiến độ vào Redis, tối đa ~2 lần/giây."""
+        last = 0.0
+
+        def report(pct: int, step: str):
+            nonlocal last
+            now = time.monotonic()
+            if now - last >= 0.5:
+                BackupJobs.update(job_id, percentage=pct, current_step=step)
+                last = now
+
+        return report
+
+    @staticmethod
+    def finish(job_id: str, status: str, **fields):
+        job = BackupJobs.get(job_id) or {}
+        finished_at = time.time()
+        BackupJobs.update(
+            job_id,
+            status=status,
+            finished_at=finished_at,
+            duration=round(finished_at - job.get("started_at", finished_at), 3),
+            **fields,
+        )
+
+    @staticmethod
+    def get(job_id: str) -> dict | None:
+        raw = redis_client.hgetall(JOB_KEY.format(job_id=job_id))
+        return _decode(raw) if raw else None
+
+    @staticmethod
+    def current() -> dict:
+        """Job gần nhất (đang chạy hoặc đã xong); idle nếu chưa từng backup."""
+        job_id = redis_client.get(CURRENT_KEY)
+        job = BackupJobs.get(job_id.decode()) if job_id else None
+        return job or {"status": "idle", "percentage": 0, "current_step": ""}
+
+    @staticmethod
+    def is_running() -> bool:
+        return redis_client.exists(LOCK_KEY) > 0
+
+    @staticmethod
+    def history(limit: int = 20) -> list[dict]:
+        job_ids = redis_client.lrange(HISTORY_KEY, 0, limit - 1)
+        pipe = redis_client.pipeline()
+        for job_id in job_ids:
+            pipe.hgetall(JOB_KEY.format(job_id=job_id.decode()))
+        return [_decode(raw) for raw in pipe.execute() if raw]
+
+    @staticmethod
+    def issue_token(job_id: str) -> str:
+        token = secrets.token_urlsafe(24)
+        redis_client.set(TOKEN_KEY.format(token=token), job_id, ex=settings.BACKUP_TOKEN_TTL)
+        return token
+
+    @staticmethod
+    def resolve_token(token: str) -> dict | None:
+        job_id = redis_client.get(TOKEN_KEY.format(token=token))
+        return BackupJobs.get(job_id.decode()) if job_id else None
+
+    @staticmethod
+    def load_manifest() -> dict | None:
+        raw = redis_client.get(MANIFEST_KEY)
+        return json.loads(raw) if raw else None
+
+    @staticmethod
+    def save_manifest(manifest: dict):
+        redis_client.set(MANIFEST_KEY, json.dumps(manifest))
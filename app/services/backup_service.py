@@ -1,106 +1,413 @@
+import io
+import json
 import os
-import shutil
-import subprocess
+import logging
+import time
+import uuid
 import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from app.core.config import settings
 from app.core.minio import client
-from app.services.minio import MINIO_BUCKET
+from app.services.minio import MINIO_BUCKET, iter_object
+from app.services.db_dump_service import DbDumpService
+from app.services.backup_jobs import BackupJobs, STATUS_COMPLETED, STATUS_FAILED
+
+logger = logging.getLogger(__name__)
+
+BACKUP_BUCKET = "backups"
+
+COPY_CHUNK = 1024 * 1024
+
+# Chữ ký đầu file của các định dạng đã nén sẵn: nén lại chỉ tốn CPU, gần như không giảm dung lượng
+_COMPRESSED_MAGIC = (
+    b"\xff\xd8\xff",        # JPEG
+    b"\x89PNG",             # PNG
+    b"GIF8",                # GIF
+    b"PK\x03\x04",          # ZIP / DOCX / XLSX
+    b"\x1f\x8b",            # gzip
+    b"(\xb5/\xfd",          # zstd
+    b"%PDF",                # PDF (stream bên trong đã deflate)
+    b"\x1aE\xdf\xa3",       # WebM / MKV
+    b"ID3",                 # MP3
+)
+
+def compress_type_for(head: bytes) -> int:
+    """STORED cho media đã nén (JPEG/PNG/WebP/AVIF/MP4...), DEFLATED cho phần còn lại."""
+    if head.startswith(_COMPRESSED_MAGIC):
+        return zipfile.ZIP_STORED
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return zipfile.ZIP_STORED
+    if head[4:8] == b"ftyp":  # MP4 / MOV / AVIF / HEIC
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def _zip_info(name: str, modified: datetime | None, size: int | None = None) -> zipfile.ZipInfo:
+    info = zipfile.ZipInfo(name, date_time=(modified or datetime.now()).timetuple()[:6])
+    info.external_attr = 0o644 << 16
+    if size is not None:
+        # Biết trước kích thước => zipfile tự bật ZIP64 khi cần, không phải đoán
+        info.file_size = size
+    return info
+
+
+def _run_steps(steps):
+    """Chạy hết generator các bước ghi backup, trả về giá trị return của nó."""
+    try:
+        while True:
+            next(steps)
+    except StopIteration as stop:
+        return stop.value
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Đích ghi không seek được: zipfile ghi vào, generator của response rút ra."""
+
+    def __init__(self):
+        self._chunks = []
+        self.pending = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self.pending += len(data)
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        self.pending = 0
+        return data
+
+    def take(self, size: int) -> bytes:
+        """Lấy tối đa size byte, phần dư giữ lại cho lần sau."""
+        data = self.drain()
+        if len(data) > size:
+            self.write(data[size:])
+            data = data[:size]
+        return data
+
+
+class _ArchiveReader:
+    """
+    File-like .read(n) kéo dữ liệu từ generator ghi archive: put_object của MinIO
+    đọc từng part và archive chỉ được tạo tiếp khi part trước đã upload xong.
+    """
+
+    def __init__(self, steps, buffer: _StreamBuffer):
+        self._steps = steps
+        self._buffer = buffer
+        self._done = False
+        self.result = None
+        self.size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._done and (size < 0 or self._buffer.pending < size):
+            try:
+                next(self._steps)
+            except StopIteration as stop:
+                self.result = stop.value
+                self._done = True
+        data = self._buffer.drain() if size < 0 else self._buffer.take(size)
+        self.size += len(data)
+        return data
+
+
+def _heartbeat(steps, job_id: str):
+    """Chuyển tiếp các bước ghi archive, gia hạn lock của job định kỳ."""
+    interval = max(1, settings.BACKUP_LOCK_TTL // 4)
+    last = time.monotonic()
+    while True:
+        try:
+            next(steps)
+        except StopIteration as stop:
+            return stop.value
+        if time.monotonic() - last >= interval:
+            BackupJobs.refresh(job_id)
+            last = time.monotonic()
+        yield
+
+
+def _fetch_object(object_name: str) -> bytes:
+    response = client.get_object(MINIO_BUCKET, object_name)
+    try:
+        return response.read()
+    finally:
+        response.close()
+        response.release_conn()
 
-# Multi-step progress tracking
-backup_progress = {
-    "status": "idle",
-    "percentage": 0,
-    "current_step": "",
-    "last_zip": ""
-}
 
 class BackupService:
     @staticmethod
-    def create_full_backup_zip() -> str:
-        global backup_progress
+    def load_manifest() -> dict | None:
+        """Manifest của lần backup thành công gần nhất (mốc cho backup incremental)."""
+        return BackupJobs.load_manifest()
+
+    @staticmethod
+    def save_manifest(manifest: dict):
+        BackupJobs.save_manifest(manifest)
+
+    @staticmethod
+    def _prefetch(objects: list, pool: ThreadPoolExecutor):
+        """
+        Trả về (object, data) đúng thứ tự. Object nhỏ được tải trước song song,
+        tối đa BACKUP_WORKERS * 2 object đang chờ (RAM bị chặn); object lớn trả
+        data=None để stream thẳng từ MinIO vào zip.
+        """
+        window = max(1, settings.BACKUP_WORKERS) * 2
+        pending = deque()
+        it = iter(objects)
+
+        def submit_next() -> bool:
+            obj = next(it, None)
+            if obj is None:
+                return False
+            small = obj.size <= settings.BACKUP_PREFETCH_MAX_BYTES
+            pending.append((obj, pool.submit(_fetch_object, obj.object_name) if small else None))
+            return True
+
+        while len(pending) < window and submit_next():
+            pass
+        while pending:
+            obj, future = pending.popleft()
+            submit_next()
+            yield obj, future.result() if future else None
+
+    @staticmethod
+    def _write_object(zipf: zipfile.ZipFile, obj, data: bytes | None):
+        info = _zip_info(f"files/{obj.object_name}", obj.last_modified, obj.size)
+        if data is not None:
+            info.compress_type = compress_type_for(data[:16])
+            with zipf.open(info, "w") as entry:
+                entry.write(data)
+            yield
+            return
+
+        response = client.get_object(MINIO_BUCKET, obj.object_name)
         try:
-            backup_progress["status"] = "running"
-            backup_progress["percentage"] = 0
-            backup_progress["current_step"] = "Khởi tạo thư mục tạm..."
-            
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_name = f"backup_{timestamp}"
-            
-            temp_root = os.path.join(settings.ROOT_DIR, "tmp_backup")
-            os.makedirs(temp_root, exist_ok=True)
-            
-            work_dir = os.path.join(temp_root, backup_name)
-            os.makedirs(work_dir, exist_ok=True)
-            
-            # --- 1. DB Dump ---
-            backup_progress["current_step"] = "Đang dump Database (SQL)..."
-            backup_progress["percentage"] = 10
-            
-            db_file = os.path.join(work_dir, "db_dump.sql")
-            clean_url = settings.DATABASE_URL.replace("+psycopg2", "").replace("+psycopg", "").replace("+asyncpg", "")
-            
-            subprocess.run(
-                ["pg_dump", "-d", clean_url, "-f", db_file],
-                check=True,
-                capture_output=True,
-                text=True
-            )
-            
-            # --- 2. MinIO Files ---
-            backup_progress["current_step"] = "Đang tải ảnh/video từ MinIO..."
-            backup_progress["percentage"] = 30
-            
-            files_dir = os.path.join(work_dir, "files")
-            os.makedirs(files_dir, exist_ok=True)
-            
+            stream = response.stream(COPY_CHUNK)
+            head = next(stream, b"")
+            info.compress_type = compress_type_for(head[:16])
+            with zipf.open(info, "w") as entry:
+                entry.write(head)
+                yield
+                for chunk in stream:
+                    entry.write(chunk)
+                    yield
+        finally:
+            response.close()
+            response.release_conn()
+
+    @staticmethod
+    def _archive_steps(fileobj, incremental: bool = False, on_progress=None, staging: bool = True):
+        """
+        Ghi toàn bộ backup (db_dump.sql + files/* + manifest.json) vào fileobj.
+        fileobj không cần seek được (zipfile dùng data descriptor), nên có thể là
+        file trên đĩa hoặc một stream. Object được đọc thẳng từ MinIO vào zip,
+        không lưu tạm. incremental=True: chỉ ghi object mới/đổi etag so với
+        manifest lần trước. staging=False: dump database cũng không dùng đĩa tạm.
+
+        Là generator: yield sau mỗi khối đã ghi để bên gọi rút dữ liệu ra (stream)
+        hoặc bỏ qua (ghi file); giá trị return là manifest mới.
+        """
+        progress = on_progress or (lambda pct, step: None)
+        base = BackupService.load_manifest() if incremental else None
+        base_objects = (base or {}).get("objects", {})
+
+        progress(5, "Đang dump Database...")
+        with zipfile.ZipFile(fileobj, "w", zipfile.ZIP_DEFLATED) as zipf:
+            db_info = yield from DbDumpService.dump(zipf, staging)
+
+            progress(30, "Đang liệt kê object trên MinIO...")
             objects = list(client.list_objects(MINIO_BUCKET, recursive=True))
-            total_objs = len(objects)
-            
-            for idx, obj in enumerate(objects):
-                dest_path = os.path.join(files_dir, obj.object_name)
-                os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-                client.fget_object(MINIO_BUCKET, obj.object_name, dest_path)
-                
-                # Update progress during file download (scaling 30% to 70%)
-                if total_objs > 0:
-                    current_pct = 30 + int((idx + 1) / total_objs * 40)
-                    backup_progress["percentage"] = current_pct
-                    backup_progress["current_step"] = f"Đang tải file ({idx+1}/{total_objs})..."
-
-            # --- 3. Create Zip ---
-            backup_progress["current_step"] = "Đang nén toàn bộ dữ liệu (ZIP)..."
-            backup_progress["percentage"] = 80
-            
-            zip_path = os.path.join(temp_root, f"{backup_name}.zip")
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                file_list = []
-                for root, dirs, files in os.walk(work_dir):
-                    for file in files:
-                        file_list.append(os.path.join(root, file))
-                
-                total_files = len(file_list)
-                for idx, fpath in enumerate(file_list):
-                    zipf.write(fpath, os.path.relpath(fpath, work_dir))
-                    # Scale 80% to 100%
-                    if total_files > 0:
-                        backup_progress["percentage"] = 80 + int((idx+1)/total_files * 20)
-
-            backup_progress["status"] = "completed"
-            backup_progress["current_step"] = "Hoàn tất!"
-            backup_progress["percentage"] = 100
-            backup_progress["last_zip"] = zip_path
-            
-            return zip_path
-            
+            current = {o.object_name: {"etag": o.etag, "size": o.size} for o in objects}
+            changed = [o for o in objects if base_objects.get(o.object_name) != current[o.object_name]]
+
+            total_bytes = sum(o.size for o in changed) or 1
+            written = 0
+            with ThreadPoolExecutor(max_workers=max(1, settings.BACKUP_WORKERS)) as pool:
+                for idx, (obj, data) in enumerate(BackupService._prefetch(changed, pool)):
+                    yield from BackupService._write_object(zipf, obj, data)
+                    written += obj.size
+                    progress(30 + int(written / total_bytes * 65), f"Đang ghi file ({idx+1}/{len(changed)})...")
+
+            manifest = {
+                "created_at": datetime.now().isoformat(),
+                "mode": "incremental" if base else "full",
+                "base": base.get("created_at") if base else None,
+                "objects": current,
+                "included": len(changed),
+                "deleted": sorted(set(base_objects) - set(current)),
+                "db": db_info,
+            }
+            zipf.writestr("manifest.json", json.dumps(manifest, indent=2))
+        return manifest
+
+    @staticmethod
+    def write_archive(fileobj, incremental: bool = False, on_progress=None) -> dict:
+        """Ghi backup vào fileobj, trả về manifest mới."""
+        return _run_steps(BackupService._archive_steps(fileobj, incremental, on_progress))
+
+    @staticmethod
+    def start(incremental: bool = False, mode: str = None) -> str | None:
+        """Lấy lock phân tán và tạo job; None nếu đang có backup khác chạy (ở bất kỳ worker nào)."""
+        job_id = uuid.uuid4().hex
+        if not BackupJobs.acquire(job_id):
+            return None
+        BackupJobs.create(job_id, mode or ("incremental" if incremental else "full"))
+        return job_id
+
+    @staticmethod
+    def stream_archive(incremental: bool = False):
+        """
+        Sinh file zip theo từng khối khi client đọc: chỉ tạo thêm dữ liệu khi
+        khối trước đã được gửi đi (backpressure tự nhiên, RAM ~ một khối), không
+        ghi gì xuống đĩa. Manifest chỉ được lưu khi đã phát hết archive.
+
+        Lock và job chỉ được tạo khi generator chạy lần đầu, nên client ngắt trước
+        byte đầu tiên không để lại lock; lock được gia hạn bằng thread nền (không
+        phụ thuộc tốc độ đọc của client) và nhả trong finally.
+        """
+        job_id = BackupService.start(incremental, mode="stream")
+        if job_id is None:
+            # Backup khác vừa lấy lock sau khi route đã kiểm tra: status code đã gửi
+            raise RuntimeError("Backup is already in progress")
+        buffer = _StreamBuffer()
+        # Không dump dạng directory (đĩa tạm ROOT_DIR/tmp_backup): pg_dump -Fc qua stdout
+        steps = BackupService._archive_steps(
+            buffer, incremental, BackupJobs.progress_reporter(job_id), staging=False
+        )
+        sent = 0
+        status, error = STATUS_FAILED, "Client ngắt kết nối"
+        try:
+            with BackupJobs.hold(job_id):
+                while True:
+                    try:
+                        next(steps)
+                    except StopIteration as stop:
+                        manifest = stop.value
+                        break
+                    if buffer.pending >= COPY_CHUNK:
+                        data = buffer.drain()
+                        sent += len(data)
+                        yield data
+                # Phần còn lại gồm cả central directory của zip
+                data = buffer.drain()
+                sent += len(data)
+                yield data
+                BackupService.save_manifest(manifest)
+                status, error = STATUS_COMPLETED, None
         except Exception as e:
-            backup_progress["status"] = "failed"
-            backup_progress["current_step"] = f"Lỗi: {str(e)}"
-            raise e
+            error = f"Lỗi: {e}"
+            raise
         finally:
-            if os.path.exists(work_dir):
-                shutil.rmtree(work_dir)
+            steps.close()
+            BackupJobs.finish(job_id, status, percentage=100 if error is None else None,
+                              current_step=error or "Hoàn tất!", size=sent, storage="stream")
+            BackupJobs.release(job_id)
+
+    @staticmethod
+    def _ensure_backup_bucket():
+        if not client.bucket_exists(BACKUP_BUCKET):
+            client.make_bucket(BACKUP_BUCKET)
+
+    @staticmethod
+    def run_job(job_id: str, incremental: bool = False):
+        """
+        Background task của /backup/start. Archive được ghi vào thư mục dùng
+        chung (BACKUP_STORAGE=local) hoặc stream thẳng lên bucket "backups" của
+        MinIO (BACKUP_STORAGE=minio) để worker/máy nào cũng phục vụ tải được.
+        """
+        progress = BackupJobs.progress_reporter(job_id)
+        name = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+        storage = settings.BACKUP_STORAGE
+        location = None
+        try:
+            if storage == "minio":
+                BackupService._ensure_backup_bucket()
+                buffer = _StreamBuffer()
+                reader = _ArchiveReader(
+                    _heartbeat(BackupService._archive_steps(buffer, incremental, progress), job_id), buffer
+                )
+                location = name
+                client.put_object(
+                    BACKUP_BUCKET, name, reader, length=-1,
+                    part_size=settings.BACKUP_PART_SIZE, content_type="application/zip",
+                )
+                manifest, size = reader.result, reader.size
+            else:
+                temp_root = os.path.join(settings.ROOT_DIR, "tmp_backup")
+                os.makedirs(temp_root, exist_ok=True)
+                # Một bản duy nhất trên đĩa: chính file zip
+                location = os.path.join(temp_root, name)
+                with open(location, "wb") as f:
+                    manifest = _run_steps(
+                        _heartbeat(BackupService._archive_steps(f, incremental, progress), job_id)
+                    )
+                size = os.path.getsize(location)
+
+            BackupService.save_manifest(manifest)
+            BackupJobs.finish(
+                job_id, STATUS_COMPLETED,
+                percentage=100, current_step="Hoàn tất!",
+                mode=manifest["mode"], storage=storage, location=location,
+                file_name=name, size=size, objects=manifest["included"],
+            )
+            BackupService.prune()
+        except Exception as e:
+            logger.exception("backup job %s failed", job_id)
+            if location:
+                BackupService._remove_archive(storage, location)
+            BackupJobs.finish(job_id, STATUS_FAILED, current_step=f"Lỗi: {str(e)}")
+        finally:
+            BackupJobs.release(job_id)
+
+    @staticmethod
+    def _remove_archive(storage: str, location: str):
+        try:
+            if storage == "minio":
+                client.remove_object(BACKUP_BUCKET, location)
+            elif os.path.exists(location):
+                os.remove(location)
+        except Exception as e:
+            logger.warning("could not remove backup archive %s: %s", location, e)
+
+    @staticmethod
+    def prune():
+        """
+        Giữ BACKUP_RETENTION archive mới nhất cùng chuỗi incremental của chúng; job
+        cũ hơn chuyển sang expired. Base của một incremental là manifest của backup
+        hoàn tất ngay trước nó, nên archive incremental được giữ kéo theo mọi archive
+        cũ hơn cho tới (và gồm cả) bản full gần nhất.
+        """
+        kept = 0
+        needs_base = False
+        for job in BackupJobs.history(limit=50):
+            if job["status"] != STATUS_COMPLETED or not job.get("location"):
+                continue
+            if kept < settings.BACKUP_RETENTION or needs_base:
+                kept += 1
+                needs_base = job.get("mode") == "incremental"
+                continue
+            BackupService._remove_archive(job.get("storage"), job["location"])
+            BackupJobs.update(job["job_id"], status="expired", location="")
+
+    @staticmethod
+    def open_archive(job: dict):
+        """Trả về (path, None) cho archive trên đĩa hoặc (None, iterator byte) cho archive trên MinIO."""
+        if job.get("storage") == "minio":
+            response = client.get_object(BACKUP_BUCKET, job["location"])
+            return None, iter_object(response, COPY_CHUNK)
+        return job["location"], None
 
     @staticmethod
     def get_progress():
-        return backup_progress
+        return BackupJobs.current()
+
+    @staticmethod
+    def history(limit: int = 20) -> list[dict]:
+        return BackupJobs.history(limit)
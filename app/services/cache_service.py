@@ -0,0 +1,201 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from typing import Set
+from redis.exceptions import RedisError
+from app.core.config import settings
+from app.core.redis import redis_client, run_blocking
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "cache:"
+TAG_PREFIX = "cache:tag:"
+STATS_KEY = "cache:stats"
+# Kênh pub/sub báo tag bị invalidate cho cache trong tiến trình của các worker khác
+EVENTS_CHANNEL = "cache:events"
+ALL_TAGS = "*"
+
+_PROCESS_ID = uuid.uuid4().hex
+_listeners = []
+_listener_thread = None
+
+# GET + đếm hit/miss trong cùng một round trip
+_GET_SCRIPT = redis_client.register_script("""
+local value = redis.call('GET', KEYS[1])
+if value then
+    redis.call('HINCRBY', KEYS[2], 'hits', 1)
+else
+    redis.call('HINCRBY', KEYS[2], 'misses', 1)
+end
+return value
+""")
+
+# Xóa mọi key gắn với các tag, rồi xóa chính các tag
+_INVALIDATE_SCRIPT = redis_client.register_script("""
+local removed = 0
+for _, tag in ipairs(KEYS) do
+    local members = redis.call('SMEMBERS', tag)
+    for _, key in ipairs(members) do
+        removed = removed + redis.call('DEL', key)
+    end
+    redis.call('DEL', tag)
+end
+redis.call('HINCRBY', ARGV[1], 'invalidations', removed)
+return removed
+""")
+
+
+class CacheService:
+    """
+    Read-through cache cho payload JSON đã serialize sẵn (bytes).
+    Redis lỗi thì bỏ qua cache và đọc thẳng DB (fail-open). Lệnh Redis đi qua
+    run_blocking nên gọi được từ trong AsyncSession.run_sync mà không chặn loop.
+    """
+
+    @staticmethod
+    def get(key: str) -> bytes | None:
+        if not settings.CACHE_ENABLED:
+            return None
+        try:
+            return run_blocking(_GET_SCRIPT, keys=[KEY_PREFIX + key, STATS_KEY])
+        except RedisError as e:
+            logger.warning("cache get failed for %s: %s", key, e)
+            return None
+
+    @staticmethod
+    def set(key: str, payload: bytes, tags: list[str] = (), ttl: int = None):
+        if not settings.CACHE_ENABLED:
+            return
+        ttl = ttl or settings.CACHE_TTL_SECONDS
+        full_key = KEY_PREFIX + key
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.set(full_key, payload, ex=ttl)
+            for tag in set(tags):
+                pipe.sadd(TAG_PREFIX + tag, full_key)
+                pipe.expire(TAG_PREFIX + tag, ttl)
+            run_blocking(pipe.execute)
+        except RedisError as e:
+            logger.warning("cache set failed for %s: %s", key, e)
+
+    @staticmethod
+    def read_through(key: str, builder, ttl: int = None) -> bytes | None:
+        """
+        builder() trả về (payload_bytes, tags) hoặc None nếu không có dữ liệu
+        (None không được cache, để 404 luôn phản ánh DB).
+        """
+        payload = CacheService.get(key)
+        if payload is not None:
+            return payload
+
+        built = builder()
+        if built is None:
+            return None
+        payload, tags = built
+        CacheService.set(key, payload, tags, ttl)
+        return payload
+
+    @staticmethod
+    def invalidate(*tags: str) -> int:
+        tags = {t for t in tags if t}
+        if not tags:
+            return 0
+        CacheService._notify(tags)
+        try:
+            return run_blocking(_INVALIDATE_SCRIPT, keys=[TAG_PREFIX + t for t in tags], args=[STATS_KEY])
+        except RedisError as e:
+            logger.warning("cache invalidate failed for %s: %s", tags, e)
+            return 0
+
+    @staticmethod
+    def clear() -> int:
+        """Xóa toàn bộ cache (vd. sau khi restore DB); giữ lại thống kê."""
+        removed = 0
+        try:
+            batch = []
+            for key in redis_client.scan_iter(match=KEY_PREFIX + "*", count=1000):
+                if key != STATS_KEY.encode():
+                    batch.append(key)
+                if len(batch) >= 1000:
+                    removed += redis_client.delete(*batch)
+                    batch = []
+            if batch:
+                removed += redis_client.delete(*batch)
+        except RedisError as e:
+            logger.warning("cache clear failed: %s", e)
+        CacheService._notify({ALL_TAGS})
+        return removed
+
+    @staticmethod
+    def add_listener(callback):
+        """
+        Đăng ký callback(tags: set[str]) cho cache trong tiến trình (vd.
+        CategorySnapshot). Được gọi ngay khi tiến trình này invalidate, và qua
+        Redis pub/sub khi worker khác invalidate (sau start_listener()).
+        ALL_TAGS trong tags = xóa toàn bộ.
+        """
+        _listeners.append(callback)
+
+    @staticmethod
+    def _dispatch(tags: Set[str]):
+        for callback in _listeners:
+            try:
+                callback(tags)
+            except Exception:
+                logger.exception("cache listener failed")
+
+    @staticmethod
+    def _notify(tags: Set[str]):
+        CacheService._dispatch(tags)
+        try:
+            run_blocking(
+                redis_client.publish, EVENTS_CHANNEL, json.dumps({"origin": _PROCESS_ID, "tags": sorted(tags)})
+            )
+        except RedisError as e:
+            logger.warning("cache event publish failed for %s: %s", tags, e)
+
+    @staticmethod
+    def start_listener():
+        """Thread nền nhận sự kiện invalidate của các worker khác (gọi một lần khi khởi động)."""
+        global _listener_thread
+        if _listener_thread is not None:
+            return
+        _listener_thread = threading.Thread(target=CacheService._listen, name="cache-events", daemon=True)
+        _listener_thread.start()
+
+    @staticmethod
+    def _listen():
+        while True:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(EVENTS_CHANNEL)
+                # Có thể đã lỡ sự kiện trong lúc mất kết nối: coi như mọi thứ đã đổi
+                CacheService._dispatch({ALL_TAGS})
+                for message in pubsub.listen():
+                    event = json.loads(message["data"])
+                    if event.get("origin") != _PROCESS_ID:
+                        CacheService._dispatch(set(event.get("tags", ())))
+            except (RedisError, ValueError) as e:
+                logger.warning("cache event listener error: %s", e)
+            finally:
+                pubsub.close()
+            time.sleep(5)
+
+    @staticmethod
+    def stats() -> dict:
+        try:
+            raw = redis_client.hgetall(STATS_KEY)
+        except RedisError as e:
+            return {"error": str(e)}
+        stats = {k.decode(): int(v) for k, v in raw.items()}
+        hits = stats.get("hits", 0)
+        misses = stats.get("misses", 0)
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "invalidations": stats.get("invalidations", 0),
+            "hit_ratio": round(hits / total, 4) if total else 0.0,
+        }
@@ -1,19 +1,54 @@
-from sqlalchemy.orm import Session, joinedload
+import time
+from types import MappingProxyType
+from typing import List
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session, joinedload, noload
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.product import Category
 from app.schemas.category import CategoryCreate, CategoryUpdate
+from app.schemas.category import Category as CategorySchema
+from app.core.config import settings
+from app.services.cache_service import CacheService, ALL_TAGS
+from app.services.common import Projection
+
+_category_list_adapter = TypeAdapter(List[CategorySchema])
+
+CATEGORY_RELATIONS = ("thumbnail",)
 
 class CategoryService:
     @staticmethod
-    def get_all(db: Session):
-        return db.query(Category).options(joinedload(Category.thumbnail)).all()
+    def projection(fields: str = None, expand: str = None) -> Projection:
+        return Projection(CategorySchema, CATEGORY_RELATIONS, fields, expand)
+
+    @staticmethod
+    def _load_options(expand=CATEGORY_RELATIONS):
+        return (joinedload(Category.thumbnail) if "thumbnail" in expand else noload(Category.thumbnail),)
+
+    @staticmethod
+    def get_all(db: Session, expand=CATEGORY_RELATIONS):
+        return db.query(Category).options(*CategoryService._load_options(expand)).all()
+
+    @staticmethod
+    def get_all_json(db: Session, projection: Projection = None) -> bytes:
+        return CategorySnapshot.get(db).list_json(projection or CategoryService.projection())
+
+    @staticmethod
+    def get_by_id(db: Session, category_id: int, expand=CATEGORY_RELATIONS):
+        return db.query(Category).options(*CategoryService._load_options(expand)) \
+            .filter(Category.id == category_id).first()
 
     @staticmethod
-    def get_by_id(db: Session, category_id: int):
-        return db.query(Category).options(joinedload(Category.thumbnail)).filter(Category.id == category_id).first()
+    def get_by_slug(db: Session, slug: str, expand=CATEGORY_RELATIONS):
+        return db.query(Category).options(*CategoryService._load_options(expand)) \
+            .filter(Category.slug == slug).first()
 
     @staticmethod
-    def get_by_slug(db: Session, slug: str):
-        return db.query(Category).options(joinedload(Category.thumbnail)).filter(Category.slug == slug).first()
+    def _invalidate(category_id: int = None, *slugs: str):
+        CacheService.invalidate(
+            "categories",
+            f"category:{category_id}" if category_id else None,
+            *(f"category_slug:{slug}" for slug in slugs if slug)
+        )
 
     @staticmethod
     def create(db: Session, category_in: CategoryCreate):
@@ -26,6 +61,7 @@ class CategoryService:
         db.add(db_category)
         db.commit()
         db.refresh(db_category)
+        CategoryService._invalidate(db_category.id, db_category.slug)
         return db_category
 
     @staticmethod
@@ -33,6 +69,7 @@ class CategoryService:
         db_category = CategoryService.get_by_id(db, category_id)
         if not db_category:
             return None
+        old_slug = db_category.slug
         
         update_data = category_in.model_dump(exclude_unset=True)
         for field, value in update_data.items():
@@ -40,6 +77,7 @@ class CategoryService:
             
         db.commit()
         db.refresh(db_category)
+        CategoryService._invalidate(category_id, old_slug, db_category.slug)
         return db_category
 
     @staticmethod
@@ -47,7 +85,166 @@ class CategoryService:
         db_category = CategoryService.get_by_id(db, category_id)
         if not db_category:
             return False
+        slug = db_category.slug
         
         db.delete(db_category)
         db.commit()
+        CategoryService._invalidate(category_id, slug)
         return True
+
+
+class _Snapshot:
+    """Ảnh chụp bất biến của bảng categories: schema đã validate, map id/slug, JSON dựng sẵn."""
+
+    def __init__(self, categories: tuple[CategorySchema, ...]):
+        self.categories = categories
+        self.by_id = MappingProxyType({c.id: c for c in categories})
+        self.by_slug = MappingProxyType({c.slug: c.id for c in categories})
+        self.file_ids = frozenset(c.thumbnail_id for c in categories if c.thumbnail_id)
+        self.loaded_at = time.monotonic()
+        self._payloads = {}
+
+    def list_json(self, projection: Projection) -> bytes:
+        key = projection.cache_suffix()
+        payload = self._payloads.get(key)
+        if payload is None:
+            payload = _category_list_adapter.dump_json(list(self.categories), include=projection.list_include())
+            self._payloads[key] = payload
+        return payload
+
+    def find(self, category_id: int = None, slug: str = None) -> CategorySchema | None:
+        return self.by_id.get(self.by_slug.get(slug) if slug is not None else category_id)
+
+
+_snapshot: _Snapshot | None = None
+_generation = 0
+
+
+class CategorySnapshot:
+    """
+    Danh mục (ít thay đổi) được giữ trong RAM của mỗi worker: danh sách, map
+    slug -> id và JSON của /categories/ trả lời không cần DB hay Redis.
+    CategoryService.create/update/delete invalidate tag "categories"; worker
+    ghi bỏ snapshot ngay, worker khác nhận qua pub/sub của CacheService.
+    Đổi file thumbnail (file:<id>) cũng làm snapshot được nạp lại.
+    CATEGORY_SNAPSHOT_TTL là lưới an toàn khi lỡ sự kiện.
+    """
+
+    @staticmethod
+    def current() -> _Snapshot | None:
+        snapshot = _snapshot
+        if snapshot and time.monotonic() - snapshot.loaded_at < settings.CATEGORY_SNAPSHOT_TTL:
+            return snapshot
+        return None
+
+    @staticmethod
+    def get(db: Session) -> _Snapshot:
+        global _snapshot
+        snapshot = CategorySnapshot.current()
+        if snapshot:
+            return snapshot
+        # Không khóa: hàm chạy cả trong greenlet của AsyncSession, khóa thread ở đây
+        # có thể chặn event loop. Vài request cùng nạp một lúc là chấp nhận được.
+        generation = _generation
+        snapshot = _Snapshot(tuple(
+            _category_list_adapter.validate_python(CategoryService.get_all(db), from_attributes=True)
+        ))
+        # Có thay đổi trong lúc đang nạp: dùng cho request này nhưng không giữ lại
+        if generation == _generation:
+            _snapshot = snapshot
+        return snapshot
+
+    @staticmethod
+    def category_id(db: Session, slug: str) -> int | None:
+        """
+        slug -> id theo snapshot. Slug chưa có trong snapshot (danh mục vừa tạo ở
+        worker khác, sự kiện chưa tới) thì tra DB một lần; có trong DB nghĩa là
+        snapshot đã cũ nên bỏ đi để request sau nạp lại.
+        """
+        category_id = CategorySnapshot.get(db).by_slug.get(slug)
+        if category_id is None:
+            category_id = db.query(Category.id).filter(Category.slug == slug).scalar()
+            if category_id is not None:
+                CategorySnapshot.on_invalidate({"categories"})
+        return category_id
+
+    @staticmethod
+    def find(db: Session, category_id: int = None, slug: str = None) -> CategorySchema | None:
+        """Danh mục theo id hoặc slug; không có trong snapshot thì tra DB như category_id()."""
+        category = CategorySnapshot.get(db).find(category_id, slug)
+        if category is None:
+            row = CategoryService.get_by_slug(db, slug) if slug is not None \
+                else CategoryService.get_by_id(db, category_id)
+            if row is not None:
+                CategorySnapshot.on_invalidate({"categories"})
+                category = _to_schema(row)
+        return category
+
+    @staticmethod
+    def on_invalidate(tags: set[str]):
+        global _snapshot, _generation
+        snapshot = _snapshot
+        if ALL_TAGS in tags or "categories" in tags or (
+            snapshot and any(t.startswith("file:") and t[len("file:"):] in snapshot.file_ids for t in tags)
+        ):
+            _generation += 1
+            _snapshot = None
+
+
+CacheService.add_listener(CategorySnapshot.on_invalidate)
+
+
+def _to_schema(category):
+    return CategorySchema.model_validate(category) if category else None
+
+
+class AsyncCategoryService:
+    """Async version of CategoryService, see AsyncProductService."""
+
+    @staticmethod
+    async def snapshot(db: AsyncSession) -> _Snapshot:
+        # Snapshot còn hạn: không cần vào greenlet/DB
+        return CategorySnapshot.current() or await db.run_sync(CategorySnapshot.get)
+
+    @staticmethod
+    async def get_all_json(db: AsyncSession, projection: Projection = None) -> bytes:
+        snapshot = await AsyncCategoryService.snapshot(db)
+        return snapshot.list_json(projection or CategoryService.projection())
+
+    @staticmethod
+    async def _find_json(db: AsyncSession, projection: Projection, category_id: int = None,
+                         slug: str = None) -> bytes | None:
+        snapshot = CategorySnapshot.current()
+        category = snapshot.find(category_id, slug) if snapshot else None
+        if category is None:
+            # Snapshot hết hạn hoặc chưa có danh mục này: nạp lại / tra DB trong greenlet
+            category = await db.run_sync(lambda s: CategorySnapshot.find(s, category_id, slug))
+        return category.model_dump_json(include=projection.include).encode() if category else None
+
+    @staticmethod
+    async def get_by_id_json(db: AsyncSession, category_id: int, projection: Projection) -> bytes | None:
+        return await AsyncCategoryService._find_json(db, projection, category_id=category_id)
+
+    @staticmethod
+    async def get_by_slug_json(db: AsyncSession, slug: str, projection: Projection) -> bytes | None:
+        return await AsyncCategoryService._find_json(db, projection, slug=slug)
+
+    @staticmethod
+    async def get_by_id(db: AsyncSession, category_id: int):
+        return await db.run_sync(lambda s: _to_schema(CategoryService.get_by_id(s, category_id)))
+
+    @staticmethod
+    async def get_by_slug(db: AsyncSession, slug: str):
+        return await db.run_sync(lambda s: _to_schema(CategoryService.get_by_slug(s, slug)))
+
+    @staticmethod
+    async def create(db: AsyncSession, category_in: CategoryCreate):
+        return await db.run_sync(lambda s: _to_schema(CategoryService.create(s, category_in)))
+
+    @staticmethod
+    async def update(db: AsyncSession, category_id: int, category_in: CategoryUpdate):
+        return await db.run_sync(lambda s: _to_schema(CategoryService.update(s, category_id, category_in)))
+
+    @staticmethod
+    async def delete(db: AsyncSession, category_id: int) -> bool:
+        return await db.run_sync(lambda s: CategoryService.delete(s, category_id))
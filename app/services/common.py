@@ -9,6 +9,9 @@ from math import ceil
 from app.db.base_model import BaseModel
 from sqlalchemy import and_, or_
 from datetime import datetime
+import base64
+import json
+import unicodedata
 from sqlalchemy import Column, String, Boolean, DateTime, Text, BigInteger, func
 T = TypeVar("T") 
 def delete_and_refresh(db: Session, model: Type[T], id: int) -> bool:
@@ -128,3 +131,128 @@ def paginate_cursor_by_created_at(
     }
 
 
+def encode_cursor(values: dict) -> str:
+    """
+    Đóng gói giá trị khóa sắp xếp thành cursor dạng chuỗi mờ (base64 url-safe).
+    """
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """
+    Giải mã cursor do encode_cursor tạo ra, báo 400 nếu cursor không hợp lệ.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, dict):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def paginate_cursor_by_id(
+    query,
+    model,
+    limit: int = 10,
+    cursor: str | None = None,
+):
+    """
+    Phân trang keyset theo khóa chính giảm dần (mới nhất trước).
+    Mỗi trang là một index range scan "id < :last_id", không phụ thuộc độ sâu trang.
+    """
+    id_col = model.id
+
+    if cursor:
+        values = decode_cursor(cursor)
+        if not isinstance(values.get("id"), int):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.filter(id_col < values["id"])
+
+    items = (
+        query
+        .order_by(id_col.desc())
+        .limit(limit + 1)
+        .all()
+    )
+
+    has_more = len(items) > limit
+    items = items[:limit]
+
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor({"id": items[-1].id})
+
+    return {
+        "items": items,
+        "next_cursor": next_cursor,
+        "has_more": has_more
+    }
+
+
+def normalize_text(text: str) -> str:
+    """
+    Bỏ dấu tiếng Việt và chuyển về chữ thường ("Nồi Đất" -> "noi dat").
+    Khớp với biểu thức lower(f_unaccent(...)) dùng trong index tìm kiếm.
+    """
+    text = text.replace("đ", "d").replace("Đ", "D")
+    decomposed = unicodedata.normalize("NFD", text)
+    stripped = "".join(c for c in decomposed if unicodedata.category(c) != "Mn")
+    return stripped.lower().strip()
+
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _split_names(value: str | None) -> set[str]:
+    return {name.strip() for name in value.split(",") if name.strip()} if value else set()
+
+
+class Projection:
+    """
+    Tham số fields= / expand= của một request đọc (sparse fieldset).
+      - fields: các field cấp một cần trả về, vd. "id,name"; bỏ trống = tất cả
+      - expand: các quan hệ cần nạp và lồng vào kết quả; bỏ trống = các quan hệ
+        có trong fields, hoặc mọi quan hệ khi không truyền fields
+    Quan hệ không expand thì không được query (noload) và không có trong JSON.
+    Không truyền gì = hành vi cũ (đầy đủ). Tên không hợp lệ trả về 400.
+    """
+
+    def __init__(self, schema, relations: tuple[str, ...], fields: str = None, expand: str = None):
+        allowed = set(schema.model_fields)
+        requested = _split_names(fields)
+        expanded = _split_names(expand)
+        unknown = requested - allowed
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+        unknown = expanded - set(relations)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Cannot expand: {', '.join(sorted(unknown))}")
+
+        self.is_default = fields is None and expand is None
+        if self.is_default:
+            self.expand = frozenset(relations)
+            self.include = None
+        else:
+            if expand is None and not requested:
+                expanded = set(relations)
+            self.expand = frozenset(expanded | (requested & set(relations)))
+            scalars = requested - set(relations) if requested else allowed - set(relations)
+            self.include = frozenset(scalars | self.expand | {"id"})
+
+    def cache_suffix(self) -> str:
+        """Phần thêm vào cache key: mỗi tổ hợp fields/expand là một bản cache riêng."""
+        if self.is_default:
+            return ""
+        return f":f={','.join(sorted(self.include))}:e={','.join(sorted(self.expand))}"
+
+    def list_include(self):
+        return None if self.include is None else {"__all__": self.include}
+
+    def page_include(self):
+        if self.include is None:
+            return None
+        return {"items": {"__all__": self.include}, "next_cursor": True, "has_more": True}
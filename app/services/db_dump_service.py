@@ -0,0 +1,249 @@
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import zipfile
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+from sqlalchemy import text
+from app.core.config import settings
+from app.db.session import engine
+
+COPY_CHUNK = 1024 * 1024
+
+# Tên entry trong archive theo định dạng dump
+PLAIN_ENTRY = "db_dump.sql"
+CUSTOM_ENTRY = "db_dump.dump"
+DIRECTORY_PREFIX = "db/"
+
+# Dòng log --verbose của pg_dump, dùng để đo thời gian dump từng bảng
+_TABLE_START = re.compile(r'dumping contents of table "?(?:[\w]+\.)?([\w]+)"?')
+_TABLE_DONE = re.compile(r'finished item \d+ TABLE DATA (?:[\w]+\.)?([\w]+)')
+# Dòng của pg_restore -l: "3305; 0 16390 TABLE DATA public products owner"
+_TOC_TABLE_DATA = re.compile(r'^(\d+);\s+\d+\s+\d+\s+TABLE DATA\s+\S+\s+(\S+)')
+
+_TABLE_STATS_SQL = text("""
+    SELECT c.relname, c.reltuples::bigint, pg_total_relation_size(c.oid)
+    FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE c.relkind = 'r' AND n.nspname = 'public'
+""")
+
+
+def pg_url() -> str:
+    """DATABASE_URL dạng libpq (bỏ tên driver SQLAlchemy)."""
+    return settings.DATABASE_URL.replace("+psycopg2", "").replace("+psycopg", "").replace("+asyncpg", "")
+
+
+@lru_cache(maxsize=1)
+def pg_dump_major() -> int:
+    out = subprocess.run(["pg_dump", "--version"], capture_output=True, text=True, check=True).stdout
+    match = re.search(r"(\d+)(?:\.\d+)?", out)
+    return int(match.group(1)) if match else 0
+
+
+def compression_arg() -> tuple[str, str | None]:
+    """
+    (phương thức, giá trị cho -Z). zstd cần pg_dump >= 16; bản cũ hơn chỉ có
+    gzip và -Z chỉ nhận mức nén.
+    """
+    method, level = settings.BACKUP_DB_COMPRESSION, settings.BACKUP_DB_COMPRESSION_LEVEL
+    if method == "none":
+        return "none", "0"
+    if pg_dump_major() >= 16:
+        return method, f"{method}:{level}"
+    return "gzip", str(min(level, 9))
+
+
+class _StderrCollector(threading.Thread):
+    """
+    Đọc stderr của pg_dump song song (verbose sinh nhiều log, không đọc sẽ
+    nghẽn pipe), ghi lại thời điểm bắt đầu/kết thúc dump mỗi bảng.
+    """
+
+    def __init__(self, stream):
+        super().__init__(daemon=True)
+        self._stream = stream
+        self.started = {}
+        self.finished = {}
+        self.tail = deque(maxlen=20)
+
+    def run(self):
+        for raw in iter(self._stream.readline, b""):
+            line = raw.decode(errors="replace").rstrip()
+            now = time.monotonic()
+            if match := _TABLE_START.search(line):
+                self.started.setdefault(match.group(1), now)
+            elif match := _TABLE_DONE.search(line):
+                self.finished[match.group(1)] = now
+            elif "error" in line.lower():
+                self.tail.append(line)
+
+    def timings(self, end: float) -> dict[str, float]:
+        """
+        Giây dump mỗi bảng. Chế độ song song có dòng "finished item"; chế độ
+        tuần tự thì bảng kết thúc khi bảng kế tiếp bắt đầu.
+        """
+        ordered = sorted(self.started.items(), key=lambda item: item[1])
+        result = {}
+        for i, (table, start) in enumerate(ordered):
+            stop = self.finished.get(table) or (ordered[i + 1][1] if i + 1 < len(ordered) else end)
+            result[table] = round(stop - start, 3)
+        return result
+
+    def error(self) -> str:
+        return "\n".join(self.tail)
+
+
+class DbDumpService:
+    """
+    Bước dump database của backup:
+      - plain: SQL thuần qua stdout (nén DEFLATE trong zip)
+      - custom: -Fc nén sẵn bởi pg_dump, stream qua stdout, không đĩa tạm
+      - directory: -Fd -j N, mỗi bảng một worker; dump (đã nén) nằm tạm trên
+        đĩa rồi được chép vào zip dạng STORED
+    Tất cả đều là generator để backup stream/gia hạn lock trong lúc chờ.
+    """
+
+    @staticmethod
+    def table_stats() -> dict[str, dict]:
+        with engine.connect() as conn:
+            rows = conn.execute(_TABLE_STATS_SQL).all()
+        return {name: {"rows": max(int(tuples), 0), "bytes": int(size)} for name, tuples, size in rows}
+
+    @staticmethod
+    def dump(zipf: zipfile.ZipFile, staging: bool = True):
+        """
+        Ghi dump vào zipf; trả về mục "db" của manifest. staging=False (backup
+        stream): không dùng đĩa tạm, directory được thay bằng custom.
+        """
+        fmt = settings.BACKUP_DB_FORMAT
+        if fmt == "directory" and not staging:
+            fmt = "custom"
+        method, level = compression_arg() if fmt != "plain" else ("deflate", None)
+        tables = DbDumpService.table_stats()
+        started = time.monotonic()
+
+        if fmt == "directory":
+            dump_bytes = yield from DbDumpService._dump_directory(zipf, level, tables)
+        else:
+            yield from DbDumpService._dump_stream(zipf, fmt, level, tables)
+            dump_bytes = {}
+
+        for table, size in dump_bytes.items():
+            tables.setdefault(table, {})["dump_bytes"] = size
+        return {
+            "format": fmt,
+            "compression": method,
+            "jobs": settings.BACKUP_DB_JOBS if fmt == "directory" else 1,
+            "pg_dump_version": pg_dump_major(),
+            "duration": round(time.monotonic() - started, 3),
+            "tables": tables,
+        }
+
+    @staticmethod
+    def _finish(proc: subprocess.Popen, collector: _StderrCollector, tables: dict):
+        returncode = proc.wait()
+        collector.join()
+        if returncode != 0:
+            raise RuntimeError(f"pg_dump failed: {collector.error()}")
+        for table, seconds in collector.timings(time.monotonic()).items():
+            tables.setdefault(table, {})["seconds"] = seconds
+
+    @staticmethod
+    def _dump_stream(zipf: zipfile.ZipFile, fmt: str, level: str | None, tables: dict):
+        args = ["pg_dump", "-d", pg_url(), "--verbose"]
+        if fmt == "custom":
+            args += ["-Fc", "-Z", level]
+        else:
+            # restore() phát lại dump plain bằng psql ON_ERROR_STOP vào schema đang có:
+            # cần DROP ... IF EXISTS trước mỗi CREATE (pg_restore tự thêm --clean --if-exists)
+            args += ["--clean", "--if-exists"]
+        proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        collector = _StderrCollector(proc.stderr)
+        collector.start()
+        try:
+            info = zipfile.ZipInfo(PLAIN_ENTRY if fmt == "plain" else CUSTOM_ENTRY,
+                                   date_time=datetime.now().timetuple()[:6])
+            # Dump custom đã được pg_dump nén: không nén lại trong Python
+            compressed = fmt == "custom" and level != "0"
+            info.compress_type = zipfile.ZIP_STORED if compressed else zipfile.ZIP_DEFLATED
+            with zipf.open(info, "w", force_zip64=True) as entry:
+                while chunk := proc.stdout.read(COPY_CHUNK):
+                    entry.write(chunk)
+                    yield
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            raise
+        finally:
+            proc.stdout.close()
+        DbDumpService._finish(proc, collector, tables)
+
+    @staticmethod
+    def _dump_directory(zipf: zipfile.ZipFile, level: str, tables: dict):
+        temp_root = os.path.join(settings.ROOT_DIR, "tmp_backup")
+        os.makedirs(temp_root, exist_ok=True)
+        work_dir = tempfile.mkdtemp(prefix="db_", dir=temp_root)
+        dump_dir = os.path.join(work_dir, "db")
+        try:
+            proc = subprocess.Popen(
+                ["pg_dump", "-d", pg_url(), "--verbose", "-Fd", "-j", str(settings.BACKUP_DB_JOBS),
+                 "-Z", level, "-f", dump_dir],
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            )
+            collector = _StderrCollector(proc.stderr)
+            collector.start()
+            # Không có gì để ghi trong lúc pg_dump chạy, nhưng vẫn yield để bên gọi gia hạn lock
+            try:
+                while proc.poll() is None:
+                    time.sleep(0.5)
+                    yield
+            except BaseException:
+                proc.kill()
+                proc.wait()
+                raise
+            DbDumpService._finish(proc, collector, tables)
+
+            files_by_id = DbDumpService._table_data_files(dump_dir)
+            dump_bytes = {}
+            for file_name in sorted(os.listdir(dump_dir)):
+                path = os.path.join(dump_dir, file_name)
+                info = zipfile.ZipInfo(DIRECTORY_PREFIX + file_name, date_time=datetime.now().timetuple()[:6])
+                info.file_size = os.path.getsize(path)
+                info.compress_type = zipfile.ZIP_DEFLATED if file_name == "toc.dat" or level == "0" \
+                    else zipfile.ZIP_STORED
+                with open(path, "rb") as src, zipf.open(info, "w") as entry:
+                    while chunk := src.read(COPY_CHUNK):
+                        entry.write(chunk)
+                        yield
+                table = files_by_id.get(file_name.split(".", 1)[0])
+                if table:
+                    dump_bytes[table] = info.file_size
+            return dump_bytes
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    @staticmethod
+    def _table_data_files(dump_dir: str) -> dict[str, str]:
+        """dump id -> tên bảng (file dữ liệu của bảng trong -Fd là <dump id>.dat[.gz|.zst])."""
+        listing = subprocess.run(["pg_restore", "-l", dump_dir], capture_output=True, text=True, check=True).stdout
+        return {m.group(1): m.group(2) for m in map(_TOC_TABLE_DATA.match, listing.splitlines()) if m}
+
+    @staticmethod
+    def restore(path: str, fmt: str, jobs: int = None):
+        """
+        Nạp lại dump: plain qua psql, custom/directory qua pg_restore -j (mỗi bảng
+        một worker). --clean --if-exists thay thế các đối tượng đang có.
+        """
+        if fmt == "plain":
+            args = ["psql", "-d", pg_url(), "-v", "ON_ERROR_STOP=1", "-q", "-f", path]
+        else:
+            args = ["pg_restore", "-d", pg_url(), "--clean", "--if-exists", "--no-owner",
+                    "-j", str(jobs or settings.BACKUP_DB_JOBS), path]
+        result = subprocess.run(args, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"{args[0]} failed: {result.stderr.strip()[-2000:]}")
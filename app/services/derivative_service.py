@@ -0,0 +1,244 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import func, literal, select, update
+from sqlalchemy.dialects.postgresql import JSONB
+from starlette.concurrency import run_in_threadpool
+from app.core.config import settings
+from app.core.redis import redis_client
+from app.db.session import SessionLocal, AsyncSessionLocal
+from app.models.file import File, StoredObject
+from app.services.cache_service import CacheService
+from app.services.minio import get_object, upload_file
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = "pending"
+STATUS_READY = "ready"
+STATUS_FAILED = "failed"
+
+MEDIA_TYPES = {"webp": "image/webp", "avif": "image/avif"}
+_ENCODE_OPTIONS = {"webp": {"format": "WEBP", "quality": 60}, "avif": {"format": "AVIF", "quality": 50}}
+
+_executor: ProcessPoolExecutor | None = None
+# Dẫn xuất đang được tạo theo yêu cầu trong process này: (object_id, "webp:320") -> task
+_on_demand: dict[tuple[int, str], asyncio.Task] = {}
+
+
+def image_widths() -> list[int]:
+    return sorted(int(w) for w in settings.IMAGE_WIDTHS.split(","))
+
+
+def derivative_key(fmt: str, width: int) -> str:
+    # Key phẳng "webp:320" để gộp JSONB bằng toán tử || một cách nguyên tử
+    return f"{fmt}:{width}"
+
+
+def snap_width(requested: int, available: list[int]) -> int:
+    """Bậc nhỏ nhất >= requested, nếu không có thì bậc lớn nhất."""
+    for width in sorted(available):
+        if width >= requested:
+            return width
+    return max(available)
+
+
+def build_derivatives(object_name: str, object_id: int, widths: list[int], formats: list[str]) -> dict:
+    """
+    Chạy trong process worker (ngoài GIL của API): tải ảnh gốc từ MinIO một lần,
+    xoay theo EXIF, rồi encode từng bậc chiều rộng (không phóng to quá ảnh gốc)
+    lên previews/{object_id}/w{width}.{fmt}.
+    """
+    from PIL import Image, ImageOps
+
+    response = get_object(object_name)
+    try:
+        source = io.BytesIO(response.read())
+    finally:
+        response.close()
+        response.release_conn()
+
+    derivatives = {}
+    with Image.open(source) as img:
+        # Kích thước gốc sau khi xoay theo EXIF (orientation 5-8 đổi chiều rộng/cao)
+        orientation = img.getexif().get(0x0112, 1)
+        original_width, original_height = img.size if orientation not in (5, 6, 7, 8) else img.size[::-1]
+
+        # JPEG: giải mã thẳng ở tỉ lệ nhỏ hơn (cả hai chiều vẫn >= bậc lớn nhất)
+        largest = max(widths)
+        img.draft("RGB", (largest, largest))
+
+        # Fix orientation based on EXIF data
+        img = ImageOps.exif_transpose(img)
+
+        # Convert to RGB if necessary
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA")
+
+        # Resize từ bậc lớn xuống bậc nhỏ, mỗi bậc dùng ảnh của bậc trước làm nguồn
+        current = img
+        for width in sorted({min(w, current.width) for w in widths}, reverse=True):
+            if width < current.width:
+                height = max(1, round(current.height * width / current.width))
+                current = current.resize((width, height), Image.LANCZOS)
+            for fmt in formats:
+                output = io.BytesIO()
+                current.save(output, **_ENCODE_OPTIONS[fmt])
+                data = output.getvalue()
+                name = f"previews/{object_id}/w{width}.{fmt}"
+                upload_file(io.BytesIO(data), content_type=MEDIA_TYPES[fmt], length=len(data), custom_name=name)
+                derivatives[derivative_key(fmt, width)] = name
+
+    return {"width": original_width, "height": original_height, "derivatives": derivatives}
+
+
+class DerivativeService:
+    """
+    Hàng đợi tạo ảnh dẫn xuất trong process: job được đẩy vào ProcessPoolExecutor,
+    kết quả được ghi lại vào bảng stored_objects ở process API khi job xong. Các
+    upload trùng nội dung dùng chung object nên chỉ tạo dẫn xuất một lần.
+    """
+
+    @staticmethod
+    def _get_executor() -> ProcessPoolExecutor:
+        global _executor
+        if _executor is None:
+            # spawn: không fork process đang có thread (uvicorn, urllib3 pool)
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.DERIVATIVE_WORKERS or os.cpu_count(),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+    @staticmethod
+    def needs_derivatives(mime_type: str) -> bool:
+        return mime_type.startswith("image/")
+
+    @staticmethod
+    def supports(fmt: str) -> bool:
+        from PIL import features
+        return fmt == "webp" or (fmt == "avif" and bool(features.check("avif")))
+
+    @staticmethod
+    def eager_formats() -> list[str]:
+        return [f for f in settings.IMAGE_EAGER_FORMATS.split(",") if f in MEDIA_TYPES and DerivativeService.supports(f)]
+
+    @staticmethod
+    def _result_values(result: dict) -> dict:
+        values = {
+            "width": result["width"],
+            "height": result["height"],
+            # Gộp với các bậc đã có (kể cả bậc tạo theo yêu cầu) thay vì ghi đè
+            "derivatives": func.coalesce(StoredObject.derivatives, literal({}, JSONB)).op("||")(
+                literal(result["derivatives"], JSONB)
+            ),
+        }
+        webp = [k for k in result["derivatives"] if k.startswith("webp:")]
+        if webp:
+            # preview=true dùng bậc WebP lớn nhất
+            values["preview_path"] = result["derivatives"][max(webp, key=lambda k: int(k.split(":")[1]))]
+        return values
+
+    @staticmethod
+    def enqueue(object_id: int, object_name: str):
+        future = DerivativeService._get_executor().submit(
+            build_derivatives, object_name, object_id, image_widths(), DerivativeService.eager_formats()
+        )
+        future.add_done_callback(lambda f: DerivativeService._on_done(object_id, f))
+
+    @staticmethod
+    def _file_tags(file_ids) -> list[str]:
+        """Tag cache của mọi file trỏ tới object (các upload trùng nội dung)."""
+        return [f"file:{file_id}" for file_id in file_ids]
+
+    @staticmethod
+    def _on_done(object_id: int, future):
+        try:
+            values = DerivativeService._result_values(future.result())
+            values["derivative_status"] = STATUS_READY
+        except Exception as e:
+            logger.warning("derivative generation failed for object %s: %s", object_id, e)
+            values = {"derivative_status": STATUS_FAILED}
+
+        db = SessionLocal()
+        try:
+            db.execute(update(StoredObject).where(StoredObject.id == object_id).values(**values))
+            db.commit()
+            file_ids = db.scalars(select(File.id).where(File.object_id == object_id)).all()
+        finally:
+            db.close()
+        CacheService.invalidate(*DerivativeService._file_tags(file_ids))
+
+    @staticmethod
+    def resolve(file_record: File, width: int = None, fmt: str = "webp") -> tuple[str | None, int]:
+        """
+        Tìm dẫn xuất gần nhất cho (width, fmt). Trả về (object_name, bậc) hoặc
+        (None, bậc) nếu bậc đó chưa được tạo.
+        """
+        ladder = image_widths()
+        if file_record.width:
+            ladder = sorted({min(w, file_record.width) for w in ladder})
+        rung = snap_width(width or max(ladder), ladder)
+        path = (file_record.derivatives or {}).get(derivative_key(fmt, rung))
+        return path, rung
+
+    @staticmethod
+    async def create_on_demand(file_record: File, rung: int, fmt: str) -> str:
+        """
+        Tạo một dẫn xuất ngay trong request (qua process pool) và lưu lại cho lần sau.
+        Các request đồng thời cho cùng (file, bậc, định dạng) chờ chung một job
+        thay vì mỗi request gửi một job vào pool.
+        """
+        key = (file_record.object_id, derivative_key(fmt, rung))
+        task = _on_demand.get(key)
+        if task is None:
+            task = asyncio.ensure_future(
+                DerivativeService._build_on_demand(file_record.object_id, file_record.file_path, rung, fmt)
+            )
+            _on_demand[key] = task
+            task.add_done_callback(lambda _: _on_demand.pop(key, None))
+        # shield: một client ngắt kết nối không huỷ job mà các request khác đang chờ
+        return await asyncio.shield(task)
+
+    @staticmethod
+    async def _build_on_demand(object_id: int, object_name: str, rung: int, fmt: str) -> str:
+        future = DerivativeService._get_executor().submit(build_derivatives, object_name, object_id, [rung], [fmt])
+        result = await asyncio.wrap_future(future)
+        values = DerivativeService._result_values(result)
+        values.pop("preview_path", None)
+        # Session riêng: task sống lâu hơn request đã khởi tạo nó
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(StoredObject).where(StoredObject.id == object_id).values(**values))
+            await db.commit()
+            file_ids = (await db.scalars(select(File.id).where(File.object_id == object_id))).all()
+        await run_in_threadpool(CacheService.invalidate, *DerivativeService._file_tags(file_ids))
+        # Ảnh nhỏ hơn bậc yêu cầu thì bậc thực tế là chiều rộng ảnh gốc
+        return result["derivatives"][derivative_key(fmt, min(rung, result["width"]))]
+
+    @staticmethod
+    def resume_pending():
+        """Khi khởi động: đưa lại vào hàng đợi các object còn pending (job mất khi restart)."""
+        try:
+            # Chỉ một worker uvicorn làm việc này
+            if not redis_client.set("derivatives:resume", 1, nx=True, ex=60):
+                return
+            db = SessionLocal()
+            try:
+                pending = db.query(StoredObject.id, StoredObject.file_path) \
+                    .filter(StoredObject.derivative_status == STATUS_PENDING).all()
+            finally:
+                db.close()
+        except Exception as e:
+            logger.warning("could not resume pending derivative jobs: %s", e)
+            return
+        for object_id, object_name in pending:
+            DerivativeService.enqueue(object_id, object_name)
+
+    @staticmethod
+    def shutdown():
+        global _executor
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
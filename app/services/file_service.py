@@ -1,125 +1,217 @@
-import os
-import shutil
+import uuid
 from fastapi import UploadFile, HTTPException
+from sqlalchemy import select, update, delete
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from app.services.minio import upload_file, get_public_url, delete_object
-from app.services.clean import cleanup_tmp_chunks # Assuming this exists
-from app.models.file import File
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from app.services.upload_manifest import UploadManifest
+from minio.error import S3Error
+from app.services.minio import (
+    get_public_url, delete_object, stat_object,
+    create_multipart_upload, upload_part, complete_multipart_upload, abort_multipart_upload,
+)
+from app.services.cache_service import CacheService
+from app.services.derivative_service import DerivativeService, STATUS_PENDING
+from app.models.file import File, StoredObject
 from datetime import datetime
 import mimetypes
 
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-CHUNK_TMP_DIR = os.path.join(BASE_DIR, "tmp_chunks")
 from .common import *
 
-
-    
+# Mã lỗi S3 khi ghép: các part đã upload không dùng lại được, phải upload lại từ đầu
+_UNUSABLE_PARTS = {"InvalidPart", "InvalidPartOrder", "EntityTooSmall"}
 
 
 class FileService:
     @staticmethod
-    def init_upload(filename: str) -> str:
-        import uuid
+    def init_upload(filename: str, total_chunks: int = None, file_size: int = None) -> str:
         upload_id = str(uuid.uuid4())
-        upload_dir = os.path.join(CHUNK_TMP_DIR, upload_id)
-        os.makedirs(upload_dir, exist_ok=True)
+        mime_type, _ = mimetypes.guess_type(filename)
+        if not mime_type:
+            mime_type = "application/octet-stream"
+
+        # Mở multipart upload trên MinIO ngay từ đầu; các chunk được ghi thẳng vào đó
+        object_name = f"{upload_id}_{filename}"
+        s3_upload_id = create_multipart_upload(object_name, mime_type)
+
+        UploadManifest.create(upload_id, {
+            "filename": filename,
+            "object_name": object_name,
+            "s3_upload_id": s3_upload_id,
+            "mime_type": mime_type,
+            "total_chunks": total_chunks,
+            "file_size": file_size,
+        })
         return upload_id
 
     @staticmethod
-    async def upload_chunk(upload_id: str, chunk_index: int, chunk: UploadFile):
-        upload_dir = os.path.join(CHUNK_TMP_DIR, upload_id)
-        if not os.path.exists(upload_dir):
-            raise HTTPException(status_code=404, detail="Upload session not found")
-        
-        chunk_path = os.path.join(upload_dir, f"{chunk_index}.part")
-        
-        content = await chunk.read()
-        with open(chunk_path, "wb") as f:
-            f.write(content)
-            
-        return True
+    async def upload_chunk(upload_id: str, chunk_index: int, chunk: UploadFile, checksum: str = None):
+        # redis-py là I/O chặn: không gọi thẳng trên event loop
+        session = await run_in_threadpool(UploadManifest.get, upload_id)
+        UploadManifest.check_chunk_index(session, chunk_index)
+
+        # Bộ nhớ mỗi request bị chặn bởi kích thước một chunk (client gửi 5MB/chunk)
+        data = await chunk.read()
+        part = await run_in_threadpool(UploadManifest.verify_chunk, data, checksum)
+        etag = await run_in_threadpool(
+            upload_part, session["object_name"], session["s3_upload_id"], chunk_index + 1, data
+        )
+        # ETag của một part là md5 nội dung: xác nhận MinIO nhận đúng các byte đã gửi
+        if etag.strip('"') != part["md5"]:
+            raise HTTPException(status_code=502, detail=f"Storage checksum mismatch for chunk {chunk_index}")
+
+        part["etag"] = etag
+        await run_in_threadpool(UploadManifest.record_part, upload_id, chunk_index, part)
+        return part
 
     @staticmethod
     def complete_upload(db: Session, upload_id: str, total_chunks: int, filename: str) -> File:
-        upload_dir = os.path.join(CHUNK_TMP_DIR, upload_id)
-        if not os.path.exists(upload_dir):
-            raise HTTPException(status_code=404, detail="Upload session not found")
-            
-        merged_path = os.path.join(upload_dir, filename)
-        
-        # Merge chunks
-        with open(merged_path, "wb") as merged:
-            for i in range(total_chunks):
-                part_path = os.path.join(upload_dir, f"{i}.part")
-                if not os.path.exists(part_path):
-                    raise HTTPException(status_code=400, detail=f"Missing chunk {i}")
-                
-                with open(part_path, "rb") as part:
-                    shutil.copyfileobj(part, merged)
-        
-        # Get file size
-        file_size = os.path.getsize(merged_path)
-        
-        # Guess mime type
-        mime_type, _ = mimetypes.guess_type(filename)
-        if not mime_type:
-            mime_type = "application/octet-stream"
-            
-        # Upload to MinIO
-        with open(merged_path, "rb") as f:
-            object_name = upload_file(f, content_type=mime_type, length=file_size)
-        
-        preview_path = None
-        # Generate WebP Preview for images
-        if mime_type.startswith("image/"):
-            try:
-                from PIL import Image, ImageOps
-                import io
-                with Image.open(merged_path) as img:
-                    # Fix orientation based on EXIF data
-                    img = ImageOps.exif_transpose(img)
-                    
-                    # Convert to RGB if necessary
-                    if img.mode not in ("RGB", "RGBA"):
-                        img = img.convert("RGBA")
-                    
-                    output = io.BytesIO()
-                    img.save(output, format="WEBP", quality=60)
-                    webp_bytes = output.getvalue()
-                    
-                    # Upload preview to MinIO
-                    preview_object_name = f"previews/{upload_id}.webp"
-                    preview_data = io.BytesIO(webp_bytes)
-                    upload_file(preview_data, content_type="image/webp", length=len(webp_bytes), custom_name=preview_object_name)
-                    preview_path = preview_object_name
-            except Exception as e:
-                print(f"[PREVIEW GEN ERROR] {e}")
-
-        file_url = f"/api/files/{upload_id}"
-        
-        # Save to DB
+        session = UploadManifest.get(upload_id)
+        object_name = session["object_name"]
+        mime_type = session["mime_type"]
+        if session.get("total_chunks") not in (None, total_chunks):
+            raise HTTPException(status_code=400, detail="total_chunks does not match upload session")
+
+        # Kiểm tra manifest trước khi ghép: thiếu chunk thì client upload bù rồi gọi lại
+        ordered = UploadManifest.verify_complete(UploadManifest.parts(upload_id), total_chunks)
+        file_size = sum(p["size"] for p in ordered)
+        if session.get("file_size") and int(session["file_size"]) != file_size:
+            raise HTTPException(status_code=400, detail="File size does not match upload session")
+
+        # Nội dung đã có trong kho: bỏ multipart upload (MinIO không phải ghép),
+        # upload này có dòng files riêng trỏ tới object sẵn có — không lưu, preview
+        # hay backup lại nội dung
+        content_hash = UploadManifest.content_hash(ordered)
+        object_id = FileService._add_reference(db, content_hash)
+        if object_id:
+            new_file = FileService._save_file(db, upload_id, filename, file_size, mime_type, object_id)
+            abort_multipart_upload(object_name, session["s3_upload_id"])
+            UploadManifest.drop(upload_id)
+            return new_file
+
+        # Chỉ còn CompleteMultipartUpload: MinIO tự ghép các part, không merge ở local.
+        # Object giữ nguyên key đã mở ở init_upload, không copy sang key khác
+        etag = FileService._complete_parts(upload_id, session, ordered)
+        if etag and etag != UploadManifest.expected_etag(ordered):
+            delete_object(object_name)
+            UploadManifest.drop(upload_id)
+            raise HTTPException(status_code=502, detail="Uploaded object failed integrity check")
+
+        # Preview được tạo nền bởi DerivativeService, response trả về ngay
+        needs_derivatives = DerivativeService.needs_derivatives(mime_type)
+        stored = StoredObject(
+            content_hash=content_hash,
+            file_path=object_name,
+            etag=etag,
+            ref_count=1,
+            derivative_status=STATUS_PENDING if needs_derivatives else None
+        )
+        db.add(stored)
+        try:
+            db.flush()
+        except IntegrityError:
+            # Upload khác cùng nội dung đã lưu trước (unique content_hash): tham chiếu
+            # tới object đó và bỏ bản vừa ghép
+            db.rollback()
+            object_id = FileService._add_reference(db, content_hash)
+            if not object_id:
+                # Object kia vừa bị xóa: gọi complete lại sẽ lưu bản của upload này
+                raise HTTPException(status_code=503, detail="Concurrent upload conflict, retry complete")
+            new_file = FileService._save_file(db, upload_id, filename, file_size, mime_type, object_id)
+            delete_object(object_name)
+            UploadManifest.drop(upload_id)
+            return new_file
+
+        new_file = FileService._save_file(db, upload_id, filename, file_size, mime_type, stored.id)
+        if needs_derivatives:
+            DerivativeService.enqueue(new_file.object_id, object_name)
+
+        UploadManifest.drop(upload_id)
+        return new_file
+
+    @staticmethod
+    def _save_file(db: Session, upload_id: str, filename: str, file_size: int, mime_type: str, object_id: int) -> File:
+        """Dòng files của một upload: tên, URL riêng, nội dung ở object_id."""
         new_file = File(
-            id=upload_id, 
+            id=upload_id,
             file_name=filename,
-            file_path=object_name,
-            preview_path=preview_path,
-            file_url=file_url,
+            object_id=object_id,
+            file_url=f"/api/files/{upload_id}",
             file_size=file_size,
             mime_type=mime_type,
-            file_type="article"
+            file_type="article",
         )
         db.add(new_file)
         db.commit()
         db.refresh(new_file)
-        
-        # Cleanup
-        try:
-            shutil.rmtree(upload_dir, ignore_errors=True)
-        except:
-            pass
-        
         return new_file
 
+    @staticmethod
+    def _complete_parts(upload_id: str, session: dict, ordered: list[dict]) -> str | None:
+        """
+        CompleteMultipartUpload, trả về ETag của object. Lỗi tạm thời (mạng,
+        MinIO quá tải...) giữ nguyên phiên và manifest, trả 503 để client gọi
+        complete lại; chỉ khi các part không dùng được nữa mới bỏ phiên.
+        """
+        object_name = session["object_name"]
+        try:
+            result = complete_multipart_upload(
+                object_name,
+                session["s3_upload_id"],
+                [(i + 1, p["etag"]) for i, p in enumerate(ordered)],
+            )
+            return result.etag.strip('"') if result.etag else None
+        except S3Error as e:
+            if e.code == "NoSuchUpload":
+                # Lần gọi trước có thể đã ghép xong nhưng mất response: object đã có
+                try:
+                    return stat_object(object_name).etag.strip('"')
+                except S3Error:
+                    UploadManifest.drop(upload_id)
+                    raise HTTPException(status_code=410, detail="Upload session expired on storage, upload again")
+            if e.code in _UNUSABLE_PARTS:
+                abort_multipart_upload(object_name, session["s3_upload_id"])
+                UploadManifest.drop(upload_id)
+                raise HTTPException(status_code=400, detail=f"Uploaded parts are unusable ({e.code}), upload again")
+            raise HTTPException(status_code=503, detail="Storage error, retry complete") from e
+        except Exception as e:
+            raise HTTPException(status_code=503, detail="Storage unavailable, retry complete") from e
+
+    @staticmethod
+    def _add_reference(db: Session, content_hash: str) -> int | None:
+        """
+        Thêm một tham chiếu vào object có cùng digest, trả về id của object. UPDATE
+        khóa dòng tới khi commit nên không mất lượt đếm khi chạy song song.
+        """
+        return db.execute(
+            update(StoredObject)
+            .where(StoredObject.content_hash == content_hash)
+            .values(ref_count=StoredObject.ref_count + 1)
+            .returning(StoredObject.id)
+        ).scalar_one_or_none()
+
+    @staticmethod
+    def _release_statements(object_id: int):
+        """Bớt một tham chiếu; trả về (UPDATE ... RETURNING, DELETE khi không còn tham chiếu)."""
+        release = (
+            update(StoredObject)
+            .where(StoredObject.id == object_id)
+            .values(ref_count=StoredObject.ref_count - 1)
+            .returning(StoredObject.ref_count)
+        )
+        remove = delete(StoredObject).where(StoredObject.id == object_id, StoredObject.ref_count <= 0)
+        return release, remove
+
+    @staticmethod
+    def upload_status(upload_id: str) -> dict:
+        return UploadManifest.status(upload_id)
+
+    @staticmethod
+    def object_names(stored: StoredObject) -> list[str]:
+        names = [stored.file_path, stored.preview_path, *(stored.derivatives or {}).values()]
+        return list(dict.fromkeys(n for n in names if n))
+
     @staticmethod
     def get_file(db: Session, file_id: str) -> File:
         return db.query(File).filter(File.id == file_id).first()
@@ -129,13 +221,54 @@ class FileService:
         file_record = db.query(File).filter(File.id == file_id).first()
         if not file_record:
             return False
-        
-        # Delete from MinIO
-        delete_object(file_record.file_path)
-        if file_record.preview_path:
-            delete_object(file_record.preview_path)
-        
-        # Delete from DB
+        stored = file_record.stored
+        object_names = FileService.object_names(stored)
+
+        # Xóa dòng của upload này; object chỉ bị xóa khi không còn upload nào trỏ tới
         db.delete(file_record)
+        db.flush()
+        release, remove = FileService._release_statements(stored.id)
+        orphaned = db.execute(release).scalar_one() <= 0
+        if orphaned:
+            db.execute(remove)
         db.commit()
+
+        # Delete from MinIO (file gốc + preview + các bậc dẫn xuất) sau khi DB đã commit
+        if orphaned:
+            for object_name in object_names:
+                delete_object(object_name)
+        CacheService.invalidate(f"file:{file_id}")
+        return True
+
+
+class AsyncFileService:
+    """
+    Async version of the FileService DB operations. MinIO calls are blocking
+    (urllib3), so they are pushed to the threadpool instead of the event loop.
+    """
+
+    @staticmethod
+    async def get_file(db: AsyncSession, file_id: str) -> File:
+        return await db.get(File, file_id)
+
+    @staticmethod
+    async def delete_file(db: AsyncSession, file_id: str) -> bool:
+        file_record = await db.get(File, file_id)
+        if not file_record:
+            return False
+        stored = file_record.stored
+        object_names = FileService.object_names(stored)
+
+        await db.delete(file_record)
+        await db.flush()
+        release, remove = FileService._release_statements(stored.id)
+        orphaned = (await db.execute(release)).scalar_one() <= 0
+        if orphaned:
+            await db.execute(remove)
+        await db.commit()
+
+        if orphaned:
+            for object_name in object_names:
+                await run_in_threadpool(delete_object, object_name)
+        await run_in_threadpool(CacheService.invalidate, f"file:{file_id}")
         return True
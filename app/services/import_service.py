@@ -0,0 +1,259 @@
+import csv
+import json
+import logging
+import os
+import time
+from decimal import Decimal, InvalidOperation
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+from app.core.config import settings
+from app.core.redis import redis_client
+from app.db.session import SessionLocal
+from app.models.product import Category
+from app.schemas.product import ProductCreate
+from app.services.cache_service import CacheService
+from app.services.product_service import ProductService
+
+logger = logging.getLogger(__name__)
+
+JOB_KEY = "import:{job_id}"
+JOB_TTL = 24 * 3600
+MAX_ERRORS = 100
+
+# Cột của file import (không phân biệt hoa thường). Mỗi dòng là một variant; các
+# dòng liền nhau cùng product_key (mặc định là name) thuộc cùng một sản phẩm và
+# thông tin sản phẩm lấy từ dòng đầu. Thuộc tính variant: cột "attr.<tên>.<đơn vị>",
+# vd. "attr.width.cm". media_ids: danh sách file id cách nhau bởi dấu phẩy.
+PRODUCT_KEY = "product_key"
+ATTR_PREFIX = "attr."
+
+
+def _text(value) -> str | None:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _number(value):
+    value = _text(value)
+    if value is None:
+        return None
+    try:
+        return Decimal(value.replace(",", ""))
+    except InvalidOperation:
+        raise ValueError(f"invalid number {value!r}")
+
+
+def _iter_csv(path: str):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        reader.fieldnames = [h.strip().lower() for h in reader.fieldnames or []]
+        for row in reader:
+            yield reader.line_num, row
+
+
+def _iter_xlsx(path: str):
+    from openpyxl import load_workbook
+
+    # read_only: đọc từng dòng từ XML, không nạp cả workbook vào RAM
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        headers = [str(h).strip().lower() if h is not None else "" for h in next(rows, ())]
+        for line, values in enumerate(rows, start=2):
+            if any(v is not None for v in values):
+                yield line, dict(zip(headers, values))
+    finally:
+        workbook.close()
+
+
+def _count_rows(path: str, kind: str) -> int | None:
+    """Ước lượng số dòng dữ liệu để tính phần trăm (quét nhanh theo byte, không parse)."""
+    if kind == "xlsx":
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True)
+        try:
+            max_row = workbook.active.max_row  # lấy từ thẻ <dimension>, có thể thiếu
+        finally:
+            workbook.close()
+        return max_row - 1 if max_row else None
+    count = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            count += chunk.count(b"\n")
+    return max(count - 1, 0)
+
+
+class ProductImportService:
+    """
+    Import sản phẩm hàng loạt từ CSV/XLSX: đọc file theo dòng, gom sản phẩm
+    thành lô IMPORT_BATCH_SIZE, validate cả lô rồi ghi bằng
+    ProductService.insert_many (INSERT ... RETURNING), mỗi lô một transaction.
+    Lô lỗi ở DB được ghi lại từng sản phẩm để chỉ bỏ các dòng hỏng.
+    Tiến độ lưu trong Redis (import:<job_id>) nên worker nào cũng đọc được.
+    """
+
+    @staticmethod
+    def create_job(job_id: str, file_name: str):
+        key = JOB_KEY.format(job_id=job_id)
+        pipe = redis_client.pipeline()
+        pipe.hset(key, mapping={
+            "job_id": job_id, "file_name": file_name, "status": "running", "percentage": 0,
+            "rows": 0, "products": 0, "variants": 0, "failed": 0, "errors": "[]",
+            "started_at": time.time(),
+        })
+        pipe.expire(key, JOB_TTL)
+        pipe.execute()
+
+    @staticmethod
+    def _update(job_id: str, **fields):
+        redis_client.hset(JOB_KEY.format(job_id=job_id), mapping=fields)
+
+    @staticmethod
+    def get_job(job_id: str) -> dict | None:
+        raw = redis_client.hgetall(JOB_KEY.format(job_id=job_id))
+        if not raw:
+            return None
+        job = {k.decode(): v.decode() for k, v in raw.items()}
+        for field in ("percentage", "rows", "total_rows", "products", "variants", "failed"):
+            if field in job:
+                job[field] = int(job[field])
+        job["errors"] = json.loads(job.get("errors", "[]"))
+        return job
+
+    @staticmethod
+    def _category_resolver(db):
+        rows = db.query(Category.id, Category.slug).all()
+        ids = {cid for cid, _ in rows}
+        by_slug = {slug: cid for cid, slug in rows}
+
+        def resolve(value) -> int | None:
+            value = _text(value)
+            if value is None:
+                return None
+            if value.isdigit() and int(value) in ids:
+                return int(value)
+            if value in by_slug:
+                return by_slug[value]
+            raise ValueError(f"unknown category {value!r}")
+
+        return resolve
+
+    @staticmethod
+    def _build_product(rows: list[dict], resolve_category) -> ProductCreate:
+        first = rows[0]
+        variants = []
+        for row in rows:
+            price = _number(row.get("price"))
+            if price is None:
+                continue
+            attributes = []
+            for column, value in row.items():
+                if not column or not column.startswith(ATTR_PREFIX) or _text(value) is None:
+                    continue
+                name, _, unit = column[len(ATTR_PREFIX):].partition(".")
+                attributes.append({"name": name, "value": _number(value), "unit": unit})
+            variants.append({
+                "price": price,
+                "stock": int(_number(row.get("stock")) or 0),
+                "image_id": _text(row.get("image_id")),
+                "attributes": attributes,
+            })
+        media_ids = [m.strip() for m in (_text(first.get("media_ids")) or "").split(",") if m.strip()]
+        return ProductCreate.model_validate({
+            "name": _text(first.get("name")),
+            "description": _text(first.get("description")),
+            "category_id": resolve_category(first.get("category")),
+            "thumbnail_id": _text(first.get("thumbnail_id")),
+            "media_ids": media_ids,
+            "variants": variants,
+        })
+
+    @staticmethod
+    def _iter_groups(rows):
+        """Gom các dòng liền nhau cùng product_key thành một sản phẩm: (dòng đầu, dòng cuối, rows)."""
+        group, key, start = [], None, None
+        for line, row in rows:
+            row_key = _text(row.get(PRODUCT_KEY)) or _text(row.get("name"))
+            if group and row_key != key:
+                yield start, prev_line, group
+                group = []
+            if not group:
+                key, start = row_key, line
+            group.append(row)
+            prev_line = line
+        if group:
+            yield start, prev_line, group
+
+    @staticmethod
+    def _write_batch(db, batch: list[tuple[str, ProductCreate]], errors: list) -> tuple[int, int]:
+        """Ghi một lô trong một transaction; lỗi thì thử lại từng sản phẩm. Trả về (số sản phẩm, số variant)."""
+        try:
+            ProductService.insert_many(db, [p for _, p in batch])
+            db.commit()
+            written = batch
+        except SQLAlchemyError:
+            db.rollback()
+            written = []
+            for lines, product in batch:
+                try:
+                    ProductService.insert_many(db, [product])
+                    db.commit()
+                    written.append((lines, product))
+                except SQLAlchemyError as e:
+                    db.rollback()
+                    errors.append({"rows": lines, "error": str(getattr(e, "orig", e)).strip()})
+        category_ids = {p.category_id for _, p in written if p.category_id}
+        CacheService.invalidate(*(f"category:{cid}" for cid in category_ids))
+        return len(written), sum(len(p.variants) for _, p in written)
+
+    @staticmethod
+    def run_job(job_id: str, path: str, kind: str):
+        db = SessionLocal()
+        errors, batch = [], []
+        rows = products = variants = 0
+
+        def flush():
+            nonlocal products, variants
+            if not batch:
+                return
+            written, written_variants = ProductImportService._write_batch(db, batch, errors)
+            products += written
+            variants += written_variants
+            batch.clear()
+            ProductImportService._update(
+                job_id, rows=rows, products=products, variants=variants,
+                failed=len(errors), errors=json.dumps(errors[:MAX_ERRORS]),
+                percentage=min(99, int(rows / total_rows * 100)) if total_rows else 0,
+            )
+
+        try:
+            total_rows = _count_rows(path, kind)
+            if total_rows is not None:
+                ProductImportService._update(job_id, total_rows=total_rows)
+            resolve_category = ProductImportService._category_resolver(db)
+            source = _iter_xlsx(path) if kind == "xlsx" else _iter_csv(path)
+            for start, end, group in ProductImportService._iter_groups(source):
+                rows += len(group)
+                lines = f"{start}" if start == end else f"{start}-{end}"
+                try:
+                    batch.append((lines, ProductImportService._build_product(group, resolve_category)))
+                except (ValidationError, ValueError) as e:
+                    errors.append({"rows": lines, "error": str(e)})
+                if len(batch) >= settings.IMPORT_BATCH_SIZE:
+                    flush()
+            flush()
+            ProductImportService._update(
+                job_id, status="completed", percentage=100, rows=rows, products=products,
+                variants=variants, failed=len(errors), errors=json.dumps(errors[:MAX_ERRORS]),
+                finished_at=time.time(),
+            )
+        except Exception as e:
+            logger.exception("product import %s failed", job_id)
+            ProductImportService._update(job_id, status="failed", error=str(e), finished_at=time.time())
+        finally:
+            db.close()
+            if os.path.exists(path):
+                os.remove(path)
@@ -1,15 +1,54 @@
-from app.core.minio import client
+from app.core.minio import client, public_client
 import os
+import threading
+import time
+from urllib.parse import quote
 from datetime import timedelta
 from app.core.config import settings
 import uuid
+from minio.datatypes import Part
 from minio.error import S3Error
+from functools import wraps
+from app.core.metrics import HistogramRegistry
 MINIO_BUCKET = "files"
+
+# Thời gian mỗi thao tác MinIO (ms), xem tại /metrics/storage
+storage_timings = HistogramRegistry(max_series=50)
+
+_bucket_ready = False
+_bucket_lock = threading.Lock()
+
+
 def ensure_bucket():
-    if not client.bucket_exists(MINIO_BUCKET):
-        client.make_bucket(MINIO_BUCKET)
+    """Kiểm tra/tạo bucket một lần cho mỗi process, các lần sau không gọi mạng."""
+    global _bucket_ready
+    if _bucket_ready:
+        return
+    with _bucket_lock:
+        if not _bucket_ready:
+            if not client.bucket_exists(MINIO_BUCKET):
+                client.make_bucket(MINIO_BUCKET)
+            _bucket_ready = True
+
+
+def _timed(operation: str):
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                storage_timings.observe(f"{operation}:error", (time.perf_counter() - start) * 1000)
+                raise
+            finally:
+                storage_timings.observe(operation, (time.perf_counter() - start) * 1000)
+        return wrapper
+    return decorator
 
 
+
+@_timed("put_object")
 def upload_file(file, content_type: str, length: int = -1, custom_name: str = None) -> str:
     ensure_bucket()
 
@@ -45,15 +84,46 @@ def upload_file(file, content_type: str, length: int = -1, custom_name: str = No
 
 def get_public_url(object_name: str) -> str:
     # Nếu dùng https thì protocol là https, ngược lại là http
-    protocol = "https" if settings.MINIO_SECURE else "http"
+    secure = settings.MINIO_SECURE if settings.MINIO_PUBLIC_SECURE is None else settings.MINIO_PUBLIC_SECURE
+    protocol = "https" if secure else "http"
+    endpoint = settings.MINIO_PUBLIC_ENDPOINT or settings.MINIO_ENDPOINT
     # Cấu trúc URL công khai: http(s)://domain/bucket/object_name
-    return f"{protocol}://{settings.MINIO_ENDPOINT}/{MINIO_BUCKET}/{object_name}"
+    return f"{protocol}://{endpoint}/{MINIO_BUCKET}/{quote(object_name)}"
+
+
+# object_name -> (url, thời điểm hết hạn); URL được dùng lại tới khi còn
+# dưới PRESIGNED_REFRESH_MARGIN giây (lớn hơn CACHE_TTL_SECONDS để URL nằm
+# trong JSON đã cache vẫn còn hạn khi được trả về)
+_presigned_cache: dict[str, tuple[str, float]] = {}
+_presigned_lock = threading.Lock()
+_PRESIGNED_CACHE_MAX = 10000
+
+
+def get_presigned_url(object_name: str) -> tuple[str, int]:
+    """Trả về (url, số giây còn hiệu lực). Ký offline, không gọi mạng."""
+    now = time.time()
+    cached = _presigned_cache.get(object_name)
+    if cached and cached[1] - now > settings.PRESIGNED_REFRESH_MARGIN:
+        return cached[0], int(cached[1] - now)
+
+    expire = settings.MINIO_PRESIGNED_EXPIRE
+    url = public_client.presigned_get_object(MINIO_BUCKET, object_name, expires=timedelta(seconds=expire))
+    with _presigned_lock:
+        if len(_presigned_cache) >= _PRESIGNED_CACHE_MAX:
+            _presigned_cache.clear()
+        _presigned_cache[object_name] = (url, now + expire)
+    return url, expire
 
 
-def get_presigned_url(object_name: str) -> str:
-    # Theo yêu cầu mới, chúng ta dùng URL công khai vĩnh viễn
-    return get_public_url(object_name)
+def get_direct_url(object_name: str) -> str | None:
+    """URL tải thẳng từ MinIO theo FILE_SERVING_MODE; None khi phục vụ qua API (proxy)."""
+    if settings.FILE_SERVING_MODE == "presigned":
+        return get_presigned_url(object_name)[0]
+    if settings.FILE_SERVING_MODE == "public":
+        return get_public_url(object_name)
+    return None
 
+@_timed("remove_object")
 def delete_object(name: str) -> bool:
     ensure_bucket()
     try:
@@ -64,6 +134,105 @@ def delete_object(name: str) -> bool:
         return True
     except S3Error as e:
         return False
-def get_object(name: str):
+
+
+@_timed("get_object")
+def get_object(name: str, offset: int = 0, length: int = 0):
+    """length=0: đọc đến hết object; offset/length map sang header Range của S3."""
+    ensure_bucket()
+    return client.get_object(MINIO_BUCKET, name, offset=offset, length=length)
+
+
+@_timed("stat_object")
+def stat_object(name: str):
+    ensure_bucket()
+    return client.stat_object(MINIO_BUCKET, name)
+
+
+def iter_object(response, chunk_size: int = 64 * 1024):
+    """Stream body của get_object theo khối và luôn trả kết nối về pool."""
+    try:
+        yield from response.stream(chunk_size)
+    finally:
+        response.close()
+        response.release_conn()
+
+
+# ===== Multipart upload (mỗi chunk của client = một part S3) =====
+class _MultipartAdapter:
+    """
+    Chỗ duy nhất gọi API multipart *private* của minio-py (_create_multipart_upload,
+    _upload_part, _complete_multipart_upload, _abort_multipart_upload): minio-py
+    không có API public để upload từng part riêng lẻ. Chữ ký đã kiểm tra với
+    phiên bản minio pin trong requirements.txt; khi nâng minio hãy kiểm tra lại
+    lớp này. Thiếu hàm nào thì báo lỗi ngay lúc import thay vì lúc upload.
+    """
+
+    _METHODS = ("_create_multipart_upload", "_upload_part", "_complete_multipart_upload", "_abort_multipart_upload")
+
+    def __init__(self, minio_client):
+        missing = [name for name in self._METHODS if not hasattr(minio_client, name)]
+        if missing:
+            raise RuntimeError(f"Installed minio package lacks multipart methods: {', '.join(missing)}")
+        self._client = minio_client
+
+    def create(self, object_name: str, content_type: str) -> str:
+        return self._client._create_multipart_upload(
+            bucket_name=MINIO_BUCKET,
+            object_name=object_name,
+            headers={"Content-Type": content_type},
+        )
+
+    def upload_part(self, object_name: str, s3_upload_id: str, part_number: int, data: bytes) -> str:
+        return self._client._upload_part(
+            bucket_name=MINIO_BUCKET,
+            object_name=object_name,
+            data=data,
+            headers=None,
+            upload_id=s3_upload_id,
+            part_number=part_number,
+        )
+
+    def complete(self, object_name: str, s3_upload_id: str, parts: list[tuple[int, str]]):
+        return self._client._complete_multipart_upload(
+            bucket_name=MINIO_BUCKET,
+            object_name=object_name,
+            upload_id=s3_upload_id,
+            parts=[Part(number, etag) for number, etag in parts],
+        )
+
+    def abort(self, object_name: str, s3_upload_id: str):
+        self._client._abort_multipart_upload(
+            bucket_name=MINIO_BUCKET,
+            object_name=object_name,
+            upload_id=s3_upload_id,
+        )
+
+
+_multipart = _MultipartAdapter(client)
+
+
+@_timed("create_multipart_upload")
+def create_multipart_upload(object_name: str, content_type: str) -> str:
     ensure_bucket()
-    return client.get_object(MINIO_BUCKET, name)
+    return _multipart.create(object_name, content_type)
+
+
+@_timed("upload_part")
+def upload_part(object_name: str, s3_upload_id: str, part_number: int, data: bytes) -> str:
+    """Upload một part (part_number bắt đầu từ 1), trả về etag của part."""
+    return _multipart.upload_part(object_name, s3_upload_id, part_number, data)
+
+
+@_timed("complete_multipart_upload")
+def complete_multipart_upload(object_name: str, s3_upload_id: str, parts: list[tuple[int, str]]):
+    """parts: danh sách (part_number, etag) theo thứ tự tăng dần."""
+    return _multipart.complete(object_name, s3_upload_id, parts)
+
+
+@_timed("abort_multipart_upload")
+def abort_multipart_upload(object_name: str, s3_upload_id: str):
+    try:
+        _multipart.abort(object_name, s3_upload_id)
+    except S3Error:
+        pass
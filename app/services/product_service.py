@@ -1,145 +1,382 @@
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import func, insert, update, delete
+from sqlalchemy.orm import Session, selectinload, noload
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.product import Product, ProductVariant, VariantAttribute, Category, ProductMedia
-from app.schemas.product import ProductCreate, ProductUpdate, ProductVariantCreate
+from typing import List
+from pydantic import TypeAdapter
+from app.schemas.product import ProductCreate, ProductUpdate, ProductVariantCreate, ProductPage
+from app.schemas.product import Product as ProductSchema
+from app.services.cache_service import CacheService
+from app.services.category_service import CategorySnapshot
+from app.services.product_summary_service import ProductSummaryService
+from app.services.common import paginate_cursor_by_id, normalize_text, escape_like, Projection
+
+_product_list_adapter = TypeAdapter(List[ProductSchema])
+
+# Quan hệ của Product có thể chọn qua expand=
+PRODUCT_RELATIONS = ("category", "thumbnail", "media", "variants")
+
+
+def normalized_name():
+    return func.lower(func.f_unaccent(Product.name))
+
+
+def name_contains(term: str):
+    """Lọc "tên chứa term" không dấu; dùng được GIN trigram index ix_products_name_trgm."""
+    return normalized_name().like(f"%{escape_like(normalize_text(term))}%", escape="\\")
+
 
 class ProductService:
     @staticmethod
-    def get_all(db: Session, skip: int = 0, limit: int = 100, name: str = None, category_id: int = None):
+    def projection(fields: str = None, expand: str = None) -> Projection:
+        return Projection(ProductSchema, PRODUCT_RELATIONS, fields, expand)
+
+    @staticmethod
+    def _load_options(expand=PRODUCT_RELATIONS):
+        # The page query only selects product rows (LIMIT applies to products,
+        # no subquery wrap); each relationship is then fetched with a single
+        # "WHERE fk IN (...)" query instead of a joined cartesian product.
+        # Relationships not in expand are not queried at all (noload).
+        loaders = {
+            "thumbnail": (selectinload(Product.thumbnail),),
+            "media": (selectinload(Product.media).selectinload(ProductMedia.file),),
+            "variants": (
+                selectinload(Product.variants).selectinload(ProductVariant.attributes),
+                selectinload(Product.variants).selectinload(ProductVariant.image),
+            ),
+            "category": (selectinload(Product.category).selectinload(Category.thumbnail),),
+        }
+        options = []
+        for relation, relation_loaders in loaders.items():
+            if relation in expand:
+                options += relation_loaders
+            else:
+                options.append(noload(getattr(Product, relation)))
+        return tuple(options)
+
+    @staticmethod
+    def _filtered_query(db: Session, name: str = None, category_id: int = None):
         query = db.query(Product)
         
         if name:
-            query = query.filter(Product.name.ilike(f"%{name}%"))
+            query = query.filter(name_contains(name))
         
         if category_id:
             query = query.filter(Product.category_id == category_id)
 
-        return query.options(
-            joinedload(Product.thumbnail),
-            joinedload(Product.media).joinedload(ProductMedia.file),
-            joinedload(Product.variants).joinedload(ProductVariant.attributes),
-            joinedload(Product.variants).joinedload(ProductVariant.image),
-            joinedload(Product.category)
-        ).offset(skip).limit(limit).all()
+        return query
 
     @staticmethod
-    def get_by_category_slug(db: Session, slug: str, skip: int = 0, limit: int = 100):
-        return db.query(Product).join(Product.category).options(
-            joinedload(Product.thumbnail),
-            joinedload(Product.media).joinedload(ProductMedia.file),
-            joinedload(Product.variants).joinedload(ProductVariant.attributes),
-            joinedload(Product.variants).joinedload(ProductVariant.image),
-            joinedload(Product.category)
-        ).filter(Category.slug == slug).offset(skip).limit(limit).all()
+    def get_all(db: Session, skip: int = 0, limit: int = 100, name: str = None, category_id: int = None,
+                expand=PRODUCT_RELATIONS):
+        query = ProductService._filtered_query(db, name=name, category_id=category_id)
+        return query.options(*ProductService._load_options(expand)) \
+            .order_by(Product.id.desc()).offset(skip).limit(limit).all()
 
     @staticmethod
-    def get_by_id(db: Session, product_id: int):
-        return db.query(Product).options(
-            joinedload(Product.thumbnail),
-            joinedload(Product.media).joinedload(ProductMedia.file),
-            joinedload(Product.variants).joinedload(ProductVariant.attributes),
-            joinedload(Product.variants).joinedload(ProductVariant.image),
-            joinedload(Product.category)
-        ).filter(Product.id == product_id).first()
+    def get_all_cursor(db: Session, limit: int = 100, cursor: str = None, name: str = None, category_id: int = None,
+                       expand=PRODUCT_RELATIONS):
+        query = ProductService._filtered_query(db, name=name, category_id=category_id)
+        return paginate_cursor_by_id(
+            query.options(*ProductService._load_options(expand)), Product, limit=limit, cursor=cursor
+        )
 
     @staticmethod
-    def create(db: Session, product_in: ProductCreate):
-        # Create Product
-        db_product = Product(
-            name=product_in.name,
-            description=product_in.description,
-            category_id=product_in.category_id,
-            thumbnail_id=product_in.thumbnail_id
+    def _category_query(db: Session, category_id: int, expand=PRODUCT_RELATIONS):
+        # slug -> id đã lấy từ snapshot danh mục trong RAM, không JOIN categories
+        return db.query(Product).options(*ProductService._load_options(expand)) \
+            .filter(Product.category_id == category_id)
+
+    @staticmethod
+    def get_by_category_slug(db: Session, slug: str, skip: int = 0, limit: int = 100, expand=PRODUCT_RELATIONS):
+        category_id = CategorySnapshot.category_id(db, slug)
+        if category_id is None:
+            return []
+        return ProductService._category_query(db, category_id, expand) \
+            .order_by(Product.id.desc()).offset(skip).limit(limit).all()
+
+    @staticmethod
+    def get_by_category_slug_cursor(db: Session, slug: str, limit: int = 100, cursor: str = None,
+                                    expand=PRODUCT_RELATIONS):
+        category_id = CategorySnapshot.category_id(db, slug)
+        if category_id is None:
+            return {"items": [], "next_cursor": None, "has_more": False}
+        return paginate_cursor_by_id(
+            ProductService._category_query(db, category_id, expand), Product, limit=limit, cursor=cursor
         )
-        db.add(db_product)
-        db.flush() # Get product ID
-
-        # Create Media
-        for idx, file_id in enumerate(product_in.media_ids):
-            db_media = ProductMedia(
-                product_id=db_product.id,
-                file_id=file_id,
-                position=idx
-            )
-            db.add(db_media)
-
-        # Create Variants
-        for v_in in product_in.variants:
-            db_variant = ProductVariant(
-                product_id=db_product.id,
-                price=v_in.price,
-                stock=v_in.stock,
-                image_id=v_in.image_id
+
+    @staticmethod
+    def get_by_id(db: Session, product_id: int, expand=PRODUCT_RELATIONS):
+        return db.query(Product).options(*ProductService._load_options(expand)) \
+            .filter(Product.id == product_id).first()
+
+    @staticmethod
+    def _cache_tags(products) -> list[str]:
+        tags = []
+        for p in products:
+            tags.append(f"product:{p.id}")
+            if p.category_id:
+                tags.append(f"category:{p.category_id}")
+            file_ids = [p.thumbnail_id]
+            file_ids += [m.file_id for m in p.media]
+            file_ids += [v.image_id for v in p.variants]
+            if p.category:
+                file_ids.append(p.category.thumbnail_id)
+            tags += [f"file:{fid}" for fid in file_ids if fid]
+        return tags
+
+    @staticmethod
+    def _invalidate(product_id: int, *category_ids: int):
+        CacheService.invalidate(
+            f"product:{product_id}",
+            *(f"category:{cid}" for cid in category_ids if cid)
+        )
+
+    @staticmethod
+    def _dump_list(items, projection: Projection) -> bytes:
+        return _product_list_adapter.dump_json(
+            _product_list_adapter.validate_python(items, from_attributes=True),
+            include=projection.list_include()
+        )
+
+    @staticmethod
+    def _dump_page(page: dict, projection: Projection) -> bytes:
+        return ProductPage.model_validate(page, from_attributes=True) \
+            .model_dump_json(include=projection.page_include()).encode()
+
+    @staticmethod
+    def get_all_json(db: Session, skip: int = 0, limit: int = 100, name: str = None, category_id: int = None,
+                     cursor: str = None, cursor_mode: bool = False, projection: Projection = None) -> bytes:
+        # Tìm theo tên / lọc tùy ý: không cache (tổ hợp key quá rộng)
+        projection = projection or ProductService.projection()
+        if cursor_mode:
+            page = ProductService.get_all_cursor(
+                db, limit=limit, cursor=cursor, name=name, category_id=category_id, expand=projection.expand
             )
-            db.add(db_variant)
-            db.flush() # Get variant ID
-            
-            # Create Attributes
-            for a_in in v_in.attributes:
-                db_attr = VariantAttribute(
-                    variant_id=db_variant.id,
-                    name=a_in.name,
-                    value=a_in.value,
-                    unit=a_in.unit
-                )
-                db.add(db_attr)
+            return ProductService._dump_page(page, projection)
+        items = ProductService.get_all(
+            db, skip=skip, limit=limit, name=name, category_id=category_id, expand=projection.expand
+        )
+        return ProductService._dump_list(items, projection)
+
+    @staticmethod
+    def get_by_id_json(db: Session, product_id: int, projection: Projection = None) -> bytes | None:
+        projection = projection or ProductService.projection()
+
+        def build():
+            product = ProductService.get_by_id(db, product_id, expand=projection.expand)
+            if not product:
+                return None
+            payload = ProductSchema.model_validate(product).model_dump_json(include=projection.include).encode()
+            return payload, ProductService._cache_tags([product])
+
+        return CacheService.read_through(f"product:{product_id}{projection.cache_suffix()}", build)
+
+    @staticmethod
+    def get_by_category_slug_json(db: Session, slug: str, skip: int = 0, limit: int = 100,
+                                  cursor: str = None, cursor_mode: bool = False,
+                                  projection: Projection = None) -> bytes:
+        projection = projection or ProductService.projection()
+        if cursor_mode:
+            key = f"products:category:{slug}:cursor:{cursor or ''}:{limit}"
+        else:
+            key = f"products:category:{slug}:offset:{skip}:{limit}"
+        key += projection.cache_suffix()
 
+        def build():
+            category_id = CategorySnapshot.category_id(db, slug)
+            if category_id is None:
+                # Slug không tồn tại: không cache, danh mục tạo sau đó phải thấy ngay
+                return None
+            # Gắn tag theo id danh mục để sản phẩm mới trong danh mục (kể cả khi
+            # trang đang rỗng) cũng làm mất hiệu lực trang này
+            query = ProductService._category_query(db, category_id, projection.expand)
+            if cursor_mode:
+                page = paginate_cursor_by_id(query, Product, limit=limit, cursor=cursor)
+                payload = ProductService._dump_page(page, projection)
+                items = page["items"]
+            else:
+                items = query.order_by(Product.id.desc()).offset(skip).limit(limit).all()
+                payload = ProductService._dump_list(items, projection)
+            tags = [f"category_slug:{slug}", f"category:{category_id}"]
+            return payload, tags + ProductService._cache_tags(items)
+
+        payload = CacheService.read_through(key, build)
+        if payload is None:
+            if cursor_mode:
+                return ProductService._dump_page({"items": [], "next_cursor": None, "has_more": False}, projection)
+            return ProductService._dump_list([], projection)
+        return payload
+
+    @staticmethod
+    def _insert_variants(db: Session, pairs: list[tuple[int, ProductVariantCreate]]):
+        """INSERT ... RETURNING cho cả danh sách (product_id, variant), rồi một INSERT cho mọi attribute."""
+        if not pairs:
+            return
+        variant_ids = db.scalars(
+            insert(ProductVariant).returning(ProductVariant.id, sort_by_parameter_order=True),
+            [
+                {"product_id": product_id, "price": v.price, "stock": v.stock, "image_id": v.image_id}
+                for product_id, v in pairs
+            ],
+        ).all()
+        attribute_rows = [
+            {"variant_id": variant_id, "name": a.name, "value": a.value, "unit": a.unit}
+            for variant_id, (_, v) in zip(variant_ids, pairs)
+            for a in v.attributes
+        ]
+        if attribute_rows:
+            db.execute(insert(VariantAttribute), attribute_rows)
+
+    @staticmethod
+    def insert_many(db: Session, products_in: List[ProductCreate]) -> List[int]:
+        """
+        Ghi cả lô sản phẩm bằng INSERT ... RETURNING nhiều dòng: mỗi bảng
+        (product, media, variant, attribute) một câu lệnh cho cả lô thay vì
+        flush từng variant. Không commit; trả về id sản phẩm theo thứ tự đầu vào.
+        """
+        if not products_in:
+            return []
+        product_ids = db.scalars(
+            insert(Product).returning(Product.id, sort_by_parameter_order=True),
+            [
+                {"name": p.name, "description": p.description,
+                 "category_id": p.category_id, "thumbnail_id": p.thumbnail_id}
+                for p in products_in
+            ],
+        ).all()
+
+        media_rows = [
+            {"product_id": product_id, "file_id": file_id, "position": idx}
+            for product_id, p in zip(product_ids, products_in)
+            for idx, file_id in enumerate(p.media_ids)
+        ]
+        if media_rows:
+            db.execute(insert(ProductMedia), media_rows)
+
+        ProductService._insert_variants(
+            db, [(product_id, v) for product_id, p in zip(product_ids, products_in) for v in p.variants]
+        )
+        ProductSummaryService.refresh(db, product_ids)
+        return product_ids
+
+    @staticmethod
+    def create(db: Session, product_in: ProductCreate):
+        # 3-4 câu lệnh cho cả sản phẩm, không phụ thuộc số variant
+        product_id = ProductService.insert_many(db, [product_in])[0]
         db.commit()
-        db.refresh(db_product)
-        return db_product
+        ProductService._invalidate(product_id, product_in.category_id)
+        return ProductService.get_by_id(db, product_id)
+
+    @staticmethod
+    def _sync_variants(db: Session, db_product: Product, variants_in: List[ProductVariantCreate]):
+        """
+        So với variant hiện có (khớp theo id): chỉ UPDATE variant/attribute thay
+        đổi, INSERT cái mới, DELETE cái bị bỏ. Variant giữ nguyên id; variant
+        không gửi id được coi là mới.
+        """
+        existing = {v.id: v for v in db_product.variants}
+        kept = set()
+        new_pairs, variant_updates = [], []
+        attr_inserts, attr_updates, attr_deletes = [], [], []
+
+        for v_in in variants_in:
+            current = existing.get(v_in.id) if v_in.id is not None else None
+            if current is None or current.id in kept:
+                new_pairs.append((db_product.id, v_in))
+                continue
+            kept.add(current.id)
+            if (float(current.price), current.stock, current.image_id) != (v_in.price, v_in.stock, v_in.image_id):
+                variant_updates.append(
+                    {"id": current.id, "price": v_in.price, "stock": v_in.stock, "image_id": v_in.image_id}
+                )
+
+            # Attribute khớp theo tên trong variant
+            current_attrs = {a.name: a for a in current.attributes}
+            seen = set()
+            for a_in in v_in.attributes:
+                attr = current_attrs.get(a_in.name)
+                if attr is None or a_in.name in seen:
+                    attr_inserts.append(
+                        {"variant_id": current.id, "name": a_in.name, "value": a_in.value, "unit": a_in.unit}
+                    )
+                elif (float(attr.value), attr.unit) != (a_in.value, a_in.unit):
+                    attr_updates.append({"id": attr.id, "value": a_in.value, "unit": a_in.unit})
+                seen.add(a_in.name)
+            attr_deletes += [a.id for name, a in current_attrs.items() if name not in seen]
+
+        # Attribute của variant bị xóa đi theo ON DELETE CASCADE
+        removed = [vid for vid in existing if vid not in kept]
+        if removed:
+            db.execute(delete(ProductVariant).where(ProductVariant.id.in_(removed)),
+                       execution_options={"synchronize_session": False})
+        if variant_updates:
+            db.execute(update(ProductVariant), variant_updates)
+        if attr_deletes:
+            db.execute(delete(VariantAttribute).where(VariantAttribute.id.in_(attr_deletes)),
+                       execution_options={"synchronize_session": False})
+        if attr_updates:
+            db.execute(update(VariantAttribute), attr_updates)
+        if attr_inserts:
+            db.execute(insert(VariantAttribute), attr_inserts)
+        ProductService._insert_variants(db, new_pairs)
+
+    @staticmethod
+    def _sync_media(db: Session, db_product: Product, media_ids: List[str]):
+        """Như _sync_variants cho media: giữ dòng còn dùng (chỉ sửa position nếu đổi chỗ)."""
+        current = sorted(db_product.media, key=lambda m: m.position)
+        if [m.file_id for m in current] == media_ids:
+            return
+        by_file = {}
+        for m in current:
+            by_file.setdefault(m.file_id, []).append(m)
+        updates, inserts = [], []
+        for idx, file_id in enumerate(media_ids):
+            matches = by_file.get(file_id)
+            if matches:
+                m = matches.pop(0)
+                if m.position != idx:
+                    updates.append({"id": m.id, "position": idx})
+            else:
+                inserts.append({"product_id": db_product.id, "file_id": file_id, "position": idx})
+        deletes = [m.id for matches in by_file.values() for m in matches]
+        if deletes:
+            db.execute(delete(ProductMedia).where(ProductMedia.id.in_(deletes)),
+                       execution_options={"synchronize_session": False})
+        if updates:
+            db.execute(update(ProductMedia), updates)
+        if inserts:
+            db.execute(insert(ProductMedia), inserts)
 
     @staticmethod
     def update(db: Session, product_id: int, product_in: ProductUpdate):
         db_product = ProductService.get_by_id(db, product_id)
         if not db_product:
             return None
+        old_category_id = db_product.category_id
         
         update_data = product_in.model_dump(exclude_unset=True)
         
         # Handle variants if provided
         if "variants" in update_data:
-            variants_data = update_data.pop("variants")
-            # Delete old variants
-            db.query(ProductVariant).filter(ProductVariant.product_id == product_id).delete()
-            # Create new variants
-            for v_in in variants_data:
-                db_variant = ProductVariant(
-                    product_id=product_id,
-                    price=v_in["price"],
-                    stock=v_in["stock"],
-                    image_id=v_in.get("image_id")
-                )
-                db.add(db_variant)
-                db.flush()
-                for a_in in v_in.get("attributes", []):
-                    db_attr = VariantAttribute(
-                        variant_id=db_variant.id,
-                        name=a_in["name"],
-                        value=a_in["value"],
-                        unit=a_in["unit"]
-                    )
-                    db.add(db_attr)
+            update_data.pop("variants")
+            ProductService._sync_variants(db, db_product, product_in.variants)
 
         # Handle media if provided
         if "media_ids" in update_data:
-            media_ids = update_data.pop("media_ids")
-            # Delete old media associations
-            db.query(ProductMedia).filter(ProductMedia.product_id == product_id).delete()
-            # Create new media associations
-            for idx, file_id in enumerate(media_ids):
-                db_media = ProductMedia(
-                    product_id=product_id,
-                    file_id=file_id,
-                    position=idx
-                )
-                db.add(db_media)
+            ProductService._sync_media(db, db_product, update_data.pop("media_ids"))
 
-        # Update other fields
+        # Update other fields (ORM chỉ UPDATE cột thực sự đổi)
         for field, value in update_data.items():
             setattr(db_product, field, value)
-            
+
+        db.flush()
+        ProductSummaryService.refresh(db, [product_id])
         db.commit()
-        db.refresh(db_product)
-        return db_product
+        ProductService._invalidate(product_id, old_category_id, db_product.category_id)
+        # Các thay đổi hàng loạt ở trên không đi qua identity map: nạp lại aggregate
+        db.expire_all()
+        return ProductService.get_by_id(db, product_id)
 
     @staticmethod
     def delete(db: Session, product_id: int):
@@ -147,6 +384,54 @@ class ProductService:
         if not db_product:
             return False
         
+        category_id = db_product.category_id
         db.delete(db_product)
         db.commit()
+        ProductService._invalidate(product_id, category_id)
         return True
+
+
+def _to_schema(product):
+    return ProductSchema.model_validate(product) if product else None
+
+
+class AsyncProductService:
+    """
+    Async version of ProductService. The sync logic runs on the asyncpg
+    connection through AsyncSession.run_sync (greenlet), so waiting on Postgres
+    does not hold a threadpool worker. Results are converted to schemas inside
+    run_sync because lazy loads outside the greenlet are not allowed.
+    """
+
+    @staticmethod
+    async def get_all_json(db: AsyncSession, skip: int = 0, limit: int = 100, name: str = None,
+                           category_id: int = None, cursor: str = None, cursor_mode: bool = False,
+                           projection: Projection = None) -> bytes:
+        return await db.run_sync(lambda s: ProductService.get_all_json(
+            s, skip=skip, limit=limit, name=name, category_id=category_id,
+            cursor=cursor, cursor_mode=cursor_mode, projection=projection
+        ))
+
+    @staticmethod
+    async def get_by_category_slug_json(db: AsyncSession, slug: str, skip: int = 0, limit: int = 100,
+                                        cursor: str = None, cursor_mode: bool = False,
+                                        projection: Projection = None) -> bytes:
+        return await db.run_sync(lambda s: ProductService.get_by_category_slug_json(
+            s, slug, skip=skip, limit=limit, cursor=cursor, cursor_mode=cursor_mode, projection=projection
+        ))
+
+    @staticmethod
+    async def get_by_id_json(db: AsyncSession, product_id: int, projection: Projection = None) -> bytes | None:
+        return await db.run_sync(lambda s: ProductService.get_by_id_json(s, product_id, projection))
+
+    @staticmethod
+    async def create(db: AsyncSession, product_in: ProductCreate):
+        return await db.run_sync(lambda s: _to_schema(ProductService.create(s, product_in)))
+
+    @staticmethod
+    async def update(db: AsyncSession, product_id: int, product_in: ProductUpdate):
+        return await db.run_sync(lambda s: _to_schema(ProductService.update(s, product_id, product_in)))
+
+    @staticmethod
+    async def delete(db: AsyncSession, product_id: int) -> bool:
+        return await db.run_sync(lambda s: ProductService.delete(s, product_id))
@@ -0,0 +1,69 @@
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, joinedload, load_only, noload
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.file import File
+from app.models.product import Product, ProductVariant, ProductSummary
+from app.schemas.product import ProductSummaryPage
+from app.services.common import paginate_cursor_by_id
+
+_SUMMARY_COLUMNS = [
+    "id", "category_id", "name", "thumbnail_id",
+    "min_price", "max_price", "total_stock", "variant_count", "updated_at",
+]
+
+
+class ProductSummaryService:
+    """
+    Bảng product_summaries: một dòng gọn cho mỗi sản phẩm (tên, thumbnail,
+    giá thấp/cao nhất, tổng tồn kho). ProductService gọi refresh() trong cùng
+    transaction với mỗi lần ghi nên bảng luôn khớp; xóa sản phẩm thì dòng tự
+    mất theo ON DELETE CASCADE.
+    """
+
+    @staticmethod
+    def refresh(db: Session, product_ids: list[int]):
+        """Tính lại tóm tắt của các sản phẩm bằng một câu INSERT ... SELECT ... ON CONFLICT."""
+        if not product_ids:
+            return
+        source = (
+            select(
+                Product.id,
+                Product.category_id,
+                Product.name,
+                Product.thumbnail_id,
+                func.min(ProductVariant.price),
+                func.max(ProductVariant.price),
+                func.coalesce(func.sum(ProductVariant.stock), 0),
+                func.count(ProductVariant.id),
+                func.now(),
+            )
+            .outerjoin(ProductVariant, ProductVariant.product_id == Product.id)
+            .where(Product.id.in_(product_ids))
+            .group_by(Product.id)
+        )
+        stmt = pg_insert(ProductSummary).from_select(_SUMMARY_COLUMNS, source)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ProductSummary.id],
+            set_={c: getattr(stmt.excluded, c) for c in _SUMMARY_COLUMNS if c != "id"},
+        )
+        db.execute(stmt)
+
+    @staticmethod
+    def get_page(db: Session, limit: int = 100, cursor: str = None, category_id: int = None) -> dict:
+        # Thumbnail là quan hệ nhiều-một: JOIN không nhân số dòng, chỉ lấy cột cần
+        query = db.query(ProductSummary).options(
+            joinedload(ProductSummary.thumbnail).options(load_only(File.id, File.file_url), noload(File.stored))
+        )
+        if category_id:
+            query = query.filter(ProductSummary.category_id == category_id)
+        return paginate_cursor_by_id(query, ProductSummary, limit=limit, cursor=cursor)
+
+
+class AsyncProductSummaryService:
+    @staticmethod
+    async def get_page(db: AsyncSession, limit: int = 100, cursor: str = None, category_id: int = None):
+        return await db.run_sync(lambda s: ProductSummaryPage.model_validate(
+            ProductSummaryService.get_page(s, limit=limit, cursor=cursor, category_id=category_id),
+            from_attributes=True
+        ))
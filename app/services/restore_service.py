@@ -0,0 +1,170 @@
+import json
+import logging
+import mimetypes
+import os
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from sqlalchemy import text
+from app.core.config import settings
+from app.core.minio import client
+from app.db.session import engine, SessionLocal
+from app.db.utils import sync_sequence
+from app.models.file import File, StoredObject
+from app.services.minio import MINIO_BUCKET, ensure_bucket
+from app.services.cache_service import CacheService
+from app.services.db_dump_service import DbDumpService, PLAIN_ENTRY, CUSTOM_ENTRY, DIRECTORY_PREFIX
+from app.services.backup_jobs import BackupJobs, STATUS_COMPLETED, STATUS_FAILED
+from app.services.backup_service import BACKUP_BUCKET
+
+logger = logging.getLogger(__name__)
+
+FILES_PREFIX = "files/"
+PART_SIZE = 16 * 1024 * 1024
+
+# Mọi cột id lấy giá trị từ sequence (serial hoặc identity) trong schema public
+_SEQUENCE_COLUMNS_SQL = text("""
+    SELECT table_name, column_name FROM information_schema.columns
+    WHERE table_schema = 'public'
+      AND (column_default LIKE 'nextval(%' OR is_identity = 'YES')
+""")
+
+
+class RestoreService:
+    """
+    Khôi phục một archive do BackupService tạo ra:
+      1. nạp DB (pg_restore -j cho dump custom/directory, psql cho SQL thuần)
+      2. đồng bộ lại mọi sequence theo MAX(id)
+      3. đẩy các object files/* lên MinIO song song, đọc thẳng từ entry của zip
+    Chỉ phần dump DB được giải nén ra đĩa (pg_restore -j cần file seek được);
+    object được stream từ zip lên MinIO, không giải nén.
+    Archive incremental chỉ chứa object đã đổi: restore bản full trước rồi lần
+    lượt các bản incremental.
+    """
+
+    @staticmethod
+    def _db_format(names: list[str]) -> str | None:
+        if any(n.startswith(DIRECTORY_PREFIX) for n in names):
+            return "directory"
+        if CUSTOM_ENTRY in names:
+            return "custom"
+        if PLAIN_ENTRY in names:
+            return "plain"
+        return None
+
+    @staticmethod
+    def _restore_database(zipf: zipfile.ZipFile, fmt: str, work_dir: str):
+        names = zipf.namelist()
+        if fmt == "directory":
+            members = [n for n in names if n.startswith(DIRECTORY_PREFIX)]
+            zipf.extractall(work_dir, members)
+            path = os.path.join(work_dir, DIRECTORY_PREFIX.rstrip("/"))
+        else:
+            entry = CUSTOM_ENTRY if fmt == "custom" else PLAIN_ENTRY
+            path = zipf.extract(entry, work_dir)
+        DbDumpService.restore(path, fmt)
+
+    @staticmethod
+    def sync_sequences() -> int:
+        """Sau khi nạp dữ liệu có sẵn id: đưa mọi sequence về MAX(id) để insert mới không trùng khóa."""
+        with engine.begin() as conn:
+            columns = conn.execute(_SEQUENCE_COLUMNS_SQL).all()
+            for table_name, column_name in columns:
+                sync_sequence(conn, table_name, column_name)
+        return len(columns)
+
+    @staticmethod
+    def _content_types() -> dict[str, str]:
+        """Content-Type của object gốc theo bảng files (tên object không phải lúc nào cũng có đuôi file)."""
+        db = SessionLocal()
+        try:
+            return dict(db.query(StoredObject.file_path, File.mime_type).join(File.stored).all())
+        finally:
+            db.close()
+
+    @staticmethod
+    def _upload_entry(zipf: zipfile.ZipFile, info: zipfile.ZipInfo, content_type: str) -> int:
+        # ZipFile đọc qua file chia sẻ có khóa nên nhiều thread mở entry cùng lúc được
+        with zipf.open(info) as src:
+            client.put_object(
+                MINIO_BUCKET, info.filename[len(FILES_PREFIX):], src,
+                length=info.file_size, content_type=content_type, part_size=PART_SIZE,
+            )
+        return info.file_size
+
+    @staticmethod
+    def _restore_objects(zipf: zipfile.ZipFile, content_types: dict[str, str], progress) -> int:
+        entries = [i for i in zipf.infolist() if i.filename.startswith(FILES_PREFIX) and not i.is_dir()]
+        total_bytes = sum(i.file_size for i in entries) or 1
+        done = 0
+        ensure_bucket()
+        with ThreadPoolExecutor(max_workers=max(1, settings.BACKUP_WORKERS)) as pool:
+            futures = []
+            for info in entries:
+                name = info.filename[len(FILES_PREFIX):]
+                content_type = content_types.get(name) or mimetypes.guess_type(name)[0] or "application/octet-stream"
+                futures.append(pool.submit(RestoreService._upload_entry, zipf, info, content_type))
+            for idx, future in enumerate(as_completed(futures)):
+                done += future.result()
+                progress(40 + int(done / total_bytes * 55), f"Đang khôi phục file ({idx+1}/{len(entries)})...")
+        return len(entries)
+
+    @staticmethod
+    def run_from_backup(job_id: str, source: dict):
+        """Restore từ một backup đã lưu (job trong lịch sử); archive trên MinIO được tải về trước."""
+        if source.get("storage") != "minio":
+            return RestoreService.run_job(job_id, source["location"])
+        temp_root = os.path.join(settings.ROOT_DIR, "tmp_backup")
+        archive_path = os.path.join(temp_root, f"restore_{job_id}.zip")
+        try:
+            os.makedirs(temp_root, exist_ok=True)
+            BackupJobs.update(job_id, current_step="Đang tải archive từ MinIO...")
+            with BackupJobs.hold(job_id):
+                client.fget_object(BACKUP_BUCKET, source["location"], archive_path)
+        except Exception as e:
+            BackupJobs.finish(job_id, STATUS_FAILED, current_step=f"Lỗi: {str(e)}")
+            BackupJobs.release(job_id)
+            return
+        RestoreService.run_job(job_id, archive_path, remove_archive=True)
+
+    @staticmethod
+    def run_job(job_id: str, archive_path: str, remove_archive: bool = False):
+        """Background task của POST /backup/restore; lock đã được lấy bởi BackupService.start()."""
+        progress = BackupJobs.progress_reporter(job_id)
+        work_dir = tempfile.mkdtemp(prefix="restore_", dir=os.path.dirname(archive_path))
+        try:
+            with BackupJobs.hold(job_id), zipfile.ZipFile(archive_path) as zipf:
+                names = zipf.namelist()
+                manifest = json.loads(zipf.read("manifest.json")) if "manifest.json" in names else None
+
+                fmt = RestoreService._db_format(names)
+                if fmt:
+                    BackupJobs.update(job_id, percentage=5, current_step="Đang nạp Database...")
+                    RestoreService._restore_database(zipf, fmt, work_dir)
+                    BackupJobs.update(job_id, percentage=35, current_step="Đang đồng bộ sequence...")
+                    RestoreService.sync_sequences()
+
+                BackupJobs.update(job_id, percentage=40, current_step="Đang khôi phục file...")
+                count = RestoreService._restore_objects(zipf, RestoreService._content_types(), progress)
+
+                for name in (manifest or {}).get("deleted", []):
+                    client.remove_object(MINIO_BUCKET, name)
+
+            # DB và object đã đổi: cache cũ không còn đúng; manifest của archive thành mốc incremental
+            CacheService.clear()
+            if manifest:
+                BackupJobs.save_manifest(manifest)
+            BackupJobs.finish(
+                job_id, STATUS_COMPLETED,
+                percentage=100, current_step="Khôi phục hoàn tất!",
+                objects=count, size=os.path.getsize(archive_path),
+            )
+        except Exception as e:
+            logger.exception("restore job %s failed", job_id)
+            BackupJobs.finish(job_id, STATUS_FAILED, current_step=f"Lỗi: {str(e)}")
+        finally:
+            BackupJobs.release(job_id)
+            shutil.rmtree(work_dir, ignore_errors=True)
+            if remove_archive and os.path.exists(archive_path):
+                os.remove(archive_path)
@@ -0,0 +1,66 @@
+import re
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.product import Product
+from app.services.common import normalize_text, escape_like
+from app.services.product_service import ProductService, normalized_name, name_contains, _product_list_adapter
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class SearchService:
+    @staticmethod
+    def _prefix_tsquery(tokens: list[str]):
+        # "noi dat" -> 'noi:* & dat:*' để từ đang gõ dở vẫn khớp
+        return func.to_tsquery("simple", " & ".join(f"{t}:*" for t in tokens))
+
+    @staticmethod
+    def search(db: Session, q: str, limit: int = 20, category_id: int = None):
+        normalized = normalize_text(q)
+        tokens = _TOKEN_RE.findall(normalized)
+        if not tokens:
+            return []
+
+        tsquery = SearchService._prefix_tsquery(tokens)
+        rank = (
+            func.ts_rank_cd(Product.search_vector, tsquery)
+            + func.similarity(normalized_name(), normalized)
+        )
+
+        query = db.query(Product).filter(
+            or_(
+                Product.search_vector.op("@@")(tsquery),
+                name_contains(normalized),
+            )
+        )
+        if category_id:
+            query = query.filter(Product.category_id == category_id)
+
+        return query.options(*ProductService._load_options()) \
+            .order_by(rank.desc(), Product.id.desc()).limit(limit).all()
+
+    @staticmethod
+    def autocomplete(db: Session, q: str, limit: int = 10):
+        normalized = normalize_text(q)
+        if not normalized:
+            return []
+
+        # Prefix LIKE dùng btree text_pattern_ops index ix_products_name_prefix
+        return db.query(Product.id, Product.name) \
+            .filter(normalized_name().like(f"{escape_like(normalized)}%", escape="\\")) \
+            .order_by(func.length(Product.name), Product.name) \
+            .limit(limit).all()
+
+
+class AsyncSearchService:
+    @staticmethod
+    async def search_json(db: AsyncSession, q: str, limit: int = 20, category_id: int = None) -> bytes:
+        return await db.run_sync(lambda s: _product_list_adapter.dump_json(_product_list_adapter.validate_python(
+            SearchService.search(s, q, limit=limit, category_id=category_id),
+            from_attributes=True
+        )))
+
+    @staticmethod
+    async def autocomplete(db: AsyncSession, q: str, limit: int = 10):
+        return await db.run_sync(lambda s: SearchService.autocomplete(s, q, limit=limit))
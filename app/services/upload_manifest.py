@@ -0,0 +1,124 @@
+import hashlib
+import json
+from fastapi import HTTPException
+from app.core.config import settings
+from app.core.redis import redis_client
+
+# S3 multipart: tối đa 10000 part, mọi part trừ part cuối phải >= 5MiB
+MAX_PARTS = 10000
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+SESSION_KEY = "upload:{upload_id}"
+PARTS_KEY = "upload:{upload_id}:parts"
+
+
+class UploadManifest:
+    """
+    Manifest của một phiên upload theo chunk, lưu trong Redis để mọi worker
+    đều thấy: thông tin phiên + mỗi chunk đã nhận (size, sha256, md5, etag).
+    Mỗi chunk là một field riêng trong hash nên upload song song/không theo
+    thứ tự là an toàn; gửi lại cùng chunk_index chỉ ghi đè field đó.
+    """
+
+    @staticmethod
+    def create(upload_id: str, info: dict):
+        key = SESSION_KEY.format(upload_id=upload_id)
+        pipe = redis_client.pipeline()
+        pipe.hset(key, mapping={k: str(v) for k, v in info.items() if v is not None})
+        pipe.expire(key, settings.UPLOAD_SESSION_TTL)
+        pipe.execute()
+
+    @staticmethod
+    def get(upload_id: str) -> dict:
+        raw = redis_client.hgetall(SESSION_KEY.format(upload_id=upload_id))
+        if not raw:
+            raise HTTPException(status_code=404, detail="Upload session not found")
+        session = {k.decode(): v.decode() for k, v in raw.items()}
+        if "total_chunks" in session:
+            session["total_chunks"] = int(session["total_chunks"])
+        return session
+
+    @staticmethod
+    def check_chunk_index(session: dict, chunk_index: int):
+        total = session.get("total_chunks")
+        if chunk_index < 0 or chunk_index >= MAX_PARTS or (total is not None and chunk_index >= total):
+            raise HTTPException(status_code=400, detail=f"Invalid chunk index {chunk_index}")
+
+    @staticmethod
+    def verify_chunk(data: bytes, checksum: str | None) -> dict:
+        """Tính checksum của chunk; so với sha256 client gửi (nếu có)."""
+        sha256 = hashlib.sha256(data).hexdigest()
+        if checksum and checksum.lower() != sha256:
+            raise HTTPException(status_code=400, detail="Chunk checksum mismatch")
+        return {"size": len(data), "sha256": sha256, "md5": hashlib.md5(data).hexdigest()}
+
+    @staticmethod
+    def record_part(upload_id: str, chunk_index: int, part: dict):
+        key = PARTS_KEY.format(upload_id=upload_id)
+        pipe = redis_client.pipeline()
+        pipe.hset(key, str(chunk_index), json.dumps(part))
+        pipe.expire(key, settings.UPLOAD_SESSION_TTL)
+        pipe.expire(SESSION_KEY.format(upload_id=upload_id), settings.UPLOAD_SESSION_TTL)
+        pipe.execute()
+
+    @staticmethod
+    def parts(upload_id: str) -> dict[int, dict]:
+        raw = redis_client.hgetall(PARTS_KEY.format(upload_id=upload_id))
+        return {int(k): json.loads(v) for k, v in raw.items()}
+
+    @staticmethod
+    def status(upload_id: str) -> dict:
+        session = UploadManifest.get(upload_id)
+        parts = UploadManifest.parts(upload_id)
+        total = session.get("total_chunks")
+        received = sorted(parts)
+        return {
+            "upload_id": upload_id,
+            "filename": session["filename"],
+            "total_chunks": total,
+            "received_chunks": received,
+            "missing_chunks": [i for i in range(total) if i not in parts] if total is not None else None,
+            "received_bytes": sum(p["size"] for p in parts.values()),
+            "chunks": {i: {"size": parts[i]["size"], "sha256": parts[i]["sha256"]} for i in received},
+        }
+
+    @staticmethod
+    def verify_complete(parts: dict[int, dict], total_chunks: int) -> list[dict]:
+        """Kiểm tra đủ chunk và kích thước hợp lệ trước khi CompleteMultipartUpload."""
+        missing = [i for i in range(total_chunks) if i not in parts]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Missing chunks {missing[:50]}")
+        extra = [i for i in parts if i >= total_chunks]
+        if extra:
+            raise HTTPException(status_code=400, detail=f"Unexpected chunks {extra[:50]}")
+
+        ordered = [parts[i] for i in range(total_chunks)]
+        for i, part in enumerate(ordered[:-1]):
+            if part["size"] < MIN_PART_SIZE:
+                raise HTTPException(status_code=400, detail=f"Chunk {i} is smaller than 5MB")
+        return ordered
+
+    @staticmethod
+    def expected_etag(ordered_parts: list[dict]) -> str:
+        """ETag S3 của object multipart: md5(nối các md5 nhị phân) + "-N"."""
+        digest = hashlib.md5(b"".join(bytes.fromhex(p["md5"]) for p in ordered_parts)).hexdigest()
+        return f"{digest}-{len(ordered_parts)}"
+
+    @staticmethod
+    def content_hash(ordered_parts: list[dict]) -> str:
+        """
+        Digest nội dung dựng từ sha256 của các chunk đã tính khi upload, không
+        cần đọc lại object. Một chunk: đúng sha256 của file; nhiều chunk:
+        sha256(nối các sha256 nhị phân) + "-N" (cùng kích thước chunk => cùng digest).
+        """
+        if len(ordered_parts) == 1:
+            return ordered_parts[0]["sha256"]
+        digest = hashlib.sha256(b"".join(bytes.fromhex(p["sha256"]) for p in ordered_parts)).hexdigest()
+        return f"{digest}-{len(ordered_parts)}"
+
+    @staticmethod
+    def drop(upload_id: str):
+        redis_client.delete(
+            SESSION_KEY.format(upload_id=upload_id),
+            PARTS_KEY.format(upload_id=upload_id),
+        )
@@ -1,11 +1,19 @@
 from app.api import router 
+from app.db.session import async_engine
+from app.db import instrumentation
+from app.services.derivative_service import DerivativeService
+from app.services.minio import ensure_bucket
+from app.services.cache_service import CacheService
+from app.core.responses import ORJSONResponse
+import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 import os
 
-app = FastAPI()
+# orjson cho các route trả dict; route đọc sản phẩm/danh mục trả bytes dựng sẵn
+app = FastAPI(default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,6 +23,31 @@ app.add_middleware(
     allow_headers=["*"],          
 )
 
+app.add_middleware(instrumentation.RequestQueryMiddleware)
+
+@app.on_event("startup")
+def init_storage():
+    # Kiểm tra bucket một lần khi khởi động; nếu MinIO chưa sẵn sàng thì
+    # ensure_bucket sẽ thử lại ở thao tác đầu tiên
+    try:
+        ensure_bucket()
+    except Exception as e:
+        logging.getLogger(__name__).warning("MinIO bucket check failed at startup: %s", e)
+
+@app.on_event("startup")
+def listen_cache_events():
+    # Nhận invalidate từ worker khác cho cache trong RAM (snapshot danh mục)
+    CacheService.start_listener()
+
+@app.on_event("startup")
+def resume_derivative_jobs():
+    DerivativeService.resume_pending()
+
+@app.on_event("shutdown")
+async def dispose_engines():
+    DerivativeService.shutdown()
+    await async_engine.dispose()
+
 @app.get("/", include_in_schema=False)
 async def read_index():
     return FileResponse("index.html")
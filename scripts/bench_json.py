@@ -0,0 +1,84 @@
+"""
+So sánh thời gian serialize một trang 100 sản phẩm (schema Product):
+  - response_model: validate ORM -> schema trong service, FastAPI validate lại
+    rồi encode (dump_json ở FastAPI mới, json.dumps ở bản cũ)
+  - single: validate một lần + dump_json (ORJSONResponse gửi nguyên bytes)
+  - cached: bytes lấy từ cache, không serialize
+Chạy: python scripts/bench_json.py [số sản phẩm] [số lần lặp]
+"""
+import json
+import os
+import sys
+import timeit
+from types import SimpleNamespace
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydantic import TypeAdapter  # noqa: E402
+from app.core.responses import ORJSONResponse  # noqa: E402
+from app.schemas.product import Product  # noqa: E402
+
+adapter = TypeAdapter(List[Product])
+
+
+def _file(i):
+    return SimpleNamespace(
+        id=f"file-{i}", file_name=f"image-{i}.jpg", file_url=f"/api/files/file-{i}", mime_type="image/jpeg",
+        derivative_status="ready", width=1600, height=1200, widths=[320, 640, 1280], direct_url=None,
+    )
+
+
+def _product(i):
+    category = SimpleNamespace(id=i % 10, name=f"Danh mục {i % 10}", slug=f"danh-muc-{i % 10}",
+                               description="Mô tả danh mục", thumbnail_id=f"file-c{i}", thumbnail=_file(f"c{i}"))
+    variants = [
+        SimpleNamespace(
+            id=i * 10 + v, price=125000.0 + v, stock=10 + v, image=_file(f"v{i}-{v}"),
+            attributes=[SimpleNamespace(id=i * 100 + v * 10 + a, name=f"attr{a}", value=float(a), unit="cm")
+                        for a in range(3)],
+        )
+        for v in range(4)
+    ]
+    media = [SimpleNamespace(id=i * 10 + m, file_id=f"file-m{i}-{m}", media_type="image", position=m,
+                             file=_file(f"m{i}-{m}")) for m in range(3)]
+    return SimpleNamespace(
+        id=i, name=f"Sản phẩm {i}", description="Mô tả sản phẩm " * 10, category_id=category.id,
+        thumbnail_id=f"file-t{i}", category=category, thumbnail=_file(f"t{i}"), media=media, variants=variants,
+    )
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    loops = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    rows = [_product(i) for i in range(count)]
+    cached = adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+
+    def response_model_dump_json():
+        models = adapter.validate_python(rows, from_attributes=True)
+        return adapter.dump_json(adapter.validate_python(models, from_attributes=True))
+
+    def response_model_json_dumps():
+        models = adapter.validate_python(rows, from_attributes=True)
+        data = adapter.dump_python(adapter.validate_python(models, from_attributes=True), mode="json")
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+
+    def single():
+        return ORJSONResponse(adapter.dump_json(adapter.validate_python(rows, from_attributes=True))).body
+
+    def from_cache():
+        return ORJSONResponse(cached).body
+
+    print(f"{count} sản phẩm, {len(cached)} bytes, {loops} lần")
+    for name, fn in [
+        ("response_model + json.dumps", response_model_json_dumps),
+        ("response_model + dump_json", response_model_dump_json),
+        ("single validation", single),
+        ("cached bytes", from_cache),
+    ]:
+        seconds = min(timeit.repeat(fn, number=loops, repeat=3)) / loops
+        print(f"{name:30s} {seconds * 1000:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
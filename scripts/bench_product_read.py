@@ -0,0 +1,208 @@
+"""
+So sánh trang danh sách sản phẩm (get_all / get_all_cursor) trên ~50k sản phẩm, mỗi sản phẩm
+có thumbnail, media và variant (mỗi variant 3 attribute, có ảnh):
+  - old: joinedload toàn bộ đồ thị (thumbnail, media.file, variants.attributes, variants.image,
+    category) trong một câu lệnh; LIMIT phải bọc subquery và kết quả là tích descartes
+  - new: ProductService._load_options (selectinload: một câu "WHERE fk IN (...)" cho mỗi quan hệ)
+Mỗi trang đo cả câu truy vấn và dựng schema Product, session mới cho mỗi trang. Báo cáo số
+dòng trả về qua dây (tổng rowcount của các câu SELECT), số câu lệnh và p50/p95 độ trễ.
+Chế độ offset đọc --pages trang đầu (skip tăng dần); chế độ cursor đi nối tiếp theo next_cursor.
+Dữ liệu seed mang tiền tố "bench-read" và được giữ lại giữa các lần chạy (seed lâu);
+--cleanup để xóa. Cần database đã migrate (DATABASE_URL).
+Chạy: python scripts/bench_product_read.py [--products 50000] [--pages 30] [--limit 50] [--cleanup]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, text  # noqa: E402
+from sqlalchemy.orm import joinedload  # noqa: E402
+from app.db.session import SessionLocal, engine  # noqa: E402
+from app.models.product import Product, ProductMedia, ProductVariant  # noqa: E402
+from app.services.common import paginate_cursor_by_id  # noqa: E402
+from app.services.product_service import ProductService, _to_schema  # noqa: E402
+
+PREFIX = "bench-read"
+FILES = 200
+CATEGORIES = 20
+MEDIA = 3
+VARIANTS = 4
+ATTRIBUTES = 3
+
+
+def _old_options():
+    return (
+        joinedload(Product.thumbnail),
+        joinedload(Product.media).joinedload(ProductMedia.file),
+        joinedload(Product.variants).joinedload(ProductVariant.attributes),
+        joinedload(Product.variants).joinedload(ProductVariant.image),
+        joinedload(Product.category),
+    )
+
+
+def old_get_all(db, skip: int, limit: int):
+    return ProductService._filtered_query(db).options(*_old_options()) \
+        .order_by(Product.id.desc()).offset(skip).limit(limit).all()
+
+
+def old_get_all_cursor(db, limit: int, cursor: str = None):
+    return paginate_cursor_by_id(ProductService._filtered_query(db).options(*_old_options()), Product,
+                                 limit=limit, cursor=cursor)
+
+
+def _seed(db, products: int):
+    seeded = db.execute(
+        text("SELECT count(*) FROM products WHERE name LIKE :p"), {"p": f"{PREFIX} %"}
+    ).scalar()
+    if seeded >= products:
+        return False
+    _cleanup(db)
+    params = {"p": PREFIX, "files": FILES, "categories": CATEGORIES, "products": products}
+    db.execute(text(
+        "INSERT INTO stored_objects (file_path, etag, derivative_status, width, height, ref_count) "
+        "SELECT :p || '/' || g || '.jpg', md5(g::text), 'ready', 800, 800, 1 "
+        "FROM generate_series(1, :files) g"
+    ), params)
+    db.execute(text(
+        "INSERT INTO files (id, file_name, object_id, file_url, file_size, mime_type, file_type) "
+        "SELECT :p || '-file-' || g, g || '.jpg', s.id, '/api/files/' || :p || '-file-' || g, "
+        "120000, 'image/jpeg', 'product' "
+        "FROM generate_series(1, :files) g JOIN stored_objects s ON s.file_path = :p || '/' || g || '.jpg'"
+    ), params)
+    db.execute(text(
+        "INSERT INTO categories (name, slug, description, thumbnail_id) "
+        "SELECT 'Bench read ' || g, :p || '-c' || g, 'Danh mục benchmark', :p || '-file-' || g "
+        "FROM generate_series(1, :categories) g"
+    ), params)
+    db.execute(text(
+        "INSERT INTO products (name, description, category_id, thumbnail_id) "
+        "SELECT :p || ' ' || g, 'Sản phẩm dùng cho benchmark đọc', c.id, :p || '-file-' || (g % :files + 1) "
+        "FROM generate_series(1, :products) g "
+        "JOIN categories c ON c.slug = :p || '-c' || (g % :categories + 1)"
+    ), params)
+    db.execute(text(
+        "INSERT INTO product_media (product_id, file_id, media_type, position) "
+        "SELECT p.id, :p || '-file-' || ((p.id * 7 + m) % :files + 1), 'image', m "
+        "FROM products p CROSS JOIN generate_series(0, :media - 1) m WHERE p.name LIKE :p || ' %'"
+    ), {**params, "media": MEDIA})
+    db.execute(text(
+        "INSERT INTO product_variants (product_id, price, stock, image_id) "
+        "SELECT p.id, 100000 + v * 1000, 10 + v, :p || '-file-' || ((p.id * 11 + v) % :files + 1) "
+        "FROM products p CROSS JOIN generate_series(0, :variants - 1) v WHERE p.name LIKE :p || ' %'"
+    ), {**params, "variants": VARIANTS})
+    db.execute(text(
+        "INSERT INTO variant_attributes (variant_id, name, value, unit) "
+        "SELECT v.id, 'attr' || a, a, 'cm' "
+        "FROM product_variants v JOIN products p ON p.id = v.product_id "
+        "CROSS JOIN generate_series(0, :attributes - 1) a WHERE p.name LIKE :p || ' %'"
+    ), {**params, "attributes": ATTRIBUTES})
+    db.commit()
+    db.execute(text("ANALYZE"))
+    return True
+
+
+def _cleanup(db):
+    # media, variant, attribute, summary đi theo ON DELETE CASCADE
+    db.execute(text("DELETE FROM products WHERE name LIKE :p"), {"p": f"{PREFIX} %"})
+    db.execute(text("DELETE FROM categories WHERE slug LIKE :p"), {"p": f"{PREFIX}-c%"})
+    db.execute(text("DELETE FROM files WHERE id LIKE :p"), {"p": f"{PREFIX}-file-%"})
+    db.execute(text("DELETE FROM stored_objects WHERE file_path LIKE :p"), {"p": f"{PREFIX}/%"})
+    db.commit()
+
+
+class _Counter:
+    def __init__(self):
+        self.statements = 0
+        self.rows = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements += 1
+        if cursor.description is not None:
+            self.rows += max(cursor.rowcount, 0)
+
+
+def _measure(counter: _Counter, fn):
+    db = SessionLocal()
+    try:
+        counter.statements = counter.rows = 0
+        start = time.perf_counter()
+        result = fn(db)
+        return result, (time.perf_counter() - start) * 1000, counter.statements, counter.rows
+    finally:
+        db.close()
+
+
+def _offset_pages(counter, get_all, pages: int, limit: int):
+    for page in range(pages):
+        items, ms, statements, rows = _measure(
+            counter, lambda db: [_to_schema(p) for p in get_all(db, page * limit, limit)]
+        )
+        assert len(items) == limit
+        yield ms, statements, rows
+
+
+def _cursor_pages(counter, get_all_cursor, pages: int, limit: int):
+    cursor = None
+    for _ in range(pages):
+        def _page(db):
+            result = get_all_cursor(db, limit, cursor)
+            return [_to_schema(p) for p in result["items"]], result["next_cursor"]
+
+        (items, cursor), ms, statements, rows = _measure(counter, _page)
+        assert len(items) == limit
+        yield ms, statements, rows
+
+
+def _quantile(values, q: int):
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=50000)
+    parser.add_argument("--pages", type=int, default=30)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--cleanup", action="store_true")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.cleanup:
+            _cleanup(db)
+            return
+        start = time.perf_counter()
+        if _seed(db, args.products):
+            print(f"seed {args.products} sản phẩm: {time.perf_counter() - start:.1f}s")
+    finally:
+        db.close()
+
+    paths = {
+        "old": (old_get_all, old_get_all_cursor),
+        "new": (lambda db, skip, limit: ProductService.get_all(db, skip=skip, limit=limit),
+                lambda db, limit, cursor: ProductService.get_all_cursor(db, limit=limit, cursor=cursor)),
+    }
+    counter = _Counter()
+    event.listen(engine, "after_cursor_execute", counter)
+    print(f"products={args.products} pages={args.pages} limit={args.limit}  "
+          f"(dòng trả về / câu lệnh mỗi trang, ms)")
+    print(f"{'mode':>6} {'path':>4} {'rows/page':>10} {'stmts':>6} {'p50 ms':>8} {'p95 ms':>8}")
+    try:
+        for mode, walk in (("offset", _offset_pages), ("cursor", _cursor_pages)):
+            for name, fns in paths.items():
+                fn = fns[0] if mode == "offset" else fns[1]
+                # Trang khởi động: nạp cache kế hoạch / shared buffers cho cả hai cách như nhau
+                list(walk(counter, fn, 2, args.limit))
+                samples = list(walk(counter, fn, args.pages, args.limit))
+                ms = [s[0] for s in samples]
+                print(f"{mode:>6} {name:>4} {statistics.mean(s[2] for s in samples):>10.0f} "
+                      f"{samples[-1][1]:>6} {_quantile(ms, 50):>8.2f} {_quantile(ms, 95):>8.2f}")
+    finally:
+        event.remove(engine, "after_cursor_execute", counter)
+
+
+if __name__ == "__main__":
+    main()
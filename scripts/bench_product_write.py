@@ -0,0 +1,170 @@
+"""
+So sánh độ trễ ghi một sản phẩm (create / update) theo số variant, mỗi variant 3 attribute:
+  - old: ORM add + flush từng variant (create), xóa rồi tạo lại mọi variant (update)
+  - new: ProductService.create (INSERT ... RETURNING theo lô) và ProductService.update
+    (chỉ ghi variant/attribute thay đổi; payload update đổi giá một variant)
+Cả hai đều tính cả commit, refresh product_summaries và dựng schema Product trả về; không
+tính invalidate cache (giống nhau ở hai cách). Cần database đã migrate (DATABASE_URL);
+sản phẩm tạo ra được xóa khi kết thúc.
+--rtt-ms: cộng thêm độ trễ mạng giả lập cho mỗi câu lệnh (DB local gần như không có RTT).
+Chạy: python scripts/bench_product_write.py [--repeat 20] [--rtt-ms 0] [--variants 1,10,30,100]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, event  # noqa: E402
+from app.db.session import SessionLocal, engine  # noqa: E402
+from app.models.product import Product, ProductVariant, VariantAttribute, ProductMedia  # noqa: E402
+from app.schemas.product import ProductCreate, ProductUpdate  # noqa: E402
+from app.services.product_service import ProductService, _to_schema  # noqa: E402
+from app.services.product_summary_service import ProductSummaryService  # noqa: E402
+
+
+def old_create(db, product_in: ProductCreate):
+    db_product = Product(
+        name=product_in.name,
+        description=product_in.description,
+        category_id=product_in.category_id,
+        thumbnail_id=product_in.thumbnail_id
+    )
+    db.add(db_product)
+    db.flush()
+    for idx, file_id in enumerate(product_in.media_ids):
+        db.add(ProductMedia(product_id=db_product.id, file_id=file_id, position=idx))
+    for v_in in product_in.variants:
+        db_variant = ProductVariant(
+            product_id=db_product.id, price=v_in.price, stock=v_in.stock, image_id=v_in.image_id
+        )
+        db.add(db_variant)
+        db.flush()
+        for a_in in v_in.attributes:
+            db.add(VariantAttribute(variant_id=db_variant.id, name=a_in.name, value=a_in.value, unit=a_in.unit))
+    db.flush()
+    ProductSummaryService.refresh(db, [db_product.id])
+    db.commit()
+    db.refresh(db_product)
+    return db_product
+
+
+def old_update(db, product_id: int, product_in: ProductUpdate):
+    db_product = ProductService.get_by_id(db, product_id)
+    update_data = product_in.model_dump(exclude_unset=True)
+    if "variants" in update_data:
+        variants_data = update_data.pop("variants")
+        db.query(ProductVariant).filter(ProductVariant.product_id == product_id).delete()
+        for v_in in variants_data:
+            db_variant = ProductVariant(
+                product_id=product_id, price=v_in["price"], stock=v_in["stock"], image_id=v_in.get("image_id")
+            )
+            db.add(db_variant)
+            db.flush()
+            for a_in in v_in.get("attributes", []):
+                db.add(VariantAttribute(variant_id=db_variant.id, name=a_in["name"], value=a_in["value"],
+                                        unit=a_in["unit"]))
+    for field, value in update_data.items():
+        setattr(db_product, field, value)
+    db.flush()
+    ProductSummaryService.refresh(db, [product_id])
+    db.commit()
+    db.refresh(db_product)
+    return db_product
+
+
+def _payload(variant_count: int) -> ProductCreate:
+    return ProductCreate(
+        name=f"Bench {variant_count} variants",
+        description="Sản phẩm dùng cho benchmark ghi",
+        variants=[
+            {"price": 100000 + v, "stock": v, "attributes": [
+                {"name": f"attr{a}", "value": float(a), "unit": "cm"} for a in range(3)
+            ]}
+            for v in range(variant_count)
+        ],
+    )
+
+
+def _edit(product, step: int) -> ProductUpdate:
+    """Payload của form sửa: gửi lại mọi variant (kèm id), chỉ đổi giá variant đầu."""
+    variants = [
+        {"id": v.id, "price": v.price + (step if i == 0 else 0), "stock": v.stock,
+         "image_id": v.image.id if v.image else None,
+         "attributes": [{"name": a.name, "value": a.value, "unit": a.unit} for a in v.attributes]}
+        for i, v in enumerate(product.variants)
+    ]
+    return ProductUpdate(variants=variants)
+
+
+class _Counter:
+    def __init__(self, rtt: float):
+        self.count = 0
+        self.rtt = rtt
+
+    def __call__(self, *args):
+        self.count += 1
+        if self.rtt:
+            time.sleep(self.rtt)
+
+
+def _measure(counter: _Counter, fn):
+    db = SessionLocal()
+    try:
+        counter.count = 0
+        start = time.perf_counter()
+        result = fn(db)
+        return result, (time.perf_counter() - start) * 1000, counter.count
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--rtt-ms", type=float, default=0)
+    parser.add_argument("--variants", default="1,10,30,100")
+    args = parser.parse_args()
+
+    # Không cần Redis cho benchmark: bỏ invalidate cache ở cả hai cách
+    ProductService._invalidate = staticmethod(lambda *a, **k: None)
+    counter = _Counter(args.rtt_ms / 1000)
+    event.listen(engine, "before_cursor_execute", counter)
+
+    paths = {
+        "old": (lambda db, p: _to_schema(old_create(db, p)), lambda db, pid, u: _to_schema(old_update(db, pid, u))),
+        "new": (lambda db, p: _to_schema(ProductService.create(db, p)),
+                lambda db, pid, u: _to_schema(ProductService.update(db, pid, u))),
+    }
+    created = []
+    print(f"repeat={args.repeat} rtt={args.rtt_ms}ms  (median ms / số câu lệnh SQL)")
+    print(f"{'variants':>8} {'path':>4} {'create ms':>10} {'stmts':>6} {'update ms':>10} {'stmts':>6}")
+    try:
+        for variant_count in [int(n) for n in args.variants.split(",")]:
+            payload = _payload(variant_count)
+            for name, (create, update) in paths.items():
+                create_ms, update_ms = [], []
+                for step in range(args.repeat):
+                    product, ms, create_stmts = _measure(counter, lambda db: create(db, payload))
+                    created.append(product.id)
+                    create_ms.append(ms)
+                    edit = _edit(product, step + 1)
+                    _, ms, update_stmts = _measure(counter, lambda db: update(db, product.id, edit))
+                    update_ms.append(ms)
+                print(f"{variant_count:>8} {name:>4} {statistics.median(create_ms):>10.2f} {create_stmts:>6} "
+                      f"{statistics.median(update_ms):>10.2f} {update_stmts:>6}")
+    finally:
+        event.remove(engine, "before_cursor_execute", counter)
+        db = SessionLocal()
+        try:
+            # variant, attribute, media, summary đi theo ON DELETE CASCADE
+            db.execute(delete(Product).where(Product.id.in_(created)))
+            db.commit()
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    main()